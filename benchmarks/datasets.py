@@ -0,0 +1,104 @@
+"""Generate synthetic datasets for the benchmarks.
+
+Run from the repository root with
+`python -m benchmarks.datasets DIRECTORY [--rows N] [--columns N] [--formats csv,parquet,...]`.
+Every format holds the same rows: `id`, `category`, `value`, `created`, then extra
+`col_<n>` columns alternating between numbers and text.
+"""
+
+import argparse
+import duckdb
+import logging
+import os
+import sqlite3
+
+FORMATS = ("csv", "parquet", "json", "xlsx", "db")
+
+# Columns the canned benchmark queries use. Datasets need at least these
+BASE_COLUMNS = 4
+
+# Excel sheets hold at most this many rows
+XLSX_MAX_ROWS = 1_048_575
+
+
+def synthetic_sql(rows: int, columns: int) -> str:
+    """Return a DuckDB query producing `rows` repeatable rows with `columns` columns."""
+    expressions = [
+        "i AS id",
+        "'category_' || (hash(i) % 50) AS category",
+        "round((hash(i * 7) % 10000) / 100.0, 2) AS value",
+        "DATE '2020-01-01' + CAST(hash(i * 13) % 1500 AS INTEGER) AS created",
+    ]
+    for n in range(BASE_COLUMNS, max(columns, BASE_COLUMNS)):
+        if n % 2:
+            expressions.append(f"'text ' || (hash(i * {n}) % 1000) AS col_{n}")
+        else:
+            expressions.append(f"(hash(i * {n}) % 100000) / 10.0 AS col_{n}")
+    return f"SELECT {', '.join(expressions)} FROM range({int(rows)}) AS t(i)"
+
+
+def write_dataset(con: duckdb.DuckDBPyConnection, path: str, rows: int, columns: int):
+    """Write a synthetic dataset to `path`, in the format given by its extension."""
+    fmt = os.path.splitext(path)[1].lstrip(".").lower()
+    sql = synthetic_sql(rows, columns)
+    if fmt == "csv":
+        con.execute(f"COPY ({sql}) TO '{path}' (FORMAT csv, HEADER)")
+    elif fmt == "parquet":
+        con.execute(f"COPY ({sql}) TO '{path}' (FORMAT parquet)")
+    elif fmt == "json":
+        con.execute(f"COPY ({sql}) TO '{path}' (FORMAT json, ARRAY true)")
+    elif fmt == "xlsx":
+        if rows > XLSX_MAX_ROWS:
+            raise ValueError(f"Excel sheets hold at most {XLSX_MAX_ROWS:,} rows")
+        con.execute("INSTALL excel")
+        con.execute("LOAD excel")
+        con.execute(f"COPY ({sql}) TO '{path}' (FORMAT xlsx, HEADER true)")
+    elif fmt == "db":
+        # SQLite, written without DuckDB's sqlite extension so it needs no download
+        if os.path.exists(path):
+            os.remove(path)
+        result = con.execute(sql)
+        names = [column[0] for column in result.description]
+        with sqlite3.connect(path) as sqlite:
+            sqlite.execute(f"CREATE TABLE data ({', '.join(names)})")
+            while batch := result.fetchmany(10_000):
+                sqlite.executemany(f"INSERT INTO data VALUES ({', '.join('?' * len(names))})", batch)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def generate(directory: str, rows: int, columns: int, formats: list[str]) -> dict:
+    """Write one dataset per format under `directory` and return their paths by format.
+
+    Existing files are reused, so repeated runs at the same scale skip generation.
+    Formats that cannot be written here, e.g. without the DuckDB excel extension, are skipped.
+    """
+    os.makedirs(directory, exist_ok=True)
+    con = duckdb.connect(":memory:")
+    paths = {}
+    for fmt in formats:
+        path = os.path.abspath(os.path.join(directory, f"synthetic_{rows}x{columns}.{fmt}"))
+        if not os.path.exists(path):
+            try:
+                write_dataset(con, path, rows, columns)
+            except Exception as e:
+                logging.warning(f"Skipping {fmt} dataset: {e}")
+                continue
+        paths[fmt] = path
+    con.close()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    args = parser.parse_args()
+    for fmt, path in generate(args.directory, args.rows, args.columns, args.formats.split(",")).items():
+        print(f"{fmt:>8} {os.path.getsize(path):>14,} bytes  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""An OpenAI-compatible `/chat/completions` server that answers with canned SQL.
+
+Run from the repository root with `python -m benchmarks.fake_llm [--port 9999] [--latency 0.05]`,
+and point QueryBot at it with `OPENAI_API_BASE=http://127.0.0.1:9999`.
+
+Prompts that describe a dataset (`Note: Use <read function> in queries`) get one of
+QUERIES, picked by a hash of the question so the same question always gets the same
+SQL. Batched prompts from /query/batch get one answer per numbered question. Other
+prompts, e.g. /upload asking for suggested questions, get a list of questions.
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+
+# Canned SQL over the synthetic datasets in benchmarks.datasets. {source} is the read function
+QUERIES = {
+    "group": (
+        "SELECT category, COUNT(*) AS n, AVG(value) AS mean FROM {source} "
+        "GROUP BY category ORDER BY n DESC"
+    ),
+    "total": "SELECT COUNT(*) AS n, SUM(value) AS total FROM {source}",
+    "monthly": (
+        "SELECT date_trunc('month', created) AS month, SUM(value) AS total FROM {source} "
+        "GROUP BY month ORDER BY month"
+    ),
+    "filter": "SELECT * FROM {source} WHERE value > 99",
+}
+QUESTIONS = "What is the total value?\nHow many rows per category?\nHow does value change by month?"
+
+app = FastAPI()
+app.state.latency = 0.0
+
+
+def canned_sql(question: str, source: str) -> str:
+    names = sorted(QUERIES)
+    name = next((name for name in names if name in question), None)
+    if name is None:
+        name = names[int(hashlib.md5(question.encode()).hexdigest(), 16) % len(names)]
+    return QUERIES[name].format(source=source)
+
+
+def answer(prompt: str) -> str:
+    sources = re.findall(r"Note: Use (.*?) in queries", prompt)
+    if not sources:
+        return QUESTIONS
+    if re.search(r"for each of the following \d+ questions", prompt):
+        questions = re.findall(r"^(\d+)\. (.*)$", prompt, re.MULTILINE)
+        sections = [f"Question {n}\n```sql\n{canned_sql(q, sources[0])}\n```" for n, q in questions]
+        return "\n\n".join(sections)
+    # The question follows the dataset descriptions
+    question = prompt.rsplit("\n", 1)[-1]
+    sql = canned_sql(question, sources[0])
+    return f"The objective is to answer: {question}\n\n```sql\n{sql}\n```\n\nThis query answers it."
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    content = answer(prompt)
+    await asyncio.sleep(app.state.latency)
+    prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4}
+    if not body.get("stream"):
+        return {"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage}
+
+    async def events():
+        for start in range(0, len(content), 16):
+            delta = {"choices": [{"delta": {"content": content[start:start + 16]}}]}
+            yield f"data: {json.dumps(delta)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before each response")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
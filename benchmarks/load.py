@@ -0,0 +1,356 @@
+"""Drive /upload and /query with synthetic datasets and a fake LLM, and report latencies.
+
+Run from the repository root with `python -m benchmarks.load [options]`, e.g.
+
+    python -m benchmarks.load --rows 1000000 --formats csv,parquet --concurrency 16
+    python -m benchmarks.load --compare benchmarks/results/<older commit>.json
+
+By default QueryBot runs in this process, driven through its ASGI app with a fresh
+config directory, and calls the fake LLM in benchmarks.fake_llm over HTTP. Pass
+`--url` to drive a running server instead; it must use the fake LLM for stable results.
+
+Each phase sends `--requests` requests from `--concurrency` clients, each with its own
+session. The report has throughput, p50/p95/p99 latency, per-stage latencies from the
+Server-Timing header and peak RSS for every phase, and is saved as JSON. It starts with
+the cold start time: from launching a new Python process to QueryBot being ready to serve.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.datasets import generate
+from benchmarks.fake_llm import QUERIES
+
+PHASES = ("upload", "query", "query_cached", "query_stream", "query_batch")
+
+# Questions in each /query/batch request of the query_batch phase
+BATCH_QUESTIONS = 10
+
+# Run in a new process to time a cold start. Prints the time the app was ready to serve
+COLD_START = """
+import asyncio, time
+from querybot.app import app
+
+async def main():
+    async with app.router.lifespan_context(app):
+        print(time.time())
+
+asyncio.run(main())
+"""
+
+
+def rss_bytes() -> int:
+    """Return the current resident set size, or the peak so far where it is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    """Sample RSS on a thread while the block runs, so DuckDB work on other threads is seen."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self.done = threading.Event()
+
+    def sample(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            if self.done.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+
+
+def percentile(values: list, p: float) -> float | None:
+    """Return the nearest-rank `p`th percentile of `values`."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def server_timing(header: str | None) -> dict:
+    """Parse `stage;dur=12.3, ...` into seconds by stage."""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and params.startswith("dur="):
+            stages[name] = float(params[4:]) / 1000
+    return stages
+
+
+async def run_phase(client, requests: list, concurrency: int, measure_rss: bool) -> dict:
+    """Send `requests` (method, path, JSON body) from `concurrency` sessions and summarize them."""
+    latencies, stages, errors = [], {}, []
+    queue = list(reversed(requests))
+
+    async def worker(session: int):
+        headers = {"X-Session-ID": f"benchmark-{session}"}
+        while queue:
+            method, path, body = queue.pop()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                content = response.content
+                elapsed = time.perf_counter() - start
+                # Batches report errors per question, anywhere in the response
+                head = content if path == "/query/batch" else content[:2000]
+                failed = response.status_code != 200 or b'"error"' in head
+                if path == "/query/stream":
+                    failed = failed or b'"type":"error"' in content
+            except Exception as e:
+                elapsed, failed, content = time.perf_counter() - start, True, str(e).encode()
+            if failed:
+                errors.append(content[:500].decode(errors="replace"))
+                continue
+            latencies.append(elapsed)
+            for stage, seconds in server_timing(response.headers.get("server-timing")).items():
+                stages.setdefault(stage, []).append(seconds)
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for session in range(concurrency)))
+        wall = time.perf_counter() - start
+    return {
+        "requests": len(requests),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "seconds": wall,
+        "throughput": len(latencies) / wall if wall else None,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+        "peak_rss_mb": rss.peak / 1e6 if measure_rss else None,
+    }
+
+
+def phase_requests(phase: str, paths: dict, count: int) -> list:
+    """Return `count` requests for a phase, cycling through the datasets and canned queries."""
+    files, names = list(paths.values()), sorted(QUERIES)
+    requests = []
+    for i in range(count):
+        file_path = files[i % len(files)]
+        if phase == "upload":
+            requests.append(("POST", "/upload", {"file_paths": [file_path]}))
+            continue
+        if phase == "query_batch":
+            # Each batch asks unique questions, so every query runs
+            questions = [
+                f"Batch {i} question {j}: {names[j % len(names)]}" for j in range(BATCH_QUESTIONS)
+            ]
+            body = {"file_path": file_path, "queries": questions, "use_cache": False}
+            requests.append(("POST", "/query/batch", body))
+            continue
+        # Cold queries are unique and skip the caches. Cached queries ask one question per
+        # file, so every request after the first for each file hits the caches
+        question = f"Benchmark question {i}: {names[i % len(names)]}"
+        if phase == "query_cached":
+            question = f"Benchmark question: {names[i % len(files) % len(names)]}"
+        body = {
+            "dataset_name": os.path.basename(file_path),
+            "query": question,
+            "file_path": file_path,
+            "use_cache": phase == "query_cached",
+        }
+        requests.append(("POST", "/query/stream" if phase == "query_stream" else "/query", body))
+    return requests
+
+
+def cold_start(runs: int = 3) -> dict:
+    """Return the median and worst seconds from launching Python to QueryBot being ready."""
+    env = {**os.environ, "XDG_CONFIG_HOME": tempfile.mkdtemp(prefix="querybot-benchmark-")}
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    seconds = []
+    for _ in range(runs):
+        start = time.time()
+        result = subprocess.run([sys.executable, "-c", COLD_START], capture_output=True, text=True, env=env)
+        if result.returncode:
+            raise RuntimeError(f"QueryBot did not start: {result.stderr[-500:]}")
+        seconds.append(float(result.stdout.split()[-1]) - start)
+    return {"median": sorted(seconds)[len(seconds) // 2], "max": max(seconds)}
+
+
+def start_fake_llm(port: int, latency: float):
+    import uvicorn
+    from benchmarks.fake_llm import app
+
+    app.state.latency = latency
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def benchmark(args, paths: dict) -> dict:
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        lifespan = None
+    else:
+        # Cache and spill files go to a fresh config directory, so runs start cold
+        os.environ["XDG_CONFIG_HOME"] = tempfile.mkdtemp(prefix="querybot-benchmark-")
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{args.llm_port}"
+        started = time.perf_counter()
+        with PeakRSS() as import_rss:
+            from querybot.app import app
+        import_seconds = time.perf_counter() - started
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://querybot", timeout=args.timeout
+        )
+        lifespan = app.router.lifespan_context(app)
+
+    report = {"phases": {}}
+    if lifespan is not None:
+        report["startup"] = {"seconds": import_seconds, "peak_rss_mb": import_rss.peak / 1e6}
+        await lifespan.__aenter__()
+    try:
+        async with client:
+            for phase in args.phases.split(","):
+                requests = phase_requests(phase, paths, args.requests)
+                result = await run_phase(client, requests, args.concurrency, args.url is None)
+                report["phases"][phase] = result
+                print_phase(phase, result)
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+    return report
+
+
+def print_phase(phase: str, result: dict):
+    def ms(value):
+        return f"{value * 1000:9.1f}" if value is not None else f"{'-':>9}"
+
+    latency = result["latency"]
+    rss = f"{result['peak_rss_mb']:8.0f}" if result["peak_rss_mb"] is not None else f"{'-':>8}"
+    throughput = result["throughput"] or 0
+    print(
+        f"{phase:<14} {result['requests']:>5} {result['errors']:>5} {throughput:>8.1f} "
+        f"{ms(latency['p50'])} {ms(latency['p95'])} {ms(latency['p99'])} {rss}"
+    )
+    for stage, summary in result["stages"].items():
+        print(f"  {stage:<26} {'':>8} {ms(summary['p50'])} {ms(summary['p95'])} {ms(summary['p99'])}")
+    for error in result["error_samples"]:
+        print(f"  error: {error[:200]}")
+
+
+def compare(baseline: dict, report: dict):
+    """Print how p50 and p95 latency and throughput changed from `baseline` to `report`."""
+    print(f"\nChange from {baseline.get('commit', 'baseline')} to {report.get('commit', 'this run')}:")
+    settings = ("rows", "columns", "formats", "requests", "concurrency", "llm_latency", "url")
+    differ = [key for key in settings if baseline.get("config", {}).get(key) != report["config"].get(key)]
+    if differ:
+        print(f"Warning: runs used different {', '.join(differ)}")
+    print(f"{'phase':<26} {'p50':>8} {'p95':>8} {'req/s':>8}")
+    before = baseline.get("startup", {}).get("cold_seconds")
+    after = report.get("startup", {}).get("cold_seconds")
+    if before and after:
+        print(f"{'cold start':<26} {(after['median'] / before['median'] - 1) * 100:+7.1f}%")
+    for phase, result in report["phases"].items():
+        before = baseline.get("phases", {}).get(phase)
+        if not before:
+            continue
+        rows = [(phase, result, before)]
+        rows += [
+            (f"  {stage}", {"latency": summary}, {"latency": before.get("stages", {}).get(stage)})
+            for stage, summary in result["stages"].items()
+            if before.get("stages", {}).get(stage)
+        ]
+        for name, now, then in rows:
+            changes = []
+            for key in ("p50", "p95"):
+                old, new = then["latency"][key], now["latency"][key]
+                changes.append(f"{(new / old - 1) * 100:+7.1f}%" if old and new is not None else f"{'-':>8}")
+            old, new = then.get("throughput"), now.get("throughput")
+            changes.append(f"{(new / old - 1) * 100:+7.1f}%" if old and new is not None else f"{'-':>8}")
+            print(f"{name:<26} {' '.join(changes)}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows in each synthetic dataset")
+    parser.add_argument("--columns", type=int, default=10, help="Columns in each synthetic dataset")
+    parser.add_argument("--formats", default="csv,parquet,json", help="Any of csv,parquet,json,xlsx,db")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "querybot-benchmark-data"))
+    parser.add_argument("--phases", default=",".join(PHASES), help=f"Any of {','.join(PHASES)}")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per phase")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients sending requests at once")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds before a request fails")
+    parser.add_argument("--llm-port", type=int, default=9999)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the fake LLM waits")
+    parser.add_argument("--url", help="Benchmark a running server instead, e.g. http://localhost:8001")
+    parser.add_argument("--output", help="JSON report path. Default: benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="Earlier JSON report to compare with")
+    args = parser.parse_args()
+
+    paths = generate(args.data_dir, args.rows, args.columns, args.formats.split(","))
+    if not paths:
+        parser.error("No datasets could be generated")
+    startup = None
+    if not args.url:
+        startup = cold_start()
+        print(f"Cold start: {startup['median'] * 1000:.0f} ms median, {startup['max'] * 1000:.0f} ms max\n")
+        start_fake_llm(args.llm_port, args.llm_latency)
+
+    print(f"{'phase':<14} {'reqs':>5} {'errs':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "datasets": {fmt: {"path": path, "bytes": os.path.getsize(path)} for fmt, path in paths.items()},
+        **asyncio.run(benchmark(args, paths)),
+    }
+    if startup:
+        report["startup"]["cold_seconds"] = startup
+    output = args.output or os.path.join("benchmarks", "results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Compare column quoting of generated SQL on wide schemas.
+
+Run from the repository root with `python -m benchmarks.quote_columns [columns ...]`.
+The baseline is the previous implementation, which ran one regex substitution per
+column over the whole query.
+"""
+
+import re
+import sys
+import timeit
+from querybot.sql import column_trie, quote_column_name, quote_columns
+
+
+def regex_per_column(sql_query: str, schema_info: list) -> str:
+    column_mapping = {col[0]: quote_column_name(col[0]) for col in schema_info}
+    for original in sorted(column_mapping, key=len, reverse=True):
+        pattern = r'(?<!")\b' + re.escape(original) + r'\b(?!")'
+        sql_query = re.sub(pattern, column_mapping[original], sql_query)
+    return sql_query
+
+
+def main(widths: list[int]):
+    print(f"{'columns':>8} {'regex (ms)':>12} {'trie (ms)':>12} {'speedup':>8}")
+    for width in widths:
+        schema_info = [(f"Metric {i}" if i % 3 == 0 else f"metric_{i}", "DOUBLE") for i in range(width)]
+        picked = [name for name, _ in schema_info[:: max(1, width // 20)]]
+        sql_query = (
+            f"SELECT {', '.join(picked)}, SUM(Metric 0) AS total FROM read_csv_auto('data.csv') "
+            f"WHERE {picked[-1]} > 0 AND label = 'Metric 3' GROUP BY {', '.join(picked)} ORDER BY total DESC"
+        )
+        columns = tuple(name for name, _ in schema_info)
+        column_trie(columns)  # Built once per schema and cached, as when datasets are registered
+        runs = 20
+        baseline = timeit.timeit(lambda: regex_per_column(sql_query, schema_info), number=runs) / runs
+        trie = timeit.timeit(lambda: quote_columns(sql_query, [column_trie(columns)]), number=runs) / runs
+        print(f"{width:>8} {baseline * 1000:>12.2f} {trie * 1000:>12.3f} {baseline / trie:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
@@ -0,0 +1,103 @@
+from contextlib import asynccontextmanager
+import asyncio
+import duckdb
+import json
+import math
+import os
+import re
+from querybot.db import DB_QUEUE, DB_WORKERS, PoolBusy
+
+# Limits on running the SQL generated by the LLM
+QUERY_TIMEOUT = float(os.getenv("QUERYBOT_QUERY_TIMEOUT", 120)) or None
+QUERY_CONCURRENCY = int(os.getenv("QUERYBOT_QUERY_CONCURRENCY", DB_WORKERS))
+QUERY_QUEUE = int(os.getenv("QUERYBOT_QUERY_QUEUE", DB_QUEUE))
+
+# EXPLAIN generated SQL before running it: "warn" or "reject" runaway plans, or "off"
+QUERY_PREFLIGHT = os.getenv("QUERYBOT_QUERY_PREFLIGHT", "warn").lower()
+QUERY_MAX_ESTIMATED_ROWS = float(os.getenv("QUERYBOT_QUERY_MAX_ESTIMATED_ROWS", 1e9))
+
+# Operators that pair every row of one input with every row of another
+CROSS_JOINS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN"}
+
+
+class QueryRejected(Exception):
+    """Raised when the pre-flight check rejects a query plan."""
+
+
+class QueryLimiter:
+    """Limit how many generated queries run at once across all workspaces.
+
+    Up to `queue` more wait for a slot; beyond that, `slot()` raises PoolBusy.
+    """
+
+    def __init__(self, concurrency: int = QUERY_CONCURRENCY, queue: int = QUERY_QUEUE):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue = queue
+        self.waiting = 0
+        self.running = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore.locked():
+            if self.waiting >= self.queue:
+                raise PoolBusy(f"{self.waiting} queries already waiting")
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+
+def plan_estimates(node: dict, estimates: list, cross_joins: list) -> float:
+    """Return the estimated rows out of a JSON plan node, collecting every node's estimate."""
+    children = [plan_estimates(child, estimates, cross_joins) for child in node.get("children", [])]
+    match = re.search(r"\d+", str(node.get("extra_info", {}).get("Estimated Cardinality", "")))
+    if match:
+        rows = float(match.group())
+    elif node.get("name") in CROSS_JOINS:
+        rows = math.prod(children)
+    else:
+        rows = max(children, default=0.0)
+    if node.get("name") in CROSS_JOINS:
+        cross_joins.append(math.prod(children))
+    estimates.append(rows)
+    return rows
+
+
+def preflight(
+    con: duckdb.DuckDBPyConnection,
+    sql: str,
+    mode: str = QUERY_PREFLIGHT,
+    max_rows: float = QUERY_MAX_ESTIMATED_ROWS,
+) -> list[str]:
+    """EXPLAIN `sql` and return warnings if its plan may produce more than `max_rows` rows.
+
+    In "reject" mode, raises QueryRejected instead. Statements that cannot be explained
+    are let through; running them reports any error.
+    """
+    if mode not in ("warn", "reject"):
+        return []
+    try:
+        rows = con.execute(f"EXPLAIN (FORMAT json) {sql}").fetchall()
+    except duckdb.Error:
+        return []
+    estimates, cross_joins = [], []
+    for _, plan in rows:
+        for node in json.loads(plan):
+            plan_estimates(node, estimates, cross_joins)
+    warnings = []
+    if any(size > max_rows for size in cross_joins):
+        warnings.append(f"Query joins every row with every other row (~{max(cross_joins):,.0f} pairs)")
+    elif estimates and max(estimates) > max_rows:
+        warnings.append(f"Query may process ~{max(estimates):,.0f} rows at one step")
+    if warnings and mode == "reject":
+        raise QueryRejected(f"Query rejected as too expensive: {'; '.join(warnings)}")
+    return warnings
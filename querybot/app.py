@@ -1,53 +1,161 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from platformdirs import user_config_dir
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal
+import asyncio
 import duckdb
-import httpx
+import hashlib
 import json
 import logging
-import numpy as np
 import os
 import pandas as pd
 import re
-import math
+import sqlite3
+import time
 import urllib.parse
-
-# Custom JSON encoder to handle non-serializable values
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (np.integer, np.floating, np.bool_)):
-            return obj.item()
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        if isinstance(obj, pd.Series):
-            return obj.tolist()
-        if isinstance(obj, (pd.Timestamp, pd._libs.tslibs.timestamps.Timestamp)):
-            return obj.isoformat()
-        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-            return None
-        return super().default(obj)
+import uuid
+from querybot.admission import QUERY_TIMEOUT, QueryLimiter, preflight
+from querybot.approximate import SAMPLE_PERCENT, SampleStore, approximate_sql, error_bound, stacked_aggregates
+from querybot.catalog import PROMPT_TOP_K, PROMPT_TOKEN_BUDGET, estimate_tokens
+from querybot.cache import DiskCache, LRUCache, SchemaCache, TieredCache, file_fingerprint
+from querybot.db import ClientDisconnected, CursorPool, PoolBusy
+from querybot.extensions import duckdb_config, extensions_for, load_extensions
+from querybot.ingest import Ingestor
+from querybot.llm import LLMClient
+from querybot.metrics import (
+    CACHE_LOOKUPS,
+    LLM_IN_FLIGHT,
+    LLM_TOKENS,
+    RESULT_ROWS,
+    Gauge,
+    TimingMiddleware,
+    render,
+    timed,
+)
+from querybot.profile import TEXT_TYPES, column_note, describe_profile, parse_date_sql, profile_dataset
+from querybot.remote import REMOTE_PREFETCH, RemoteCache
+from querybot.results import (
+    RESULT_MAX_ROWS,
+    RESULT_TTL,
+    UNSPILLABLE_ERRORS,
+    ResultCache,
+    ResultStore,
+    fetch_first_rows,
+    fit_page,
+    normalize_sql,
+)
+from querybot.shared_catalog import SharedCatalog
+from querybot.sources import is_multi_file, source_index, source_name
+from querybot.sql import column_trie, quote_columns
+from querybot.uploads import UploadError, UploadStore, file_entry
+from querybot.workspace import SessionMiddleware, Workspace, WorkspaceManager
+from querybot.serialize import CustomJSONEncoder, FastJSONResponse, dataframe_to_records, dataframe_to_rows, dumps
 
 load_dotenv()
 
+# When this module started initializing, for querybot_startup_seconds
+started = time.perf_counter()
+
 config_dir = user_config_dir("dataquery")
-app = FastAPI()
+
+# API key and base saved by /settings, re-read when changed so that every worker uses them
+settings_path = os.path.join(config_dir, "settings.json")
+settings_mtime = None
+
+
+def load_settings():
+    """Copy settings.json into the environment if it changed since it was last read."""
+    global settings_mtime
+    try:
+        mtime = os.stat(settings_path).st_mtime_ns
+        if mtime == settings_mtime:
+            return
+        with open(settings_path, "r") as f:
+            settings = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable settings {settings_path}: {e}")
+        return
+    for key, value in settings.items():
+        os.environ[key] = value
+    settings_mtime = mtime
+
+
+# Shared LLM client, created when the app starts
+llm: LLMClient | None = None
+
+# LLM responses keyed by model, API base and messages, in memory and under config_dir
+LLM_CACHE_TTL = float(os.getenv("QUERYBOT_LLM_CACHE_TTL", 7 * 24 * 3600))
+llm_cache = TieredCache(
+    LRUCache(int(os.getenv("QUERYBOT_LLM_CACHE_SIZE", 1000)), ttl=LLM_CACHE_TTL),
+    DiskCache(
+        os.path.join(config_dir, "llm_cache"),
+        ttl=LLM_CACHE_TTL,
+        max_bytes=int(os.getenv("QUERYBOT_LLM_CACHE_BYTES", 100_000_000)),
+    ),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global llm
+    llm = LLMClient()
+    startup_seconds.set(time.perf_counter() - started)
+    yield
+    await llm.aclose()
+    workspaces.close()
+    pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(SessionMiddleware)
+app.add_middleware(TimingMiddleware)
 
 # Use custom JSON encoder for all responses
 app.json_encoder = CustomJSONEncoder
 
-# Initialize DuckDB and load extensions
-con = duckdb.connect(":memory:")
-con.execute("INSTALL excel")
-con.execute("LOAD excel")
-con.execute("INSTALL mysql")
-con.execute("LOAD mysql")
-con.execute("INSTALL httpfs")
-con.execute("LOAD httpfs")
+# Initialize DuckDB. Extensions are loaded when a file first needs them, see load_extensions()
+con = duckdb.connect(":memory:", config=duckdb_config())
+
+# Keep remote file metadata, Parquet footers and (in DuckDB's external file cache)
+# blocks already read, so repeated queries on remote files skip those reads
+DUCKDB_CACHE_SETTINGS = ("SET enable_http_metadata_cache = true", "SET parquet_metadata_cache = true")
+for setting in DUCKDB_CACHE_SETTINGS:
+    con.execute(setting)
+
+
+def connect_duckdb() -> duckdb.DuckDBPyConnection:
+    """Open a new in-memory database with the same settings as `con`."""
+    workspace_con = duckdb.connect(":memory:", config=duckdb_config())
+    for setting in DUCKDB_CACHE_SETTINGS:
+        workspace_con.execute(setting)
+    return workspace_con
+
+
+# Run DESCRIBEs and queries off the event loop. Shared work (ingestion, paging) uses
+# cursors of `con`; each session's work uses its own workspace database
+pool = CursorPool(con)
+workspaces = WorkspaceManager(connect_duckdb, pool, temp_directory=os.path.join(config_dir, "spill"))
+
+# Generated SQL that may run at once across all workspaces
+query_limiter = QueryLimiter()
+
+Gauge("querybot_db_calls_pending", "DuckDB calls running or waiting for a worker", function=lambda: pool.pending)
+Gauge("querybot_queries_running", "Generated SQL queries running", function=lambda: query_limiter.running)
+Gauge("querybot_queries_waiting", "Generated SQL queries waiting to run", function=lambda: query_limiter.waiting)
+Gauge("querybot_workspaces", "Open session workspaces", function=lambda: len(workspaces.workspaces))
+startup_seconds = Gauge("querybot_startup_seconds", "Seconds from initializing querybot.app to serving requests")
+
+
+def get_workspace(http_request: Request) -> Workspace:
+    """Return the workspace of the session that sent `http_request`."""
+    return workspaces.get(http_request.state.session_id)
 
 SYSTEM_PROMPT = (
     "You are an expert data analyst tasked with analyzing data using DuckDB SQL syntax. "
@@ -124,54 +232,76 @@ SYSTEM_PROMPT = (
     "Always ensure queries are compatible with DuckDB and provide clear insights."
 )
 
-# In-memory storage for uploaded datasets
-datasets = {}
-
-def quote_column_name(column_name: str) -> str:
-    """Quote column names that contain spaces or special characters."""
-    # Skip empty or None column names
-    if not column_name:
-        return column_name
-        
-    # Remove any existing quotes first
-    column_name = column_name.strip('"')
-    
-    # Only quote if the column name contains spaces or special characters
-    if ' ' in column_name or any(c in column_name for c in '[](){}<>+-*/=!@#$%^&|\\'):
-        return f'"{column_name}"'
-    return column_name
-
-def process_sql_query(sql_query: str, schema_info: list) -> str:
-    """Process SQL query to properly quote column names."""
-    if not schema_info:
-        return sql_query
-        
-    # Create a mapping of unquoted column names to quoted ones
-    column_mapping = {}
-    for col in schema_info:
-        if col and len(col) > 0 and col[0]:  # Ensure we have valid column names
-            original = col[0].strip('"')  # Remove any existing quotes
-            quoted = quote_column_name(original)
-            if original and quoted:  # Only add if both are non-empty
-                column_mapping[original] = quoted
-    
-    # Sort column names by length (longest first) to avoid partial matches
-    sorted_columns = sorted(column_mapping.keys(), key=len, reverse=True)
-    
-    # Replace column names in the query
-    for original in sorted_columns:
-        quoted = column_mapping[original]
-        # Use word boundaries and ensure we don't match inside quotes
-        pattern = r'(?<!")\b' + re.escape(original) + r'\b(?!")'
-        sql_query = re.sub(pattern, quoted, sql_query)
-    
-    return sql_query
+# File schemas shared by /upload and /query, persisted across restarts
+SCHEMA_CACHE_EXTENSIONS = {".csv", ".txt", ".parquet", ".json", ".xlsx"}
+# SQLite and DuckDB files, whose tables and views are each registered as a dataset
+DATABASE_EXTENSIONS = {".db", ".duckdb"}
+schema_cache = SchemaCache(
+    os.path.join(config_dir, "schema_cache.json"),
+    maxsize=int(os.getenv("QUERYBOT_SCHEMA_CACHE_SIZE", 1000)),
+)
+
+# Column profiles of uploaded files, valid while the file is unchanged
+profile_cache = SchemaCache(
+    os.path.join(config_dir, "profile_cache.json"),
+    maxsize=int(os.getenv("QUERYBOT_SCHEMA_CACHE_SIZE", 1000)),
+)
+
+# Query results beyond the first page, served by /query/{result_id}/page
+results = ResultStore(os.path.join(config_dir, "results"))
+result_cache = ResultCache(results)
+
+# Functions whose results change between runs, so queries using them are never cached
+VOLATILE_SQL = re.compile(r"\b(now|today|current_date|current_time|current_timestamp|random|uuid|gen_random_uuid)\b", re.I)
+# Files read directly in generated SQL, e.g. read_csv_auto('data.csv')
+SOURCE_PATH_SQL = re.compile(r"\b(?:read_\w+|parquet_scan|sqlite_scan)\s*\(\s*'([^']+)'", re.I)
+
+# Local Parquet copies of uploaded files, so queries skip re-parsing the source
+INGEST_EXTENSIONS = {".csv", ".txt", ".json", ".xlsx"}
+# Copies are made from the source, not from an earlier copy with other casts
+ingestor = Ingestor(
+    os.path.join(config_dir, "ingest"),
+    pool,
+    describe=lambda con, file_path: describe_file_cached(con, file_path, materialized=False),
+)
+
+# Local copies of remote files, downloaded on request at upload
+remote_cache = RemoteCache(os.path.join(config_dir, "remote_cache"))
+
+# Files sent to /files, streamed to disk
+uploads = UploadStore(os.path.join(config_dir, "uploads"), SCHEMA_CACHE_EXTENSIONS | DATABASE_EXTENSIONS)
+
+# Uniform samples of files for approximate queries, built at upload or on first use
+sample_store = SampleStore(os.path.join(config_dir, "samples"), pool, describe=lambda *args: describe_file_cached(*args))
+
+# Exact results computed in the background for approximate queries, by refinement ID
+refinements = LRUCache(1000, ttl=RESULT_TTL)
+refinement_tasks = set()
+
+# Datasets each session registered, shared by every worker process
+shared_catalog = SharedCatalog(os.path.join(config_dir, "catalog.sqlite"))
+
+# Worker processes main() starts. Each has its own DuckDB databases and shares the catalog
+WORKERS = int(os.getenv("QUERYBOT_WORKERS", 1))
+
+# Questions /query/batch takes, and how many it asks the LLM about in one prompt
+BATCH_MAX = int(os.getenv("QUERYBOT_BATCH_MAX", 50))
+BATCH_SIZE = int(os.getenv("QUERYBOT_BATCH_SIZE", 10))
+# Local files up to this size that several batched queries read are loaded into a table once
+BATCH_MATERIALIZE_BYTES = int(os.getenv("QUERYBOT_BATCH_MATERIALIZE_BYTES", 2_000_000_000))
+
+# Files /upload describes and asks the LLM about at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("QUERYBOT_UPLOAD_CONCURRENCY", 8))
+
 
 # Helper function to call LLM API
-async def call_llm_system_prompt(user_input, model="gpt-4.1-mini", api_base=None, custom_system_prompt=None):
+def llm_request(user_input, model="gpt-4.1-mini", api_base=None, custom_system_prompt=None) -> tuple[str, dict, dict]:
+    """Return the base URL, headers and payload for an LLM chat completion."""
     # Use custom system prompt if provided, otherwise use default
     current_prompt = custom_system_prompt if custom_system_prompt else SYSTEM_PROMPT
-    
+    # Pick up settings saved through another worker
+    load_settings()
+
     headers = {
         "Authorization": f"Bearer {os.environ['OPENAI_API_KEY']}:querybot",
     }
@@ -185,18 +315,60 @@ async def call_llm_system_prompt(user_input, model="gpt-4.1-mini", api_base=None
     
     # Use custom API base URL if provided, otherwise use the default
     base_url = api_base if api_base else os.environ['OPENAI_API_BASE']
-    
-    async with httpx.AsyncClient() as client:
-        # Check if the base URL already ends with /chat/completions
-        url = base_url if base_url.endswith("/chat/completions") else f"{base_url}/chat/completions"
-        response = await client.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=30.0,  # Added timeout for safety
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+    return base_url, headers, payload
+
+
+def llm_cache_key(base_url: str, payload: dict) -> str:
+    return json.dumps([payload["model"], base_url, payload["messages"]])
+
+
+def count_llm_tokens(payload: dict, content: str, usage: dict | None = None):
+    """Count the tokens of an LLM call, estimating them if the API did not report usage."""
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in payload["messages"])
+    completion_tokens = usage.get("completion_tokens")
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(content)
+    LLM_TOKENS.inc(prompt_tokens, model=payload["model"], kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=payload["model"], kind="completion")
+
+
+async def call_llm_system_prompt(user_input, model="gpt-4.1-mini", api_base=None, custom_system_prompt=None, use_cache=True):
+    base_url, headers, payload = llm_request(user_input, model, api_base, custom_system_prompt)
+    key = llm_cache_key(base_url, payload)
+    if use_cache:
+        content = llm_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="llm", outcome="miss" if content is None else "hit")
+        if content is not None:
+            return content
+    with LLM_IN_FLIGHT.track():
+        response = await llm.post(base_url, headers, payload)
+    response_json = response.json()
+    content = response_json["choices"][0]["message"]["content"]
+    count_llm_tokens(payload, content, response_json.get("usage"))
+    llm_cache.set(key, content)
+    return content
+
+
+async def stream_llm_system_prompt(user_input, model="gpt-4.1-mini", api_base=None, custom_system_prompt=None, use_cache=True):
+    """Yield the LLM response as it is generated."""
+    base_url, headers, payload = llm_request(user_input, model, api_base, custom_system_prompt)
+    key = llm_cache_key(base_url, payload)
+    if use_cache:
+        content = llm_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="llm", outcome="miss" if content is None else "hit")
+        if content is not None:
+            yield content
+            return
+    chunks = []
+    with LLM_IN_FLIGHT.track():
+        async for content in llm.stream(base_url, headers, payload):
+            chunks.append(content)
+            yield content
+    count_llm_tokens(payload, "".join(chunks))
+    llm_cache.set(key, "".join(chunks))
 
 
 class QueryRequest(BaseModel):
@@ -207,9 +379,30 @@ class QueryRequest(BaseModel):
     system_prompt: str | None = None  # Make system_prompt optional
     model: str = "gpt-4.1-mini"  # Default model
     api_base: str | None = None  # Optional custom API base URL
+    result_format: Literal["records", "columns"] = "records"  # "columns" returns {"columns", "data"}
+    use_cache: bool = True  # Set to false to always call the LLM
+    mode: Literal["exact", "approximate"] = "exact"  # "approximate" queries a sample of each file
+    refine: bool = False  # With mode "approximate", also compute the exact result in the background
+
+class BatchQueryRequest(BaseModel):
+    file_path: str  # Comma-separated files that every question is about
+    queries: List[str]
+    system_prompt: str | None = None
+    model: str = "gpt-4.1-mini"
+    api_base: str | None = None
+    result_format: Literal["records", "columns"] = "records"
+    use_cache: bool = True
+    batch_size: int = BATCH_SIZE  # Questions per LLM prompt
+    materialize: bool = True  # Load files that several queries read into a table once
 
 class AnalyzeFileRequest(BaseModel):
     file_paths: List[str]  # Now this can contain comma-separated paths
+    ingest: bool = False  # Materialize CSV/JSON/Excel files into Parquet in the background
+    prefetch: bool = REMOTE_PREFETCH  # Download remote files in the background to query them locally
+    stream: bool = False  # Return newline-delimited JSON events as each file finishes
+    sample: bool = False  # Build a sample of each file in the background for approximate queries
+    profile: bool = False  # Profile each column's cardinality, nulls, range, top values and date format
+    parse_dates: bool = False  # With "ingest", profile and store text columns holding dates as DATE/TIMESTAMP
 
 
 def is_remote_url(file_path: str) -> bool:
@@ -220,85 +413,70 @@ def is_remote_url(file_path: str) -> bool:
     except:
         return False
 
-def get_schema_from_duckdb(file_path: str) -> tuple[str, str]:
-    """Get schema using DuckDB's introspection capabilities."""
+def get_schema_from_duckdb(con: duckdb.DuckDBPyConnection, file_path: str, sample_rows: int = 5) -> tuple[str, list]:
+    """Get schema and sample rows using DuckDB's introspection capabilities on the given cursor."""
     try:
         file_extension = Path(file_path).suffix.lower()
-        con = duckdb.connect(":memory:")
-
-        # Handle different file types for both local and remote files
-        if file_extension in [".csv", ".txt"]:
-            # For CSV files, get schema without creating table
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM read_csv_auto('{file_path}') LIMIT 0").fetchall()
-        elif file_extension == ".parquet":
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{file_path}') LIMIT 0").fetchall()
-        elif file_extension == ".json":
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM read_json_auto('{file_path}') LIMIT 0").fetchall()
-        elif file_extension == ".duckdb" and is_remote_url(file_path):
-            # For remote DuckDB files
-            con.execute(f"ATTACH '{file_path}' AS remote_db")
-            tables = con.execute("SELECT name FROM remote_db.sqlite_master WHERE type='table'").fetchall()
-            if not tables:
-                raise ValueError("No tables found in remote DuckDB database")
-            table_name = tables[0][0]
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM remote_db.{table_name} LIMIT 0").fetchall()
-        elif file_extension == ".xlsx":
-            if is_remote_url(file_path):
-                raise ValueError("Remote Excel files are not supported")
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM read_excel('{file_path}') LIMIT 0").fetchall()
-        elif file_extension == ".db":
-            if is_remote_url(file_path):
-                raise ValueError("Remote SQLite databases are not supported")
-            con.execute("INSTALL sqlite")
-            con.execute("LOAD sqlite")
-            # Get list of tables directly from SQLite file
-            tables = con.execute(f"SELECT name FROM sqlite_scan('{file_path}', 'sqlite_master') WHERE type='table'").fetchall()
-            if not tables:
-                raise ValueError("No tables found in SQLite database")
-            table_name = tables[0][0]
-            # Use sqlite_scan directly without attaching
-            read_function = f"sqlite_scan('{file_path}', '{table_name}')"
-            schema_info = con.execute(f"DESCRIBE SELECT * FROM {read_function} LIMIT 0").fetchall()
+        if file_extension == ".xlsx" and is_remote_url(file_path):
+            raise ValueError("Remote Excel files are not supported")
+        if file_extension == ".db" and is_remote_url(file_path):
+            raise ValueError("Remote SQLite databases are not supported")
+
+        if file_extension in DATABASE_EXTENSIONS:
+            tables = describe_database_cached(con, file_path)
+            schema_description = describe_tables(tables)
+            read_function = tables[0]["read_function"]
         else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+            schema_info, read_function = describe_file_cached(con, file_path)
 
-        # Generate schema description
-        schema_description = (
-            "CREATE TABLE dataset (\n"
-            + ",\n".join([f"[{col[0]}] {col[1]}" for col in schema_info])
-            + "\n);"
-        )
+            # Generate schema description, noting the partition columns of directories and globs
+            notes = source_index.partition_notes(file_path) if is_multi_file(file_path) else {}
+            schema_description = (
+                "CREATE TABLE dataset (\n"
+                + "\n".join(
+                    f"[{col[0]}] {col[1]}"
+                    + ("," if i < len(schema_info) - 1 else "")
+                    + (f" -- {notes[col[0]]}" if col[0] in notes else "")
+                    for i, col in enumerate(schema_info)
+                )
+                + "\n);"
+            )
 
-        # Get sample data for better question suggestions (only for files that support it efficiently)
+        # Get sample data for better question suggestions
         sample_data = []
-        if file_extension in [".csv", ".txt"]:
-            sample_data = con.execute(f"SELECT * FROM read_csv_auto('{file_path}') LIMIT 5").fetchall()
-        elif file_extension == ".parquet":
-            sample_data = con.execute(f"SELECT * FROM read_parquet('{file_path}') LIMIT 5").fetchall()
-        elif file_extension == ".json":
-            sample_data = con.execute(f"SELECT * FROM read_json_auto('{file_path}') LIMIT 5").fetchall()
-        elif file_extension == ".xlsx" and not is_remote_url(file_path):
-            sample_data = con.execute("SELECT * FROM temp LIMIT 5").fetchall()
-        elif file_extension in [".db", ".duckdb"]:
-            # For database files, sample data is already handled above
-            pass
+        if sample_rows:
+            sample_data = con.execute(f"SELECT * FROM {read_function} LIMIT {int(sample_rows)}").fetchall()
 
         return schema_description, sample_data
 
     except Exception as e:
         logging.error(f"Error reading file {file_path}: {e}")
         raise
-    finally:
-        con.close()
+
+
+def describe_tables(tables: list, token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Describe a database's tables, leaving out the last ones beyond `token_budget` tokens."""
+    descriptions, tokens = [], 0
+    for table in tables:
+        description = (
+            f"CREATE TABLE {table['table']} (\n"
+            + ",\n".join([f"[{col[0]}] {col[1]}" for col in table["schema_info"]])
+            + "\n);"
+        )
+        tokens += estimate_tokens(description)
+        if descriptions and tokens > token_budget:
+            descriptions.append(f"-- {len(tables) - len(descriptions)} more tables omitted")
+            break
+        descriptions.append(description)
+    return "\n".join(descriptions)
 
 
 def get_schema_from_mysql(connection_string: str) -> tuple[str, str]:
     """Get schema from MySQL database."""
-    con = duckdb.connect(":memory:")
+    con = duckdb.connect(":memory:", config=duckdb_config())
     try:
         # Use DuckDB's MySQL scanner
-        con.execute("INSTALL mysql")
-        con.execute("LOAD mysql")
+        load_extensions(con, "mysql")
         # Get schema without creating table
         schema_info = con.execute(f"DESCRIBE SELECT * FROM mysql_scan('{connection_string}') LIMIT 0").fetchall()
         sample_data = con.execute(f"SELECT * FROM mysql_scan('{connection_string}') LIMIT 5").fetchall()
@@ -314,9 +492,276 @@ def get_schema_from_mysql(connection_string: str) -> tuple[str, str]:
         con.close()
 
 
+def attach_alias(file_path: str) -> str:
+    """Return a database alias that is unique to `file_path`."""
+    return f"db_{hashlib.sha1(file_path.encode()).hexdigest()[:12]}"
+
+
+def quote_identifier(name: str) -> str:
+    """Double-quote a table or schema name unless it is a plain identifier."""
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def attach_database(con: duckdb.DuckDBPyConnection, file_path: str) -> str:
+    """Attach a SQLite or DuckDB file read-only, once per connection, and return its alias.
+
+    Read-only, so other workspaces can attach the same file too.
+    """
+    alias = attach_alias(file_path)
+    if Path(file_path).suffix.lower() == ".db":
+        load_extensions(con, "sqlite")
+        con.execute(f"ATTACH IF NOT EXISTS '{file_path}' AS {alias} (TYPE sqlite, READ_ONLY)")
+    else:
+        con.execute(f"ATTACH IF NOT EXISTS '{file_path}' AS {alias} (READ_ONLY)")
+    return alias
+
+
+def describe_database(con: duckdb.DuckDBPyConnection, file_path: str) -> list[dict]:
+    """Return the `table`, `schema_info` and `read_function` of every table and view in a database file."""
+    alias = attach_database(con, file_path)
+    rows = con.execute(
+        "SELECT table_schema, table_name, column_name, data_type FROM information_schema.columns "
+        "WHERE table_catalog = ? ORDER BY table_schema, table_name, ordinal_position",
+        [alias],
+    ).fetchall()
+    tables = {}
+    for table_schema, table_name, column_name, data_type in rows:
+        if (table_schema, table_name) not in tables:
+            # Tables outside the default schema are named with their schema
+            prefix = "" if table_schema == "main" else f"{quote_identifier(table_schema)}."
+            tables[table_schema, table_name] = {
+                "table": table_name if table_schema == "main" else f"{table_schema}.{table_name}",
+                "schema_info": [],
+                "read_function": f"{alias}.{prefix}{quote_identifier(table_name)}",
+            }
+        tables[table_schema, table_name]["schema_info"].append((column_name, data_type))
+    if not tables:
+        raise ValueError("No tables found in database")
+    return list(tables.values())
+
+
+def describe_database_cached(con: duckdb.DuckDBPyConnection, file_path: str) -> list[dict]:
+    """describe_database(), with table schemas served from the schema cache while the file is unchanged."""
+    fingerprint = file_fingerprint(file_path)
+    if fingerprint:
+        entry = schema_cache.get(file_path, fingerprint)
+        CACHE_LOOKUPS.inc(cache="schema", outcome="hit" if entry else "miss")
+        if entry:
+            # Queries still need the database attached to this connection
+            attach_database(con, file_path)
+            return [
+                {**table, "schema_info": [tuple(col) for col in table["schema_info"]]}
+                for table in entry["tables"]
+            ]
+    tables = describe_database(con, file_path)
+    if fingerprint:
+        schema_cache.set(file_path, fingerprint, {"tables": tables})
+    return tables
+
+
+def describe_file(con: duckdb.DuckDBPyConnection, file_path: str) -> tuple[list, str]:
+    """Return the DESCRIBE output and the read function to use in queries for a file."""
+    file_extension = Path(file_path).suffix.lower()
+    if is_multi_file(file_path):
+        # A directory or glob, read as one dataset
+        schema_info, read_function = source_index.describe(con, file_path)
+    elif file_extension in ['.csv', '.txt']:
+        schema_info = con.execute(f"DESCRIBE SELECT * FROM read_csv_auto('{file_path}') LIMIT 0").fetchall()
+        read_function = f"read_csv_auto('{file_path}')"
+    elif file_extension == '.parquet':
+        schema_info = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{file_path}') LIMIT 0").fetchall()
+        read_function = f"read_parquet('{file_path}')"
+    elif file_extension == '.json':
+        schema_info = con.execute(f"DESCRIBE SELECT * FROM read_json_auto('{file_path}') LIMIT 0").fetchall()
+        read_function = f"read_json_auto('{file_path}')"
+    elif file_extension == '.xlsx':
+        schema_info = con.execute(f"DESCRIBE SELECT * FROM read_excel('{file_path}') LIMIT 0").fetchall()
+        read_function = f"read_excel('{file_path}')"
+    elif file_extension in DATABASE_EXTENSIONS:
+        # The first table; register_files() registers every table with describe_database()
+        table = describe_database(con, file_path)[0]
+        schema_info, read_function = table["schema_info"], table["read_function"]
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    return schema_info, read_function
+
+
+def describe_file_cached(
+    con: duckdb.DuckDBPyConnection, file_path: str, materialized: bool = True
+) -> tuple[list, str]:
+    """describe_file(), served from the schema cache while the file is unchanged.
+
+    Also loads the extensions the file needs on `con`, which queries on it rely on.
+    With `materialized=False`, the source is read even if it has a Parquet copy.
+    """
+    load_extensions(con, *extensions_for(file_path))
+    # Database files are cheap to describe, and ATTACH must run on every registration
+    if Path(file_path).suffix.lower() not in SCHEMA_CACHE_EXTENSIONS and not is_multi_file(file_path):
+        return describe_file(con, file_path)
+    fingerprint = file_fingerprint(file_path)
+    if fingerprint:
+        # Prefer the materialized Parquet copy while the source is unchanged
+        parquet_path = ingestor.lookup(file_path, fingerprint) if materialized else None
+        if parquet_path:
+            return describe_file_cached(con, parquet_path)
+        # Then a downloaded copy of a remote file
+        local_path = remote_cache.lookup(file_path, fingerprint)
+        if local_path:
+            return describe_file_cached(con, local_path)
+        entry = schema_cache.get(file_path, fingerprint)
+        CACHE_LOOKUPS.inc(cache="schema", outcome="hit" if entry else "miss")
+        if entry:
+            return [tuple(col) for col in entry["schema_info"]], entry["read_function"]
+    schema_info, read_function = describe_file(con, file_path)
+    if fingerprint:
+        schema_cache.set(file_path, fingerprint, {"schema_info": schema_info, "read_function": read_function})
+    return schema_info, read_function
+
+
+def profile_file(con: duckdb.DuckDBPyConnection, file_path: str) -> dict:
+    """Return profile_dataset() for a file, cached while the file is unchanged."""
+    fingerprint = file_fingerprint(file_path)
+    entry = profile_cache.get(file_path, fingerprint) if fingerprint else None
+    CACHE_LOOKUPS.inc(cache="profile", outcome="hit" if entry else "miss")
+    if entry:
+        return entry["profile"]
+    _, read_function = describe_file_cached(con, file_path)
+    profile = profile_dataset(con, read_function)
+    if fingerprint:
+        profile_cache.set(file_path, fingerprint, {"profile": profile})
+    return profile
+
+
+def cached_profile(file_path: str) -> dict | None:
+    """Return the profile /upload stored for a file, or None if it has none or the file changed."""
+    # Only fingerprint files that were profiled
+    if profile_cache.entries.get(file_path) is None:
+        return None
+    entry = profile_cache.get(file_path, file_fingerprint(file_path))
+    return entry["profile"] if entry else None
+
+
+def busy_response(error: PoolBusy) -> JSONResponse:
+    """Tell the client to retry when the DuckDB pool is saturated."""
+    return JSONResponse(
+        content={"error": f"Server busy, please retry: {error}"},
+        status_code=429,
+        headers={"Retry-After": "1"},
+    )
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    size: int  # Bytes
+    sha256: str | None = None  # Hex digest of the whole file, checked once it has arrived
+    convert: bool = False  # Convert CSV/JSON/Excel files to Parquet in the background once stored
+
+
+def convert_upload(file: dict) -> dict | None:
+    """Start converting a stored CSV/JSON/Excel file to Parquet, and return the ingest job."""
+    if Path(file["path"]).suffix.lower() in INGEST_EXTENSIONS:
+        return ingestor.submit(file["path"])
+    return None
+
+
+@app.post("/files")
+async def upload_files(http_request: Request, convert: bool = False):
+    """Store the files in a multipart/form-data body, written to disk as they arrive.
+
+    Returns `files` with each one's path, to pass to /upload. With `?convert=true`,
+    CSV/JSON/Excel files are converted to Parquet in the background (see /ingest).
+    """
+    content_type = http_request.headers.get("content-type", "")
+    try:
+        files = await uploads.receive_multipart(content_type, http_request.stream())
+    except UploadError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+    if convert:
+        for file in files:
+            file["ingest"] = convert_upload(file)
+    return {"files": files}
+
+
+@app.post("/files/uploads")
+async def create_upload(request: CreateUploadRequest):
+    """Start a resumable upload. Send its bytes with PATCH /files/uploads/{upload_id}."""
+    try:
+        return uploads.create(request.filename, request.size, request.sha256, request.convert)
+    except UploadError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+
+
+@app.get("/files/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    """Return an unfinished upload's `offset`, where to resume sending it from."""
+    try:
+        return uploads.status(upload_id)
+    except UploadError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+
+
+@app.patch("/files/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, http_request: Request):
+    """Append the request body to an upload at the `Upload-Offset` header's offset.
+
+    An `X-Chunk-SHA256` header is checked against the chunk, which is dropped on a
+    mismatch. A wrong offset returns HTTP 409 with the upload's `offset`. The chunk
+    that completes the file returns the stored `file`.
+    """
+    try:
+        offset = int(http_request.headers.get("upload-offset", ""))
+    except ValueError:
+        return JSONResponse(content={"error": "Upload-Offset header required"}, status_code=400)
+    try:
+        upload = await uploads.append(
+            upload_id, offset, http_request.stream(), http_request.headers.get("x-chunk-sha256")
+        )
+    except UploadError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+    if upload.get("file") and upload["convert"]:
+        upload["file"]["ingest"] = convert_upload(upload["file"])
+    return upload
+
+
+@app.delete("/files/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    try:
+        uploads.status(upload_id)
+    except UploadError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+    uploads.cancel(upload_id)
+    return {"upload_id": upload_id, "cancelled": True}
+
+
 @app.get("/list-files")
 async def list_files():
-    return {"files": [f.name for f in Path(config_dir).glob("*.csv")]}
+    """List uploaded files and CSV files in the config directory with their size and format.
+
+    `parquet` is the up-to-date Parquet copy /upload reads instead, if there is one.
+    """
+    files = uploads.files() + [file_entry(str(path)) for path in sorted(Path(config_dir).glob("*.csv"))]
+    for file in files:
+        parquet_path = ingestor.lookup(file["path"], file_fingerprint(file["path"]))
+        file["parquet"] = {"path": parquet_path, "size": os.path.getsize(parquet_path)} if parquet_path else None
+    return {"files": files}
+
+
+@app.get("/ingest")
+async def ingest_status():
+    """Report progress of background ingestion, prefetch and sampling jobs started by /upload."""
+    return {
+        "jobs": list(ingestor.jobs.values()),
+        "prefetch": list(remote_cache.jobs.values()),
+        "samples": list(sample_store.jobs.values()),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Return latency, cache, LLM token, result size and in-flight metrics for Prometheus."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/system-prompt")
@@ -324,219 +769,698 @@ async def get_system_prompt():
     return {"system_prompt": SYSTEM_PROMPT}
 
 
+async def analyze_file(
+    workspace: Workspace, file_path: str, request: AnalyzeFileRequest, http_request: Request
+) -> dict:
+    """Describe one file, directory or glob and ask the LLM for questions it can answer."""
+    multi_file = is_multi_file(file_path)
+    dataset_name = source_name(file_path) if multi_file else Path(file_path).stem
+
+    # Start downloading remote files first, so the copy is ready as early as possible
+    prefetch = None
+    if request.prefetch and urllib.parse.urlparse(file_path).scheme in ("http", "https"):
+        prefetch = remote_cache.submit(file_path)
+
+    # Get schema using DuckDB
+    with timed("describe"):
+        schema_description, _ = await workspace.run(get_schema_from_duckdb, file_path, 0, request=http_request)
+
+    # Profile each column, and describe the file with the profile instead of bare types.
+    # Directories and globs are not profiled, as that would scan every file whenever one is added
+    profile = None
+    profiled = request.profile or (request.parse_dates and request.ingest)
+    if profiled and not multi_file and Path(file_path).suffix.lower() not in DATABASE_EXTENSIONS:
+        with timed("profile"):
+            profile = await workspace.run(profile_file, file_path, request=http_request)
+        schema_description = describe_profile("dataset", profile)
+
+    # Generate suggested questions using LLM with schema and sample data
+    user_prompt = (
+        f"Dataset name: {dataset_name}\n"
+        f"Schema: {schema_description}\n"
+        "Please provide 5 suggested questions (ONLY QUESTIONS, NO EXPLANATION, NO Serial Numbers) that can be answered using duckDB queries on this dataset."
+    )
+    with timed("llm"):
+        suggested_questions = await call_llm_system_prompt(user_prompt, "gpt-4.1-mini")
+
+    uploaded_dataset = {
+        "dataset_name": dataset_name,
+        "schema": schema_description,
+        "suggested_questions": suggested_questions,
+        "file_type": Path(file_path).suffix.lower(),
+    }
+    if multi_file:
+        uploaded_dataset["file_type"] = source_index.sources.get(file_path, {}).get("extension") or ""
+        uploaded_dataset["partitions"] = source_index.partitions(file_path)
+    if prefetch:
+        uploaded_dataset["prefetch"] = prefetch
+    if profile:
+        uploaded_dataset["profile"] = profile
+    if request.ingest and not multi_file and uploaded_dataset["file_type"] in INGEST_EXTENSIONS:
+        casts = {}
+        if request.parse_dates and profile:
+            casts = {
+                name: column["date_format"]
+                for name, column in profile["columns"].items()
+                if column["date_format"] and column["type"] in TEXT_TYPES
+            }
+        uploaded_dataset["ingest"] = ingestor.submit(file_path, casts)
+    if request.sample and uploaded_dataset["file_type"] not in DATABASE_EXTENSIONS:
+        uploaded_dataset["sample"] = sample_store.submit(file_path)
+    return uploaded_dataset
+
+
+def upload_error(file_path: str, error: Exception) -> dict:
+    dataset_name = source_name(file_path) if is_multi_file(file_path) else Path(file_path).stem
+    return {"dataset_name": dataset_name, "file_path": file_path, "error": str(error)}
+
+
 @app.post("/upload")
-async def upload_csv(request: AnalyzeFileRequest):
-    # Split the file paths and process each file
-    uploaded_datasets = []
+async def upload_csv(request: AnalyzeFileRequest, http_request: Request):
+    """Analyze up to QUERYBOT_UPLOAD_CONCURRENCY files at a time.
+
+    Returns the files that succeeded in `uploaded_datasets` and the rest in
+    `failed_datasets`. With `"stream": true`, returns newline-delimited JSON events as
+    files finish instead: `{"type": "dataset", ...}` or `{"type": "error", "file_path",
+    "error"}` per file, then `{"type": "done", "uploaded", "failed"}`.
+    """
+    workspace = get_workspace(http_request)
+    limiter = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def analyze(file_path: str) -> tuple[str, dict | Exception]:
+        async with limiter:
+            try:
+                return file_path, await analyze_file(workspace, file_path, request, http_request)
+            except Exception as e:
+                logging.error(f"Error uploading {file_path}: {e}")
+                return file_path, e
 
-    for file_path in request.file_paths:
-        dataset_name = Path(file_path).stem
+    if request.stream:
 
-        # Get schema and sample data using DuckDB
-        schema_description, _ = get_schema_from_duckdb(file_path)
+        async def events():
+            tasks = [asyncio.ensure_future(analyze(file_path)) for file_path in request.file_paths]
+            uploaded = failed = 0
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    file_path, outcome = await next_done
+                    if isinstance(outcome, Exception):
+                        failed += 1
+                        yield dumps({"type": "error", **upload_error(file_path, outcome)}) + b"\n"
+                    else:
+                        uploaded += 1
+                        yield dumps({"type": "dataset", **outcome}) + b"\n"
+                yield dumps({"type": "done", "uploaded": uploaded, "failed": failed}) + b"\n"
+            finally:
+                # Stop work on remaining files if the client goes away
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    outcomes = await asyncio.gather(*(analyze(file_path) for file_path in request.file_paths))
+    uploaded_datasets = [outcome for _, outcome in outcomes if not isinstance(outcome, Exception)]
+    failed_datasets = [upload_error(path, outcome) for path, outcome in outcomes if isinstance(outcome, Exception)]
+    # Only report overload when no file could be analyzed at all
+    if outcomes and all(isinstance(outcome, PoolBusy) for _, outcome in outcomes):
+        return busy_response(outcomes[0][1])
+    return {"uploaded_datasets": uploaded_datasets, "failed_datasets": failed_datasets}
+
+
+class QueryError(Exception):
+    """A failed /query step, with the JSON content to return to the client."""
+
+    def __init__(self, content: dict, status_code: int = 400):
+        super().__init__(content["error"])
+        self.content = content
+        self.status_code = status_code
+
+
+def sample_values(con: duckdb.DuckDBPyConnection, read_function: str, sample_rows: int = 3) -> dict:
+    """Return a few distinct values of each text column, to help match questions to datasets."""
+    sample = con.execute(f"SELECT * FROM {read_function} LIMIT {int(sample_rows)}").fetchdf()
+    return {
+        str(column): sample[column].dropna().astype(str).unique().tolist()
+        for column in sample.columns
+        if sample[column].dtype == object or pd.api.types.is_string_dtype(sample[column])
+    }
 
-        # Generate suggested questions using LLM with schema and sample data
-        user_prompt = (
-            f"Dataset name: {dataset_name}\n"
-            f"Schema: {schema_description}\n"
-            "Please provide 5 suggested questions (ONLY QUESTIONS, NO EXPLANATION, NO Serial Numbers) that can be answered using duckDB queries on this dataset."
-        )
-        suggested_questions = await call_llm_system_prompt(user_prompt, "gpt-4.1-mini")
 
-        uploaded_datasets.append({
-                "dataset_name": dataset_name,
-                "schema": schema_description,
-                "suggested_questions": suggested_questions,
-                "file_type": Path(file_path).suffix.lower(),
-            })
+def dataset_name_for(name: str) -> str:
+    """Turn a file or table name into a dataset name usable as an SQL identifier."""
+    dataset_name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+    if dataset_name[0].isdigit():
+        dataset_name = f"t_{dataset_name}"
+    return dataset_name
+
+
+def register_dataset(
+    workspace: Workspace,
+    dataset_name: str,
+    file_path: str,
+    schema_info: list,
+    read_function: str,
+    table=None,
+    profile: dict | None = None,
+):
+    """Store a dataset in the workspace. `table` is its table name if it comes from a database file.
+
+    `profile` is the file's upload-time profile, whose date formats rewrite_sql_query() uses.
+    """
+    schema_description = (
+        f"CREATE TABLE {dataset_name} (\n"
+        + ",\n".join([f"[{col[0]}] {col[1]}" for col in schema_info])
+        + "\n);"
+    )
+
+    # Store dataset info with file path
+    workspace.datasets[dataset_name] = {
+        "schema_description": schema_description,
+        "file_path": file_path,
+        "read_function": read_function,
+        "table": table,
+        # Column names to quote in generated SQL, built once per schema
+        "column_trie": column_trie(tuple(col[0] for col in schema_info)),
+        "date_formats": date_formats(schema_info, profile),
+    }
 
-    return {"uploaded_datasets": uploaded_datasets}
 
+def date_formats(schema_info: list, profile: dict | None) -> dict:
+    """Map date columns to the format text ones are stored in, or None if they are already dates."""
+    formats = {col[0]: None for col in schema_info if str(col[1]).startswith(("DATE", "TIMESTAMP"))}
+    profiled = profile["columns"] if profile else {}
+    for col in schema_info:
+        column = profiled.get(col[0])
+        if column and column["date_format"] and col[1] in TEXT_TYPES:
+            formats[col[0]] = column["date_format"]
+    return formats
 
-@app.post("/query")
-async def query_data(request: QueryRequest):
+
+async def register_database(workspace: Workspace, file_path: str, http_request: Request) -> list:
+    """Register every table and view of a SQLite or DuckDB file and return their dataset names.
+
+    Tables are indexed by name and columns only. Scanning each for sample values would
+    read the whole database, so the catalog ranks tables without them.
+    """
     try:
-        # Handle explanation requests differently
-        if request.is_explanation:
-            # Use the system prompt provided in the request for explanations
-            system_prompt = request.system_prompt if request.system_prompt else SYSTEM_PROMPT
+        tables = await workspace.run(describe_database_cached, file_path, request=http_request)
+    except (PoolBusy, ClientDisconnected):
+        raise
+    except Exception as e:
+        raise QueryError({"error": f"Error reading file: {str(e)}"})
+    stem = dataset_name_for(Path(file_path).stem)
+    dataset_names, fingerprint = [], None
+    for table in tables:
+        dataset_name = dataset_name_for(f"{stem}_{table['table']}")
+        register_dataset(workspace, dataset_name, file_path, table["schema_info"], table["read_function"], table["table"])
+        columns = [tuple(col[:2]) for col in table["schema_info"]]
+        entry = workspace.catalog.get(dataset_name)
+        if entry is None or entry["read_function"] != table["read_function"] or entry["columns"] != columns:
+            workspace.catalog.add(dataset_name, file_path, table["read_function"], columns, description=table["table"])
+            fingerprint = fingerprint or await asyncio.to_thread(file_fingerprint, file_path)
+            await share_dataset(workspace, dataset_name, fingerprint, {}, description=table["table"])
+        dataset_names.append(dataset_name)
+    # Forget tables that were dropped from the database since it was last registered
+    for dataset_name, dataset in list(workspace.datasets.items()):
+        if dataset["file_path"] == file_path and dataset["table"] and dataset_name not in dataset_names:
+            del workspace.datasets[dataset_name]
+            workspace.catalog.remove(dataset_name)
+            await unshare_dataset(workspace, dataset_name)
+    return dataset_names
+
+
+def describe_and_profile(con: duckdb.DuckDBPyConnection, file_path: str) -> tuple[list, str, dict]:
+    """describe_file_cached() and cached_profile() in one call on the pool. The profile may be None."""
+    schema_info, read_function = describe_file_cached(con, file_path)
+    return schema_info, read_function, cached_profile(file_path)
+
+
+async def register_files(workspace: Workspace, file_path: str, http_request: Request) -> list:
+    """Register each comma-separated file in the workspace and return the dataset names."""
+    await sync_workspace(workspace, http_request)
 
-            # Create messages with the appropriate system prompt
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": request.query},
-            ]
+    # Split the file paths and process each file
+    file_paths = [path.strip() for path in file_path.split(",")]
 
-            # Call LLM with the specific system prompt
-            headers = {
-                "Authorization": f"Bearer {os.environ['OPENAI_API_KEY']}:querybot",
-            }
-            payload = {
-                "model": request.model,
-                "messages": messages,
-            }
+    # Process each file and create tables in DuckDB
+    dataset_names = []
+    for file_path in file_paths:
+        file_extension = Path(file_path).suffix.lower()
+        multi_file = is_multi_file(file_path)
+        if not multi_file and file_extension not in ['.csv', '.parquet', '.json', '.duckdb', '.xlsx', '.db']:
+            raise QueryError({"error": f"File type {file_extension} is not supported"})
 
-            # Use custom API base URL if provided, otherwise use the default
-            api_base = request.api_base if request.api_base else os.environ['OPENAI_API_BASE']
-            
-            async with httpx.AsyncClient() as client:
-                # Check if the base URL already ends with /chat/completions
-                url = api_base if api_base.endswith("/chat/completions") else f"{api_base}/chat/completions"
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0,
-                )
-                response.raise_for_status()
-                llm_response = response.json()["choices"][0]["message"]["content"]
+        if file_extension in DATABASE_EXTENSIONS and not multi_file:
+            dataset_names += await register_database(workspace, file_path, http_request)
+            continue
 
-            return JSONResponse(content={
-                "llm_response": llm_response
+        # Get dataset name, from the folder for directories and globs
+        if multi_file:
+            dataset_name = dataset_name_for(source_name(file_path))
+        else:
+            dataset_name = dataset_name_for(os.path.splitext(os.path.basename(file_path))[0])
+
+        try:
+            schema_info, read_function, profile = await workspace.run(
+                describe_and_profile, file_path, request=http_request
+            )
+        except (PoolBusy, ClientDisconnected):
+            raise
+        except Exception as e:
+            raise QueryError({"error": f"Error reading file: {str(e)}"})
+
+        register_dataset(workspace, dataset_name, file_path, schema_info, read_function, profile=profile)
+        dataset_names.append(dataset_name)
+
+        # Index new or changed datasets, with sample values and profile notes, for the prompt
+        entry = workspace.catalog.get(dataset_name)
+        columns = [tuple(col[:2]) for col in schema_info]
+        profiled = profile["columns"] if profile else {}
+        notes = {col[0]: column_note(profiled[col[0]], col[1]) for col in schema_info if col[0] in profiled}
+        if multi_file:
+            notes.update(source_index.partition_notes(file_path))
+        if (
+            entry is None
+            or entry["read_function"] != read_function
+            or entry["columns"] != columns
+            or entry["notes"] != notes
+        ):
+            if profile:
+                # The profile's top values stand in for sample values, without scanning the file again
+                samples = {name: column["top_values"] for name, column in profiled.items()}
+            else:
+                try:
+                    samples = await workspace.run(sample_values, read_function, request=http_request)
+                except ClientDisconnected:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Cannot sample {file_path}: {e}")
+                    samples = {}
+            workspace.catalog.add(dataset_name, file_path, read_function, columns, samples, notes=notes)
+            fingerprint = await asyncio.to_thread(file_fingerprint, file_path)
+            await share_dataset(workspace, dataset_name, fingerprint, samples)
+    return dataset_names
+
+
+async def share_dataset(
+    workspace: Workspace, dataset_name: str, fingerprint: str | None, samples: dict, description: str | None = None
+):
+    """Store a dataset in the shared catalog, so the session's requests on other workers see it."""
+    dataset, entry = workspace.datasets[dataset_name], workspace.catalog.get(dataset_name)
+    value = {
+        "read_function": dataset["read_function"],
+        "table": dataset["table"],
+        "columns": entry["columns"],
+        "date_formats": dataset["date_formats"],
+        "samples": samples,
+        "notes": entry["notes"],
+        "description": description,
+    }
+    try:
+        version = await asyncio.to_thread(
+            shared_catalog.put, workspace.session_id, dataset_name, dataset["file_path"], fingerprint, value
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"Cannot share dataset {dataset_name}: {e}")
+        return
+    # Skip reading back our own change, unless another worker changed the session meanwhile
+    if version == workspace.synced_version + 1:
+        workspace.synced_version = version
+
+
+async def unshare_dataset(workspace: Workspace, dataset_name: str):
+    """Remove a dataset from the shared catalog."""
+    try:
+        version = await asyncio.to_thread(shared_catalog.remove, workspace.session_id, dataset_name)
+    except sqlite3.Error as e:
+        logging.warning(f"Cannot remove shared dataset {dataset_name}: {e}")
+        return
+    if version == workspace.synced_version + 1:
+        workspace.synced_version = version
+
+
+def check_shared_datasets(con: duckdb.DuckDBPyConnection, changed: list) -> list:
+    """Return the shared datasets whose files are unchanged, ready to query on `con`.
+
+    Loads the extensions their files need and attaches the databases they come from.
+    """
+    fresh, fingerprints = [], {}
+    for row in changed:
+        file_path = row["file_path"]
+        if file_path not in fingerprints:
+            fingerprints[file_path] = file_fingerprint(file_path)
+        # Changed files are described again when they are next queried
+        if row["fingerprint"] != fingerprints[file_path]:
+            continue
+        load_extensions(con, *extensions_for(file_path))
+        if row["dataset"]["table"]:
+            attach_database(con, file_path)
+        fresh.append(row)
+    return fresh
+
+
+async def sync_workspace(workspace: Workspace, http_request: Request):
+    """Add the datasets the session registered on other workers since this one last synced."""
+    try:
+        version = await asyncio.to_thread(shared_catalog.version, workspace.session_id)
+        if version == workspace.synced_version:
+            return
+        # A lower version means the session was pruned and started again, so read it all
+        since = workspace.synced_version if version > workspace.synced_version else 0
+        version, changed = await asyncio.to_thread(shared_catalog.changes, workspace.session_id, since)
+    except sqlite3.Error as e:
+        logging.warning(f"Cannot read shared catalog: {e}")
+        return
+    for row in changed:
+        if row["deleted"]:
+            workspace.datasets.pop(row["dataset_name"], None)
+            workspace.catalog.remove(row["dataset_name"])
+    changed = [row for row in changed if not row["deleted"]]
+    if changed:
+        try:
+            changed = await workspace.run(check_shared_datasets, changed, request=http_request)
+        except (PoolBusy, ClientDisconnected):
+            raise
+        except Exception as e:
+            logging.warning(f"Cannot restore shared datasets: {e}")
+            changed = []
+    for row in changed:
+        name, file_path, dataset = row["dataset_name"], row["file_path"], row["dataset"]
+        register_dataset(workspace, name, file_path, dataset["columns"], dataset["read_function"], dataset["table"])
+        workspace.datasets[name]["date_formats"] = dataset["date_formats"]
+        workspace.catalog.add(
+            name,
+            file_path,
+            dataset["read_function"],
+            dataset["columns"],
+            dataset["samples"],
+            description=dataset["description"],
+            notes=dataset["notes"],
+        )
+    workspace.synced_version = version
+
+
+def dataset_context(workspace: Workspace, user_query: str, dataset_names: list) -> tuple[str, dict]:
+    """Describe the datasets most relevant to `user_query` for a prompt.
+
+    The requested files are always described. Of the tables in requested database files,
+    only the QUERYBOT_PROMPT_TOP_K most relevant are (or the first ones, if none match).
+    Other registered datasets in the workspace follow, ranked by relevance, within
+    QUERYBOT_PROMPT_TOKEN_BUDGET tokens of schema. Returns the text and statistics on its size.
+    """
+    required = [name for name in dataset_names if not workspace.datasets[name]["table"]]
+    tables = [name for name in dataset_names if workspace.datasets[name]["table"]]
+    if tables:
+        relevant = [name for name, _ in workspace.catalog.search(user_query, PROMPT_TOP_K, names=tables)]
+        required += relevant or tables[:PROMPT_TOP_K]
+    return workspace.catalog.prompt_context(user_query, required)
+
+
+def build_llm_prompt(workspace: Workspace, user_query: str, dataset_names: list) -> tuple[str, dict]:
+    """Ask the LLM for a query answering `user_query`. Returns the prompt and statistics on its size."""
+    dataset_schemas, prompt_stats = dataset_context(workspace, user_query, dataset_names)
+    llm_prompt = (
+        f"Here are the datasets available:\n{dataset_schemas}"
+        f"Please write an duckDB query for the following question:\n{user_query}"
+    )
+    prompt_stats["prompt_tokens"] = estimate_tokens(llm_prompt)
+    logging.info(f"Prompt size: {prompt_stats}")
+    return llm_prompt, prompt_stats
+
+
+def extract_sql_query(llm_response: str) -> str | None:
+    """Extract the SQL query from a fenced code block in the LLM response."""
+    sql_query_match = re.search(r"```sql\n(.*?)\n```", llm_response, re.DOTALL)
+    if not sql_query_match:
+        # Try alternative formats
+        sql_query_match = re.search(r"```\n(.*?)\n```", llm_response, re.DOTALL)
+        if not sql_query_match:
+            return None
+    # Drop trailing semicolons, as queries are wrapped in other statements, e.g. COPY (...)
+    return re.sub(r"[\s;]+$", "", sql_query_match.group(1).strip())
+
+
+def rewrite_sql_query(workspace: Workspace, sql_query: str, dataset_names: list) -> str:
+    """Quote column names and fix common DuckDB incompatibilities in generated SQL."""
+    # Quote the column names of the queried datasets
+    sql_query = quote_columns(sql_query, [workspace.datasets[name]["column_trie"] for name in dataset_names])
+
+    # Fix common date syntax issues in DuckDB
+    # Columns with a known date format are parsed with that format first, and date columns
+    # are only cast. Others are tried against several formats, which is slower on every row
+    formats = {}
+    for name in dataset_names:
+        formats.update(workspace.datasets[name]["date_formats"])
+
+    def parse_date(column: str) -> str:
+        column = column.strip()
+        name = column.strip('"')
+        if name in formats:
+            if formats[name] is None:
+                return f"CAST({column} AS DATE)"
+            # The format was detected on the first rows; later ones may use another
+            return parse_date_sql(column, formats[name], "DATE", fallback=True)
+        return f"STRPTIME({column}, ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%Y/%m/%d', '%d/%m/%Y', '%m-%d-%Y', '%d.%m.%Y', '%Y.%m.%d'])"
+
+    # Replace DATE() function with STRPTIME
+    date_func_pattern = r'DATE\s*\(\s*\[?([^)\]]+)\]?\s*\)'
+    sql_query = re.sub(date_func_pattern, lambda match: parse_date(match.group(1)), sql_query)
+
+    # Replace julianday() function with proper DuckDB date diff
+    julianday_pattern = r'julianday\s*\(\s*\[?([^)\]]+)\]?\s*\)\s*-\s*julianday\s*\(\s*\[?([^)\]]+)\]?\s*\)'
+    sql_query = re.sub(
+        julianday_pattern,
+        lambda match: f"DATE_DIFF('day', {parse_date(match.group(2))}, {parse_date(match.group(1))})",
+        sql_query,
+    )
+
+    # Replace CAST to INTEGER with string comparison for invoice numbers
+    invoice_cast_pattern = r'CAST\s*\(\s*([^)]+)\s*AS\s*INTEGER\s*\)'
+    sql_query = re.sub(invoice_cast_pattern, r'\1', sql_query)
+
+    # Log the extracted SQL query (for debugging)
+    logging.info(f"Extracted SQL Query: {sql_query}")
+    return sql_query
+
+
+def result_cache_key(sql_query: str, datasets: dict) -> str | None:
+    """Key a query by its normalized SQL and the fingerprints of the files it reads.
+
+    Returns None if the query must not be cached: it calls volatile functions, or
+    reads a file that cannot be fingerprinted.
+    """
+    if VOLATILE_SQL.search(sql_query):
+        return None
+    file_paths = set(SOURCE_PATH_SQL.findall(sql_query))
+    file_paths |= {dataset["file_path"] for dataset in datasets.values() if dataset["read_function"] in sql_query}
+    fingerprints = []
+    for file_path in sorted(file_paths):
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint is None:
+            return None
+        fingerprints.append([file_path, fingerprint])
+    return json.dumps([normalize_sql(sql_query), fingerprints])
+
+
+def execute_paged(
+    con: duckdb.DuckDBPyConnection,
+    sql_query: str,
+    datasets: dict,
+    use_cache: bool = True,
+    cache_query: str | None = None,
+) -> tuple:
+    """Run a query and return its first page, total row count, spilled result ID, cache status and warnings.
+
+    The full result is spilled to Parquet so later pages can be served without
+    re-running the query. Statements that cannot be spilled return at most
+    RESULT_MAX_ROWS rows, with a row count of None if there were more. The cache
+    status is "hit", "miss", or None if the result was not cacheable. Warnings come
+    from the pre-flight check of the query plan, which may also reject the query.
+    If `sql_query` reads tables copied from files, `cache_query` is the same query on the files.
+    """
+    key = result_cache_key(cache_query or sql_query, datasets) if use_cache else None
+    if key is not None:
+        cached = result_cache.get(con, key, RESULT_MAX_ROWS)
+        CACHE_LOOKUPS.inc(cache="result", outcome="miss" if cached is None else "hit")
+        if cached is not None:
+            return *cached, "hit", []
+    warnings = preflight(con, sql_query)
+    try:
+        result_id, row_count = results.spill(con, sql_query)
+    except UNSPILLABLE_ERRORS:
+        result, truncated = fetch_first_rows(con, sql_query, RESULT_MAX_ROWS)
+        return result, None if truncated else len(result), None, None, warnings
+    result, _ = results.page(con, result_id, 0, RESULT_MAX_ROWS)
+    if key is None:
+        return result, row_count, result_id, None, warnings
+    result_cache.set(key, result, row_count, result_id)
+    return result, row_count, result_id, "miss", warnings
+
+
+def result_serializer(result_format: str):
+    return dataframe_to_rows if result_format == "columns" else dataframe_to_records
+
+
+async def approximate_query(sql_query: str, datasets: dict, dataset_names: list) -> tuple[str, dict]:
+    """Rewrite `sql_query` to read samples of the queried datasets, and describe the samples.
+
+    Datasets with an up-to-date sample table read it; others read a QUERYBOT_SAMPLE_PERCENT
+    Bernoulli sample of the file while their sample table is built in the background.
+    COUNT and SUM are scaled up to estimate totals when only one dataset is sampled and
+    no aggregate reads another's results.
+    """
+    replacements, samples = {}, []
+    for name in dataset_names:
+        dataset = datasets[name]
+        if dataset["read_function"] not in sql_query or dataset["read_function"] in replacements:
+            continue
+        # Samples are built per file, so database tables are always sampled inline
+        # Fingerprinting a URL sends a HEAD request, so keep it off the event loop
+        fingerprint = None if dataset["table"] else await asyncio.to_thread(file_fingerprint, dataset["file_path"])
+        entry = await asyncio.to_thread(sample_store.lookup, dataset["file_path"], fingerprint) if fingerprint else None
+        if entry:
+            replacements[dataset["read_function"]] = f"read_parquet('{entry['path']}')"
+            samples.append({
+                "dataset_name": name,
+                "sample": "table",
+                "sample_rate": entry["sample_rows"] / entry["total_rows"] if entry["total_rows"] else 1.0,
+                "sample_rows": entry["sample_rows"],
+                "total_rows": entry["total_rows"],
+                "relative_error": error_bound(entry["sample_rows"], entry["total_rows"]),
             })
+            continue
+        if fingerprint:
+            sample_store.submit(dataset["file_path"])
+        replacements[dataset["read_function"]] = (
+            f"(SELECT * FROM {dataset['read_function']} USING SAMPLE {SAMPLE_PERCENT}% (bernoulli, 42))"
+        )
+        # The number of sampled rows is not known until the query runs
+        samples.append({
+            "dataset_name": name,
+            "sample": "inline",
+            "sample_rate": SAMPLE_PERCENT / 100,
+            "sample_rows": None,
+            "total_rows": None,
+            "relative_error": None,
+        })
+    scale = None
+    # Aggregates of aggregated rows (e.g. SUM over a grouped CTE) are left unscaled
+    if len(samples) == 1 and 0 < samples[0]["sample_rate"] < 1 and not stacked_aggregates(sql_query):
+        scale = round(1 / samples[0]["sample_rate"], 6)
+    return approximate_sql(sql_query, replacements, scale), {"samples": samples, "scale": scale}
+
+
+def page_content(result, row_count, result_id, cache_status, result_format: str) -> dict:
+    """Return the first page of a result from execute_paged as /query response fields."""
+    if row_count is not None:
+        RESULT_ROWS.observe(row_count)
+    result_dict, rows = fit_page(result, result_serializer(result_format))
+    if result_id and rows >= row_count:
+        # Cached results keep their file until it expires
+        if cache_status is None:
+            results.discard(result_id)
+        result_id = None
+    return {
+        "result": result_dict,
+        "row_count": row_count,
+        "truncated": row_count is None or rows < row_count,
+        "result_id": result_id,
+        "next_offset": rows if result_id else None,
+        "result_cache": cache_status,
+    }
 
-        # Split the file paths and process each file
-        file_paths = [path.strip() for path in request.file_path.split(",")]
 
-        # Define dtype_mapping for DuckDB
-        dtype_mapping = {
-            "object": "TEXT",
-            "int64": "INTEGER",
-            "float64": "FLOAT",
-            "bool": "BOOLEAN",
-            "datetime64[ns]": "DATETIME",
-        }
+def start_refinement(workspace: Workspace, sql_query: str, request: "QueryRequest") -> str:
+    """Run the exact `sql_query` in the background and return the ID to poll its result with."""
+    refinement_id = uuid.uuid4().hex
+    refinement = {"refinement_id": refinement_id, "status": "running", "generated_query": sql_query}
+    refinements.set(refinement_id, refinement)
 
-        # Process each file and create tables in DuckDB
-        for file_path in file_paths:
-            file_extension = Path(file_path).suffix.lower()
-            if file_extension not in ['.csv', '.parquet', '.json', '.duckdb', '.xlsx', '.db']:
-                return JSONResponse(
-                    content={"error": f"File type {file_extension} is not supported"}, 
-                    status_code=400
+    async def refine():
+        started = time.time()
+        try:
+            async with query_limiter.slot():
+                result, row_count, result_id, cache_status, warnings = await workspace.run(
+                    execute_paged, sql_query, workspace.datasets, request.use_cache, timeout=QUERY_TIMEOUT
                 )
-            
-            # Get dataset name
-            dataset_name = os.path.splitext(os.path.basename(file_path))[0]
-            dataset_name = re.sub(r'[^a-zA-Z0-9_]', '_', dataset_name)
-            if dataset_name[0].isdigit():
-                dataset_name = f"t_{dataset_name}"
+            content = page_content(result, row_count, result_id, cache_status, request.result_format)
+            refinement.update(status="done", warnings=warnings, **content)
+        except Exception as e:
+            logging.error(f"Error refining approximate query: {e}")
+            refinement.update(status="error", error=str(e))
+        finally:
+            refinement["elapsed"] = round(time.time() - started, 3)
 
-            try:
-                # Get schema without creating table
-                if file_extension in ['.csv', '.txt']:
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM read_csv_auto('{file_path}') LIMIT 0").fetchall()
-                    read_function = f"read_csv_auto('{file_path}')"
-                elif file_extension == '.parquet':
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM read_parquet('{file_path}') LIMIT 0").fetchall()
-                    read_function = f"read_parquet('{file_path}')"
-                elif file_extension == '.json':
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM read_json_auto('{file_path}') LIMIT 0").fetchall()
-                    read_function = f"read_json_auto('{file_path}')"
-                elif file_extension == '.xlsx':
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM read_excel('{file_path}') LIMIT 0").fetchall()
-                    read_function = f"read_excel('{file_path}')"
-                elif file_extension == '.db':
-                    # First attach the SQLite database
-                    con.execute(f"INSTALL sqlite")
-                    con.execute(f"LOAD sqlite")
-                    # Get list of tables directly from SQLite file
-                    tables = con.execute(f"SELECT name FROM sqlite_scan('{file_path}', 'sqlite_master') WHERE type='table'").fetchall()
-                    if not tables:
-                        raise ValueError("No tables found in SQLite database")
-                    table_name = tables[0][0]
-                    # Use sqlite_scan directly without attaching
-                    read_function = f"sqlite_scan('{file_path}', '{table_name}')"
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM {read_function} LIMIT 0").fetchall()
-                elif file_extension == '.duckdb':
-                    con.execute(f"ATTACH '{file_path}' AS remote_db")
-                    tables = con.execute("SELECT name FROM remote_db.sqlite_master WHERE type='table'").fetchall()
-                    if not tables:
-                        raise ValueError("No tables found in DuckDB database")
-                    table_name = tables[0][0]
-                    schema_info = con.execute(f"DESCRIBE SELECT * FROM remote_db.{table_name} LIMIT 0").fetchall()
-                    read_function = f"remote_db.{table_name}"
-            except Exception as e:
-                return JSONResponse(
-                    content={"error": f"Error reading file: {str(e)}"}, 
-                    status_code=400
-                )
-            
-            schema_description = (
-                f"CREATE TABLE {dataset_name} (\n"
-                + ",\n".join([f"[{col[0]}] {col[1]}" for col in schema_info])
-                + "\n);"
-            )
+    task = asyncio.ensure_future(refine())
+    refinement_tasks.add(task)
+    task.add_done_callback(refinement_tasks.discard)
+    return refinement_id
 
-            # Store dataset info with file path
-            datasets[dataset_name] = {
-                "schema_description": schema_description,
-                "file_path": file_path,
-                "read_function": read_function
-            }
 
-        # Rest of your existing query_data logic
-        dataset_schemas = ""
-        for name, dataset in datasets.items():
-            schema_description = dataset.get("schema_description")
-            file_path = dataset.get("file_path")
-            read_function = dataset.get("read_function")
-            if schema_description and isinstance(schema_description, str):
-                dataset_schemas += f"Dataset name: {name}\nFile path: {file_path}\nSchema: {schema_description}\nNote: Use {read_function} in queries\n\n"
+@app.post("/query")
+async def query_data(request: QueryRequest, http_request: Request):
+    try:
+        # Handle explanation requests differently
+        if request.is_explanation:
+            # Use the system prompt provided in the request for explanations
+            llm_response = await call_llm_system_prompt(
+                request.query,
+                request.model,
+                request.api_base,
+                request.system_prompt,
+                request.use_cache,
+            )
 
-        # User query
-        user_query = request.query
+            return JSONResponse(content={
+                "llm_response": llm_response
+            })
+
+        workspace = get_workspace(http_request)
+        with timed("register"):
+            dataset_names = await register_files(workspace, request.file_path, http_request)
 
         # Construct LLM prompt
-        llm_prompt = (
-            f"Here are the datasets available:\n{dataset_schemas}"
-            f"Please write an duckDB query for the following question:\n{user_query}"
-        )
+        with timed("prompt"):
+            llm_prompt, prompt_stats = build_llm_prompt(workspace, request.query, dataset_names)
 
         # Call LLM with the prompt
-        llm_response = await call_llm_system_prompt(
-            llm_prompt, 
-            request.model, 
-            request.api_base,
-            request.system_prompt
-        )
+        with timed("llm"):
+            llm_response = await call_llm_system_prompt(
+                llm_prompt,
+                request.model,
+                request.api_base,
+                request.system_prompt,
+                request.use_cache,
+            )
 
         # Extract the SQL query from the response
-        sql_query_match = re.search(r"```sql\n(.*?)\n```", llm_response, re.DOTALL)
-        if not sql_query_match:
-            # Try alternative formats
-            sql_query_match = re.search(r"```\n(.*?)\n```", llm_response, re.DOTALL)
-            if not sql_query_match:
-                return JSONResponse(content={
-                    "error": "Failed to extract SQL query from the LLM response.",
-                    "llm_response": llm_response,  # Include the full response for debugging
-                    "prompt_used": llm_prompt  # Include the prompt that was used
-                }, status_code=400)
-
-        sql_query = sql_query_match.group(1).strip()
-        
-        # Process the SQL query to properly quote column names
-        sql_query = process_sql_query(sql_query, schema_info)
-        
-        # Fix common date syntax issues in DuckDB
-        # Replace DATE() function with STRPTIME for multiple date formats
-        date_func_pattern = r'DATE\s*\(\s*\[?([^)\]]+)\]?\s*\)'
-        sql_query = re.sub(date_func_pattern, r"STRPTIME(\1, ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%Y/%m/%d', '%d/%m/%Y', '%m-%d-%Y', '%d.%m.%Y', '%Y.%m.%d'])", sql_query)
-        
-        # Replace julianday() function with proper DuckDB date diff
-        julianday_pattern = r'julianday\s*\(\s*\[?([^)\]]+)\]?\s*\)\s*-\s*julianday\s*\(\s*\[?([^)\]]+)\]?\s*\)'
-        sql_query = re.sub(julianday_pattern, r"DATE_DIFF('day', STRPTIME(\2, ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%Y/%m/%d', '%d/%m/%Y', '%m-%d-%Y', '%d.%m.%Y', '%Y.%m.%d']), STRPTIME(\1, ['%Y-%m-%d', '%d-%m-%Y', '%m/%d/%Y', '%Y/%m/%d', '%d/%m/%Y', '%m-%d-%Y', '%d.%m.%Y', '%Y.%m.%d']))", sql_query)
-        
-        # Replace CAST to INTEGER with string comparison for invoice numbers
-        invoice_cast_pattern = r'CAST\s*\(\s*([^)]+)\s*AS\s*INTEGER\s*\)'
-        sql_query = re.sub(invoice_cast_pattern, r'\1', sql_query)
-        
-        # Log the extracted SQL query (for debugging)
-        print(f"Extracted SQL Query: {sql_query}")
+        with timed("rewrite"):
+            sql_query = extract_sql_query(llm_response)
+        if sql_query is None:
+            return JSONResponse(content={
+                "error": "Failed to extract SQL query from the LLM response.",
+                "llm_response": llm_response,  # Include the full response for debugging
+                "prompt_used": llm_prompt  # Include the prompt that was used
+            }, status_code=400)
+        with timed("rewrite"):
+            sql_query = rewrite_sql_query(workspace, sql_query, prompt_stats["datasets"])
+            exact_query, approximation = sql_query, None
+            if request.mode == "approximate":
+                sql_query, approximation = await approximate_query(sql_query, workspace.datasets, dataset_names)
 
         # Execute the generated SQL query
         try:
-            result = con.execute(sql_query).fetchdf()
+            with timed("execute"):
+                async with query_limiter.slot():
+                    result, row_count, result_id, cache_status, warnings = await workspace.run(
+                        execute_paged,
+                        sql_query,
+                        workspace.datasets,
+                        request.use_cache,
+                        request=http_request,
+                        timeout=QUERY_TIMEOUT,
+                    )
+        except (PoolBusy, ClientDisconnected):
+            raise
         except Exception as query_error:
             # No need for special date handling anymore
             return JSONResponse(content={
@@ -545,30 +1469,9 @@ async def query_data(request: QueryRequest):
                 "llm_response": llm_response
             }, status_code=400)
 
-        # Convert any non-JSON serializable types to compatible formats
-        result = result.apply(
-            lambda col: col.map(lambda x: x.tolist() if isinstance(x, np.ndarray) else x)
-        )
-        
-        # Handle non-JSON-compliant float values (NaN, inf) and Timestamp objects
-        def sanitize_json_value(x):
-            if isinstance(x, float) and (math.isnan(x) or math.isinf(x)):
-                return None
-            if isinstance(x, (pd.Timestamp, pd._libs.tslibs.timestamps.Timestamp)):
-                return x.isoformat()
-            return x
-            
-        # Use map instead of applymap as per deprecation warning
-        for col in result.columns:
-            result[col] = result[col].map(sanitize_json_value)
-        
-        # Convert to dict and ensure all NaN values are handled
-        result_dict = result.to_dict(orient="records")
-        for row in result_dict:
-            for key, value in row.items():
-                if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-                    row[key] = None
-        
+        if approximation is not None and request.refine:
+            approximation["refinement_id"] = start_refinement(workspace, exact_query, request)
+
         # Respond with the results
         if isinstance(llm_response, float):
             if (
@@ -577,14 +1480,23 @@ async def query_data(request: QueryRequest):
                 or (isinstance(llm_response, float) and llm_response != llm_response)
             ):
                 llm_response = None  # or set to 0, depending on your needs
-        return JSONResponse(
-            content={
-                "result": result_dict,
-                "generated_query": sql_query,
-                "llm_response": llm_response
-            }
-        )
+        with timed("serialize"):
+            page = page_content(result, row_count, result_id, cache_status, request.result_format)
+            return FastJSONResponse(
+                content={
+                    **page,
+                    "generated_query": sql_query,
+                    "llm_response": llm_response,
+                    "prompt": prompt_stats,
+                    "warnings": warnings,
+                    "approximate": approximation,
+                }
+            )
 
+    except QueryError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+    except PoolBusy as e:
+        return busy_response(e)
     except Exception as e:
         return JSONResponse(content={
             "error": str(e),
@@ -594,6 +1506,347 @@ async def query_data(request: QueryRequest):
         }, status_code=400)
 
 
+def build_batch_prompt(workspace: Workspace, questions: list, dataset_names: list) -> tuple[str, dict]:
+    """Ask the LLM for one query per question, with the datasets relevant to any of them described once."""
+    dataset_schemas, prompt_stats = dataset_context(workspace, "\n".join(questions), dataset_names)
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+    llm_prompt = (
+        f"Here are the datasets available:\n{dataset_schemas}"
+        f"Please write a duckDB query for each of the following {len(questions)} questions. "
+        "Answer each under a heading `Question <number>`, with its query in a ```sql code block.\n"
+        f"{numbered}"
+    )
+    prompt_stats["prompt_tokens"] = estimate_tokens(llm_prompt)
+    return llm_prompt, prompt_stats
+
+
+def split_batch_response(llm_response: str, count: int) -> list:
+    """Return the part of a batched LLM response that answers each of `count` questions, or None."""
+    sections = [None] * count
+    parts = re.split(r"^[#*\s]*Question\s+(\d+)\b.*$", llm_response, flags=re.MULTILINE | re.IGNORECASE)
+    for number, section in zip(parts[1::2], parts[2::2]):
+        i = int(number) - 1
+        if 0 <= i < count and sections[i] is None:
+            sections[i] = section.strip()
+    # Without headings, match code blocks to questions only if there is one per question
+    if not any(sections):
+        blocks = re.findall(r"```sql\n.*?\n```", llm_response, re.DOTALL)
+        if len(blocks) == count:
+            sections = blocks
+    return sections
+
+
+def materialize_sources(
+    con: duckdb.DuckDBPyConnection, queries: list, datasets: dict, schema: str, use_cache: bool
+) -> dict:
+    """Copy files that several `queries` read into tables in `schema`, so each is parsed once.
+
+    Only local, non-Parquet files up to QUERYBOT_BATCH_MATERIALIZE_BYTES count, and queries
+    whose results are cached do not. Returns the table to read instead of each read function.
+    """
+    pending = [
+        sql for sql in queries
+        if not (use_cache and (key := result_cache_key(sql, datasets)) and key in result_cache)
+    ]
+    tables = {}
+    for name, dataset in datasets.items():
+        read_function = dataset["read_function"]
+        if dataset["table"] or read_function.startswith("read_parquet(") or read_function in tables:
+            continue
+        # The files of directories and globs are not counted against the size limit
+        if is_multi_file(dataset["file_path"]):
+            continue
+        if sum(read_function in sql for sql in pending) < 2:
+            continue
+        try:
+            if os.path.getsize(dataset["file_path"]) > BATCH_MATERIALIZE_BYTES:
+                continue
+        except OSError:
+            continue
+        con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        con.execute(f"CREATE TABLE {schema}.{name} AS SELECT * FROM {read_function}")
+        tables[read_function] = f"{schema}.{name}"
+    return tables
+
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest, http_request: Request):
+    """Answer many questions about the same files with a few LLM calls and one scan of each file.
+
+    Questions go to the LLM `batch_size` at a time, in concurrent calls; any the LLM
+    skips are asked again one by one. Files that several queries read are loaded into a
+    table once, and the queries then run concurrently. Returns `results` in question
+    order, each with the /query fields and `query`, or an `error`.
+    """
+    if not request.queries:
+        return JSONResponse(content={"error": "No questions given"}, status_code=400)
+    if len(request.queries) > BATCH_MAX:
+        return JSONResponse(content={"error": f"At most {BATCH_MAX} questions per batch"}, status_code=400)
+    workspace = get_workspace(http_request)
+    try:
+        with timed("register"):
+            dataset_names = await register_files(workspace, request.file_path, http_request)
+    except QueryError as e:
+        return JSONResponse(content=e.content, status_code=e.status_code)
+    except PoolBusy as e:
+        return busy_response(e)
+
+    questions = request.queries
+    size = max(1, request.batch_size)
+
+    async def ask(chunk: list) -> tuple[list, dict]:
+        llm_prompt, prompt_stats = build_batch_prompt(workspace, chunk, dataset_names)
+        llm_response = await call_llm_system_prompt(
+            llm_prompt, request.model, request.api_base, request.system_prompt, request.use_cache
+        )
+        return split_batch_response(llm_response, len(chunk)), prompt_stats
+
+    async def ask_one(question: str) -> str:
+        llm_prompt, _ = build_llm_prompt(workspace, question, dataset_names)
+        return await call_llm_system_prompt(
+            llm_prompt, request.model, request.api_base, request.system_prompt, request.use_cache
+        )
+
+    answers, prompt_datasets = [], []
+    try:
+        with timed("llm"):
+            chunks = [questions[i:i + size] for i in range(0, len(questions), size)]
+            for sections, prompt_stats in await asyncio.gather(*(ask(chunk) for chunk in chunks)):
+                answers += sections
+                prompt_datasets += [name for name in prompt_stats["datasets"] if name not in prompt_datasets]
+            missing = [i for i, answer in enumerate(answers) if not answer or extract_sql_query(answer) is None]
+            for i, llm_response in zip(missing, await asyncio.gather(*(ask_one(questions[i]) for i in missing))):
+                answers[i] = llm_response
+    except Exception as e:
+        return JSONResponse(content={"error": f"Error calling LLM: {e}"}, status_code=400)
+
+    items = []
+    with timed("rewrite"):
+        for question, llm_response in zip(questions, answers):
+            item = {"query": question, "llm_response": llm_response, "generated_query": None}
+            sql_query = extract_sql_query(llm_response or "")
+            if sql_query is None:
+                item["error"] = "Failed to extract SQL query from the LLM response."
+            else:
+                item["generated_query"] = rewrite_sql_query(workspace, sql_query, prompt_datasets)
+            items.append(item)
+    queries = [item["generated_query"] for item in items if item["generated_query"]]
+
+    # Tables live in the workspace database, not a cursor's temp schema, so every cursor sees them
+    schema = f"batch_{uuid.uuid4().hex[:12]}"
+    tables = {}
+    try:
+        if request.materialize and len(queries) > 1:
+            with timed("materialize"):
+                async with query_limiter.slot():
+                    tables = await workspace.run(
+                        materialize_sources,
+                        queries,
+                        workspace.datasets,
+                        schema,
+                        request.use_cache,
+                        request=http_request,
+                        timeout=QUERY_TIMEOUT,
+                    )
+
+        async def execute(item: dict):
+            sql_query = item["generated_query"]
+            for read_function, table in tables.items():
+                sql_query = sql_query.replace(read_function, table)
+            try:
+                async with query_limiter.slot():
+                    outcome = await workspace.run(
+                        execute_paged,
+                        sql_query,
+                        workspace.datasets,
+                        request.use_cache,
+                        item["generated_query"],
+                        request=http_request,
+                        timeout=QUERY_TIMEOUT,
+                    )
+            except ClientDisconnected:
+                raise
+            except PoolBusy as e:
+                item["error"] = f"Server busy, please retry: {e}"
+                return
+            except Exception as e:
+                item["error"] = f"Error executing query: {e}"
+                return
+            result, row_count, result_id, cache_status, warnings = outcome
+            item.update(page_content(result, row_count, result_id, cache_status, request.result_format))
+            item["warnings"] = warnings
+
+        with timed("execute"):
+            await asyncio.gather(*(execute(item) for item in items if item["generated_query"]))
+    except PoolBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    finally:
+        if tables:
+            try:
+                await workspace.run(lambda con: con.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            except Exception as e:
+                logging.warning(f"Cannot drop batch tables {schema}: {e}")
+
+    materialized = [name for name, dataset in workspace.datasets.items() if dataset["read_function"] in tables]
+    return FastJSONResponse(
+        content={
+            "results": items,
+            "prompt": {"datasets": prompt_datasets, "llm_calls": len(chunks) + len(missing)},
+            "materialized": materialized,
+        }
+    )
+
+
+@app.get("/query/{result_id}/page")
+async def query_page(
+    result_id: str,
+    offset: int = 0,
+    limit: int = RESULT_MAX_ROWS,
+    result_format: Literal["records", "columns"] = "records",
+):
+    """Return the next page of a result from /query, starting at `offset`."""
+    limit = max(1, min(limit, RESULT_MAX_ROWS))
+    try:
+        result, row_count = await pool.run(results.page, result_id, max(0, offset), limit)
+    except KeyError:
+        return JSONResponse(content={"error": f"Result {result_id} has expired or does not exist"}, status_code=404)
+    except PoolBusy as e:
+        return busy_response(e)
+    result_dict, rows = fit_page(result, result_serializer(result_format))
+    next_offset = offset + rows
+    return FastJSONResponse(content={
+        "result": result_dict,
+        "row_count": row_count,
+        "result_id": result_id,
+        "offset": offset,
+        "next_offset": next_offset if next_offset < row_count else None,
+    })
+
+
+@app.get("/query/refine/{refinement_id}")
+async def query_refinement(refinement_id: str):
+    """Return the status of an approximate /query's exact refinement, and its result when done."""
+    refinement = refinements.get(refinement_id)
+    if refinement is None:
+        return JSONResponse(
+            content={"error": f"Refinement {refinement_id} has expired or does not exist"}, status_code=404
+        )
+    return FastJSONResponse(content=refinement)
+
+
+@app.post("/query/stream")
+async def query_data_stream(request: QueryRequest, http_request: Request):
+    """Like /query, but stream newline-delimited JSON events as results become available.
+
+    Events are `{"type": "prompt", ...}` with the prompt size, then
+    `{"type": "token", "content"}` for each piece of the LLM response, then
+    `{"type": "sql", "generated_query"}` (with `approximate` in approximate mode),
+    `{"type": "warning", "warnings"}` if the query plan looks expensive,
+    `{"type": "rows", "columns", "rows"}` for each batch of results, and finally
+    `{"type": "done", "row_count"}`. Failures send
+    `{"type": "error", "error", ...}` and end the stream.
+    """
+
+    def event(**content) -> bytes:
+        return dumps(content) + b"\n"
+
+    workspace = get_workspace(http_request)
+
+    async def events():
+        llm_response = None
+        try:
+            if request.is_explanation:
+                llm_prompt = request.query
+            else:
+                with timed("register"):
+                    dataset_names = await register_files(workspace, request.file_path, http_request)
+                with timed("prompt"):
+                    llm_prompt, prompt_stats = build_llm_prompt(workspace, request.query, dataset_names)
+                yield event(type="prompt", **prompt_stats)
+
+            llm_chunks = []
+            with timed("llm"):
+                async for content in stream_llm_system_prompt(
+                    llm_prompt, request.model, request.api_base, request.system_prompt, request.use_cache
+                ):
+                    llm_chunks.append(content)
+                    yield event(type="token", content=content)
+            llm_response = "".join(llm_chunks)
+            if request.is_explanation:
+                yield event(type="done", row_count=0)
+                return
+
+            with timed("rewrite"):
+                sql_query = extract_sql_query(llm_response)
+            if sql_query is None:
+                yield event(
+                    type="error",
+                    error="Failed to extract SQL query from the LLM response.",
+                    llm_response=llm_response,
+                    prompt_used=llm_prompt,
+                )
+                return
+            with timed("rewrite"):
+                sql_query = rewrite_sql_query(workspace, sql_query, prompt_stats["datasets"])
+            if request.mode == "approximate":
+                exact_query = sql_query
+                sql_query, approximation = await approximate_query(sql_query, workspace.datasets, dataset_names)
+                if request.refine:
+                    approximation["refinement_id"] = start_refinement(workspace, exact_query, request)
+                yield event(type="sql", generated_query=sql_query, approximate=approximation)
+            else:
+                yield event(type="sql", generated_query=sql_query)
+
+            row_count, truncated = 0, False
+            try:
+                with timed("execute"):
+                    async with query_limiter.slot():
+                        warnings = await workspace.run(preflight, sql_query, request=http_request)
+                    if warnings:
+                        yield event(type="warning", warnings=warnings)
+                    # Hold a query slot only while DuckDB fetches each chunk, not while a slow
+                    # client reads it, so slow readers don't starve other queries of slots
+                    chunks = workspace.stream(sql_query, request=http_request, timeout=QUERY_TIMEOUT)
+                    try:
+                        while True:
+                            async with query_limiter.slot():
+                                chunk = await anext(chunks, None)
+                            if chunk is None:
+                                break
+                            # Stop streaming once the row limit for a response is reached
+                            if row_count + len(chunk) > RESULT_MAX_ROWS:
+                                chunk, truncated = chunk.iloc[:RESULT_MAX_ROWS - row_count], True
+                            row_count += len(chunk)
+                            if request.result_format == "columns":
+                                yield event(type="rows", **dataframe_to_rows(chunk))
+                            else:
+                                yield event(type="rows", columns=list(chunk.columns), rows=dataframe_to_records(chunk))
+                            if truncated:
+                                break
+                    finally:
+                        await chunks.aclose()
+            except (PoolBusy, ClientDisconnected):
+                raise
+            except Exception as query_error:
+                yield event(
+                    type="error",
+                    error=f"Error executing query: {str(query_error)}",
+                    generated_query=sql_query,
+                    llm_response=llm_response,
+                )
+                return
+            RESULT_ROWS.observe(row_count)
+            yield event(type="done", row_count=row_count, truncated=truncated)
+        except QueryError as e:
+            yield event(type="error", **e.content)
+        except Exception as e:
+            yield event(type="error", error=str(e), llm_response=llm_response)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 class SettingsRequest(BaseModel):
     key: str
     base: str
@@ -601,11 +1854,13 @@ class SettingsRequest(BaseModel):
 
 @app.post("/settings")
 async def save_settings(request: SettingsRequest):
-    # Save the settings to the environment variables
-    os.environ["OPENAI_API_KEY"] = request.key
-    os.environ["OPENAI_API_BASE"] = request.base
-    with open(os.path.join(config_dir, "settings.json"), "w") as f:
+    # Save the settings where every worker reads them, then apply them to this one
+    os.makedirs(config_dir, exist_ok=True)
+    tmp_path = f"{settings_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump({"OPENAI_API_KEY": request.key, "OPENAI_API_BASE": request.base}, f)
+    os.replace(tmp_path, settings_path)
+    load_settings()
     return {"status": "Settings saved successfully"}
 
 
@@ -622,15 +1877,14 @@ def main():
 
     if not os.path.exists(config_dir):
         os.makedirs(config_dir)
-    if os.path.exists(os.path.join(config_dir, "settings.json")):
-        with open(os.path.join(config_dir, "settings.json"), "r") as f:
-            for key, value in json.load(f).items():
-                os.environ[key] = value
+    load_settings()
+    # Several workers need an import string, so each worker process imports the app itself
+    target = app if WORKERS == 1 else "querybot.app:app"
     try:
-        uvicorn.run(app, host="0.0.0.0", port=PORT)
+        uvicorn.run(target, host="0.0.0.0", port=PORT, workers=WORKERS)
     except BaseException as e:
         logger.error(f"Running locally. Cannot be accessed from outside: {e}")
-        uvicorn.run(app, host="127.0.0.1", port=PORT)
+        uvicorn.run(target, host="127.0.0.1", port=PORT, workers=WORKERS)
 
 
 if __name__ == "__main__":
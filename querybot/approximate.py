@@ -0,0 +1,225 @@
+import asyncio
+import duckdb
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from querybot.cache import file_fingerprint
+from querybot.sql import PROTECTED_SQL
+
+# Rows kept in each sample, and the percentage of rows read while it is being built
+SAMPLE_ROWS = int(os.getenv("QUERYBOT_SAMPLE_ROWS", 100_000))
+SAMPLE_PERCENT = float(os.getenv("QUERYBOT_SAMPLE_PERCENT", 10))
+
+# Exact aggregates replaced by their approximate versions
+APPROXIMATE_FUNCTIONS = [
+    (re.compile(r"\bCOUNT\s*\(\s*DISTINCT\s+", re.I), "approx_count_distinct("),
+    (re.compile(r"\b(?:QUANTILE_CONT|QUANTILE_DISC|QUANTILE)\s*\(", re.I), "approx_quantile("),
+]
+# Aggregates that grow with the number of rows, so must be scaled up from a sample
+SCALED_AGGREGATES = re.compile(r"\b(COUNT|SUM)\s*\((?!\s*DISTINCT\b)", re.I)
+# Calls and clauses that collapse rows, used to find queries that aggregate aggregated rows
+AGGREGATES = re.compile(
+    r"\b(?:COUNT|SUM|AVG|MIN|MAX|MEDIAN|MODE|PRODUCT|STDDEV\w*|VAR\w*|QUANTILE\w*|approx_\w+"
+    r"|STRING_AGG|LIST|ARRAY_AGG|ARG_MIN|ARG_MAX|BOOL_AND|BOOL_OR|FIRST|LAST|HISTOGRAM)(?=\s*\()"
+    r"|\bGROUP\s+BY\b",
+    re.I,
+)
+SCOPE_TOKENS = re.compile(r"\(|\)|\bSELECT\b|" + AGGREGATES.pattern, re.I)
+# Clauses that belong to the aggregate call before them: FILTER (...), OVER (...) or OVER name
+AGGREGATE_CLAUSE = re.compile(r"\s*(?:(?:FILTER|OVER)\s*(\()|OVER\s+\w+)", re.I)
+
+
+class SampleStore:
+    """Uniform samples of source files, stored as Parquet under `directory`.
+
+    Each sample holds up to `rows` rows picked with reservoir sampling, and is reused
+    until the source file's fingerprint changes.
+    """
+
+    def __init__(self, directory: str, pool, describe, rows: int = SAMPLE_ROWS):
+        self.directory = directory
+        self.pool = pool
+        self.describe = describe
+        self.rows = rows
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = {}
+        self.jobs = {}
+        self.tasks = set()
+        try:
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable sample manifest {self.manifest_path}: {e}")
+
+    def lookup(self, file_path: str, fingerprint: str) -> dict | None:
+        """Return the sample's `path`, `sample_rows` and `total_rows` if it is up to date."""
+        entry = self.manifest.get(file_path)
+        if entry and entry["fingerprint"] == fingerprint and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    def submit(self, file_path: str) -> dict:
+        """Start building a sample of `file_path` in the background and return its job status."""
+        job = self.jobs.get(file_path)
+        if job and job["status"] in ("queued", "running"):
+            return job
+        job = self.jobs[file_path] = {"file_path": file_path, "status": "queued"}
+
+        async def run():
+            try:
+                await self.pool.run(self.build, file_path, job)
+            except Exception as e:
+                job.update(status="error", error=str(e))
+
+        task = asyncio.ensure_future(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    def build(self, con: duckdb.DuckDBPyConnection, file_path: str, job: dict):
+        job.update(status="running", started=time.time())
+        try:
+            fingerprint = file_fingerprint(file_path)
+            if fingerprint is None:
+                raise ValueError("Cannot tell when this file changes, so its sample could go stale")
+            if self.lookup(file_path, fingerprint):
+                job.update(status="done")
+                return
+            _, read_function = self.describe(con, file_path)
+            os.makedirs(self.directory, exist_ok=True)
+            name = hashlib.sha1(file_path.encode()).hexdigest()
+            path = os.path.join(self.directory, f"{name}.parquet")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            total_rows = con.execute(f"SELECT COUNT(*) FROM {read_function}").fetchone()[0]
+            sample_rows = con.execute(
+                f"COPY (SELECT * FROM {read_function} "
+                f"USING SAMPLE reservoir({int(self.rows)} ROWS) REPEATABLE (42)) "
+                f"TO '{tmp_path}' (FORMAT parquet)"
+            ).fetchone()[0]
+            os.replace(tmp_path, path)
+            entry = {
+                "fingerprint": fingerprint,
+                "path": path,
+                "sample_rows": sample_rows,
+                "total_rows": total_rows,
+            }
+            with self.lock:
+                self.manifest[file_path] = entry
+                tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+                with open(tmp_manifest, "w") as f:
+                    json.dump(self.manifest, f)
+                os.replace(tmp_manifest, self.manifest_path)
+            job.update(status="done", sample_rows=sample_rows, total_rows=total_rows)
+        except Exception as e:
+            logging.error(f"Error sampling {file_path}: {e}")
+            job.update(status="error", error=str(e))
+        finally:
+            job["elapsed"] = round(time.time() - job["started"], 3)
+
+
+def closing_paren(code: str, start: int) -> int:
+    """Return the index just past the parenthesis that closes the one before `start`."""
+    depth = 1
+    for i in range(start, len(code)):
+        if code[i] == "(":
+            depth += 1
+        elif code[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(code)
+
+
+def masked(sql_query: str) -> str:
+    """Blank out literals, quoted identifiers and comments, keeping offsets the same."""
+    return PROTECTED_SQL.sub(lambda match: "\0" * len(match.group()), sql_query)
+
+
+def stacked_aggregates(sql_query: str) -> bool:
+    """Whether more than one SELECT in `sql_query` aggregates, e.g. a SUM over a grouped CTE.
+
+    Scaling COUNT and SUM up from a sample is only right where they read sampled rows,
+    not rows that an inner query already aggregated (and scaled).
+    """
+    depth, scopes, aggregating = 0, [], set()
+    for match in SCOPE_TOKENS.finditer(masked(sql_query)):
+        token = match.group().upper()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            while scopes and scopes[-1][0] > depth:
+                scopes.pop()
+        elif token == "SELECT":
+            # A SELECT at the same depth, as after UNION, starts a new scope
+            while scopes and scopes[-1][0] >= depth:
+                scopes.pop()
+            scopes.append((depth, match.start()))
+        elif scopes:
+            aggregating.add(scopes[-1][1])
+    return len(aggregating) > 1
+
+
+def scale_aggregates(sql_query: str, scale: float) -> str:
+    """Multiply each COUNT and SUM call, with any FILTER or OVER clause, by `scale`.
+
+    Each call is wrapped as `(scale::DOUBLE * SUM(...))`, so ratios like `SUM(x) / COUNT(*)`
+    stay unscaled, aggregates nested in a scaled one are not scaled again, and DECIMAL
+    sums cannot overflow. Callers check `stacked_aggregates` first.
+    """
+    code = masked(sql_query)
+    parts, last = [], 0
+    for match in SCALED_AGGREGATES.finditer(code):
+        if match.start() < last:
+            continue
+        end = closing_paren(code, match.end())
+        while clause := AGGREGATE_CLAUSE.match(code, end):
+            end = closing_paren(code, clause.end()) if clause.group(1) else clause.end()
+        parts.append(f"{sql_query[last:match.start()]}({scale!r}::DOUBLE * {sql_query[match.start():end]})")
+        last = end
+    parts.append(sql_query[last:])
+    return "".join(parts)
+
+
+def approximate_sql(sql_query: str, samples: dict, scale: float | None) -> str:
+    """Rewrite `sql_query` to read `samples` (source -> sample SQL) and use approximate aggregates.
+
+    If `scale` is given, COUNT and SUM results are multiplied by it to estimate totals.
+    """
+    for source, sample in samples.items():
+        sql_query = sql_query.replace(source, sample)
+    parts, last = [], 0
+
+    def rewrite(code: str) -> str:
+        for pattern, replacement in APPROXIMATE_FUNCTIONS:
+            code = pattern.sub(replacement, code)
+        return code
+
+    for match in PROTECTED_SQL.finditer(sql_query):
+        parts.append(rewrite(sql_query[last:match.start()]))
+        parts.append(match.group())
+        last = match.end()
+    parts.append(rewrite(sql_query[last:]))
+    sql_query = "".join(parts)
+    if scale is not None and scale != 1:
+        sql_query = scale_aggregates(sql_query, scale)
+    return sql_query
+
+
+def error_bound(sample_rows: int, total_rows: int) -> float | None:
+    """Return the 95% relative error of a count or sum estimated from a uniform sample.
+
+    This holds for estimates over the whole sample; groups with fewer sampled rows vary more.
+    """
+    if not sample_rows or not total_rows:
+        return None
+    fraction = min(1.0, sample_rows / total_rows)
+    return round(1.96 * math.sqrt((1 - fraction) / sample_rows), 6)
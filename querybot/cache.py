@@ -0,0 +1,218 @@
+from collections import OrderedDict
+import hashlib
+import httpx
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from querybot.sources import is_multi_file, source_index
+
+
+class LRUCache:
+    """Thread-safe mapping that evicts the least recently used entry beyond `maxsize`.
+
+    If `ttl` is given, entries also expire `ttl` seconds after they were set.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.expires = {}
+        self.lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            if self.ttl is not None and self.expires[key] < time.time():
+                self.pop(key)
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if self.ttl is not None:
+                self.expires[key] = time.time() + self.ttl
+            while len(self.data) > self.maxsize:
+                self.expires.pop(self.data.popitem(last=False)[0], None)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            self.expires.pop(key, None)
+            return self.data.pop(key, default)
+
+    def items(self) -> list:
+        with self.lock:
+            return list(self.data.items())
+
+    def __len__(self):
+        return len(self.data)
+
+
+def http_fingerprint(headers) -> str | None:
+    """Return the fingerprint of an HTTP resource from its ETag, else Last-Modified and Content-Length."""
+    if "etag" in headers:
+        return f"etag:{headers['etag']}"
+    if "last-modified" in headers:
+        return f"modified:{headers['last-modified']}:{headers.get('content-length', '')}"
+    return None
+
+
+def file_fingerprint(file_path: str) -> str | None:
+    """Return a string that changes whenever the file changes, or None if unknown.
+
+    Local files use size and mtime, and local directories and globs the files they hold.
+    HTTP(S) URLs use the ETag, else Last-Modified and Content-Length, from a HEAD request.
+    Other URLs (e.g. s3://) are not fingerprinted.
+    """
+    scheme = urllib.parse.urlparse(file_path).scheme
+    if scheme in ("http", "https"):
+        try:
+            response = httpx.head(file_path, follow_redirects=True, timeout=10.0)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logging.warning(f"Cannot fingerprint {file_path}: {e}")
+            return None
+        return http_fingerprint(response.headers)
+    # Treat Windows drive letters (C:\...) as local paths, not URL schemes
+    if len(scheme) > 1:
+        return None
+    if is_multi_file(file_path):
+        return source_index.fingerprint(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class SchemaCache:
+    """Schema per file path, valid while the file fingerprint is unchanged, persisted as JSON."""
+
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        self.entries = LRUCache(maxsize)
+        self.save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                for key, value in json.load(f):
+                    self.entries.set(key, value)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable schema cache {self.path}: {e}")
+
+    def save(self):
+        with self.save_lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries.items(), f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, file_path: str, fingerprint: str) -> dict | None:
+        entry = self.entries.get(file_path)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry
+
+    def set(self, file_path: str, fingerprint: str, value: dict):
+        self.entries.set(file_path, {**value, "fingerprint": fingerprint})
+        try:
+            self.save()
+        except OSError as e:
+            logging.warning(f"Cannot save schema cache {self.path}: {e}")
+
+
+class DiskCache:
+    """JSON values stored as one file per key under `directory`.
+
+    Entries expire `ttl` seconds after they were written. When the files exceed
+    `max_bytes`, the least recently read ones are deleted.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = sum(entry.stat().st_size for entry in self.entries())
+
+    def entries(self) -> list:
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str, default=None):
+        path = self.path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return default
+        if entry["key"] != key or entry["created"] + self.ttl < time.time():
+            return default
+        # Track reads in the access time used for eviction
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+        return entry["value"]
+
+    def set(self, key: str, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "created": time.time(), "value": value}, f)
+        self.size += os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Delete expired entries, then least recently read ones until under 90% of max_bytes."""
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_atime)
+        now = time.time()
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_bytes * 0.9 and entry.stat().st_mtime + self.ttl >= now:
+                continue
+            try:
+                os.remove(entry.path)
+                self.size -= entry.stat().st_size
+            except FileNotFoundError:
+                pass
+
+
+class TieredCache:
+    """An in-memory LRUCache in front of a DiskCache."""
+
+    def __init__(self, memory: LRUCache, disk: DiskCache):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is None:
+                return default
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self.memory.set(key, value)
+        try:
+            self.disk.set(key, value)
+        except OSError as e:
+            logging.warning(f"Cannot write to disk cache {self.disk.directory}: {e}")
@@ -0,0 +1,186 @@
+from collections import Counter
+import math
+import os
+import re
+
+# How many datasets, and roughly how many tokens of schema, go into each prompt
+PROMPT_TOP_K = int(os.getenv("QUERYBOT_PROMPT_TOP_K", 5))
+PROMPT_TOKEN_BUDGET = int(os.getenv("QUERYBOT_PROMPT_TOKEN_BUDGET", 6000))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase words, breaking snake_case and camelCase and dropping plural s."""
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", str(text))
+    tokens = []
+    for word in words:
+        word = word.lower()
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly count LLM tokens, at about 4 characters per token."""
+    return (len(text) + 3) // 4
+
+
+class CatalogIndex:
+    """Registered datasets searchable by BM25 over their names, columns, sample values and descriptions."""
+
+    def __init__(self):
+        self.entries = {}
+        self.doc_freq = Counter()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def get(self, name: str) -> dict | None:
+        return self.entries.get(name)
+
+    def add(
+        self,
+        name: str,
+        file_path: str,
+        read_function: str,
+        columns: list,
+        samples: dict | None = None,
+        description: str | None = None,
+        notes: dict | None = None,
+    ):
+        """Index a dataset. `columns` are (name, type) pairs and `samples` maps columns to sample values.
+
+        `notes` maps columns to a short description shown after them in prompts, e.g. their profile.
+        """
+        self.remove(name)
+        samples = samples or {}
+        column_terms = []
+        for column_name, column_type in columns:
+            text = " ".join([str(column_name), str(column_type), *map(str, samples.get(column_name, []))])
+            column_terms.append(Counter(tokenize(text)))
+        terms = Counter(tokenize(f"{name} {os.path.basename(file_path)} {description or ''}"))
+        for counts in column_terms:
+            terms.update(counts)
+        self.entries[name] = {
+            "file_path": file_path,
+            "read_function": read_function,
+            "columns": [tuple(column[:2]) for column in columns],
+            "notes": notes or {},
+            "column_terms": column_terms,
+            "terms": terms,
+            "length": sum(terms.values()),
+        }
+        self.doc_freq.update(terms.keys())
+
+    def remove(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.doc_freq.subtract(entry["terms"].keys())
+            self.doc_freq += Counter()
+
+    def idf(self, term: str) -> float:
+        df = self.doc_freq.get(term, 0)
+        return math.log(1 + (len(self.entries) - df + 0.5) / (df + 0.5))
+
+    def score(self, query_terms: list, terms: Counter, length: int, avg_length: float) -> float:
+        score = 0.0
+        for term in query_terms:
+            tf = terms.get(term, 0)
+            if tf:
+                norm = tf + K1 * (1 - B + B * length / max(avg_length, 1))
+                score += self.idf(term) * tf * (K1 + 1) / norm
+        return score
+
+    def search(self, query: str, k: int, names: list | None = None) -> list[tuple[str, float]]:
+        """Return up to `k` (name, score) pairs for datasets matching `query`, best first.
+
+        If `names` is given, only those datasets are searched.
+        """
+        query_terms = set(tokenize(query))
+        if not self.entries or not query_terms:
+            return []
+        avg_length = sum(entry["length"] for entry in self.entries.values()) / len(self.entries)
+        candidates = self.entries if names is None else [name for name in names if name in self.entries]
+        scores = [
+            (name, self.score(query_terms, self.entries[name]["terms"], self.entries[name]["length"], avg_length))
+            for name in candidates
+        ]
+        scores = [item for item in scores if item[1] > 0]
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:k]
+
+    def rank_columns(self, name: str, query: str) -> list[int]:
+        """Return the indexes of a dataset's columns, most relevant to `query` first, else in table order."""
+        entry = self.entries[name]
+        query_terms = set(tokenize(query))
+        column_terms = entry["column_terms"]
+        avg_length = sum(sum(terms.values()) for terms in column_terms) / max(len(column_terms), 1)
+        scores = [self.score(query_terms, terms, sum(terms.values()), avg_length) for terms in column_terms]
+        return sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+
+    def describe(self, name: str, query: str, token_budget: int) -> tuple[str, int]:
+        """Describe a dataset for the prompt with as many relevant columns as fit in `token_budget`.
+
+        Always includes at least one column. Returns the text and the number of columns omitted.
+        """
+        entry = self.entries[name]
+        columns = entry["columns"]
+        header = f"Dataset name: {name}\nFile path: {entry['file_path']}\nSchema: CREATE TABLE {name} (\n"
+        footer = f"\n);\nNote: Use {entry['read_function']} in queries\n\n"
+        notes = [entry["notes"].get(column_name) for column_name, _ in columns]
+        lines = [f"[{column_name}] {column_type}" for column_name, column_type in columns]
+
+        def render(indexes: list) -> str:
+            # The comma separating columns goes before each column's note comment
+            rendered = []
+            for n, i in enumerate(indexes):
+                separator = "," if n < len(indexes) - 1 else ""
+                rendered.append(lines[i] + separator + (f" -- {notes[i]}" if notes[i] else ""))
+            return "\n".join(rendered)
+
+        budget = token_budget - estimate_tokens(header + footer)
+        body = render(range(len(columns)))
+        if estimate_tokens(body) <= budget:
+            return header + body + footer, 0
+        keep, used = set(), 0
+        for i in self.rank_columns(name, query):
+            size = estimate_tokens(lines[i] + ",\n" + (f" -- {notes[i]}" if notes[i] else ""))
+            if keep and used + size > budget:
+                break
+            keep.add(i)
+            used += size
+        omitted = len(columns) - len(keep)
+        body = render(sorted(keep)) + f"\n-- {omitted} less relevant columns omitted"
+        return header + body + footer, omitted
+
+    def prompt_context(
+        self, query: str, required: list, k: int = PROMPT_TOP_K, token_budget: int = PROMPT_TOKEN_BUDGET
+    ) -> tuple[str, dict]:
+        """Describe the `required` datasets, then the top-`k` others relevant to `query`, within `token_budget`.
+
+        Returns the text and stats: the datasets included, datasets and columns omitted, and tokens used.
+        """
+        names = [name for name in required if name in self.entries]
+        names += [name for name, _ in self.search(query, k) if name not in names]
+        text, tokens, included, omitted_columns = "", 0, [], 0
+        for name in names:
+            # Required datasets share the budget; each gets at least its most relevant column
+            remaining = token_budget - tokens
+            if remaining <= 0 and name not in required:
+                break
+            description, omitted = self.describe(name, query, remaining)
+            text += description
+            tokens += estimate_tokens(description)
+            included.append(name)
+            omitted_columns += omitted
+        stats = {
+            "datasets": included,
+            "omitted_datasets": len(self.entries) - len(included),
+            "omitted_columns": omitted_columns,
+            "schema_tokens": tokens,
+        }
+        return text, stats
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import Request
+import duckdb
+
+# Number of DuckDB calls that run in parallel, and how many more may wait for a worker
+DB_WORKERS = int(os.getenv("QUERYBOT_DB_WORKERS", os.cpu_count() or 4))
+DB_QUEUE = int(os.getenv("QUERYBOT_DB_QUEUE", 100))
+
+
+class PoolBusy(Exception):
+    """Raised when the DuckDB pool has no free worker and its queue is full."""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away and its DuckDB call was interrupted."""
+
+
+class QueryTimeout(Exception):
+    """Raised when a DuckDB call ran past its timeout and was interrupted."""
+
+
+async def wait_for_disconnect(request: Request, interval: float = 0.25):
+    """Return once the client behind `request` has disconnected."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+class CursorPool:
+    """Run blocking DuckDB calls on a bounded thread pool, one cursor per call.
+
+    Cursors are opened on `con` unless a call passes another connection, so calls
+    on the same connection share its registered files, attached databases and
+    extensions, while each call runs on its own thread and can be interrupted on its own.
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, workers: int = DB_WORKERS, queue: int = DB_QUEUE):
+        self.con = con
+        self.workers = workers
+        self.queue = queue
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="duckdb")
+
+    async def run(
+        self,
+        fn,
+        *args,
+        request: Request | None = None,
+        con: duckdb.DuckDBPyConnection | None = None,
+        timeout: float | None = None,
+    ):
+        """Run `fn(cursor, *args)` on a new cursor on a worker thread and return its result.
+
+        If `request` is given, the call is interrupted when the client disconnects. If
+        `timeout` is given, it is interrupted after that many seconds.
+        """
+        cursor = (con or self.con).cursor()
+        try:
+            return await self.call(cursor, fn, *args, request=request, timeout=timeout)
+        finally:
+            cursor.close()
+
+    async def stream(
+        self,
+        sql: str,
+        request: Request | None = None,
+        con: duckdb.DuckDBPyConnection | None = None,
+        timeout: float | None = None,
+    ):
+        """Execute `sql` on a new cursor and yield its result as DataFrame chunks.
+
+        The first chunk is always yielded, even if empty, so callers see the columns.
+        `timeout` limits the time spent in DuckDB, not waiting for the consumer.
+        """
+        cursor = (con or self.con).cursor()
+        remaining = timeout
+
+        async def call(fn):
+            nonlocal remaining
+            start = time.monotonic()
+            try:
+                return await self.call(cursor, fn, request=request, timeout=remaining)
+            finally:
+                if remaining is not None:
+                    remaining = max(0.001, remaining - (time.monotonic() - start))
+
+        try:
+            await call(lambda cursor: cursor.execute(sql))
+            first = True
+            while True:
+                chunk = await call(lambda cursor: cursor.fetch_df_chunk())
+                if len(chunk) or first:
+                    yield chunk
+                if not len(chunk):
+                    break
+                first = False
+        finally:
+            cursor.close()
+
+    async def call(
+        self,
+        cursor: duckdb.DuckDBPyConnection,
+        fn,
+        *args,
+        request: Request | None = None,
+        timeout: float | None = None,
+    ):
+        """Run `fn(cursor, *args)` on a worker thread, interrupting `cursor` if cancelled or timed out."""
+        if self.pending >= self.workers + self.queue:
+            raise PoolBusy(f"{self.pending} DuckDB calls already pending")
+        self.pending += 1
+
+        cancelled = threading.Event()
+
+        def work():
+            if cancelled.is_set():
+                raise ClientDisconnected("Cancelled before start")
+            return fn(cursor, *args)
+
+        async def cancel():
+            cancelled.set()
+            cursor.interrupt()
+            # Wait for the worker to stop using the cursor before the caller closes it
+            await asyncio.wait({future})
+            if not future.cancelled():
+                future.exception()
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, work)
+        watcher = asyncio.ensure_future(wait_for_disconnect(request)) if request else None
+        try:
+            if watcher is not None or timeout is not None:
+                waiters = {future, watcher} if watcher is not None else {future}
+                await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not future.done():
+                    await cancel()
+                    if watcher is not None and watcher.done():
+                        raise ClientDisconnected("Client disconnected")
+                    raise QueryTimeout(f"Query did not finish within {timeout:g} seconds")
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self.pending -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,77 @@
+from pathlib import Path
+import argparse
+import duckdb
+import logging
+import os
+import threading
+import urllib.parse
+
+# Where DuckDB installs and looks for extensions, e.g. one filled at build time with
+# `python -m querybot.extensions DIRECTORY`. Default: ~/.duckdb/extensions
+EXTENSION_DIRECTORY = os.getenv("QUERYBOT_EXTENSION_DIRECTORY")
+# Whether missing extensions are downloaded, or only ones already installed are loaded
+EXTENSION_INSTALL = os.getenv("QUERYBOT_EXTENSION_INSTALL", "true").lower() not in ("0", "false", "no")
+
+# Extensions needed to read each file type, and files at each URL scheme
+FILE_EXTENSIONS = {".xlsx": "excel", ".db": "sqlite"}
+SCHEME_EXTENSIONS = {"http": "httpfs", "https": "httpfs", "s3": "httpfs", "gcs": "httpfs", "r2": "httpfs"}
+ALL_EXTENSIONS = ("excel", "httpfs", "mysql", "sqlite")
+
+# Extensions installed in the extension directory, so each is only installed once per process
+installed = set()
+install_lock = threading.Lock()
+
+
+def duckdb_config() -> dict:
+    """Return duckdb.connect() config that applies the extension settings above."""
+    settings = {"autoinstall_known_extensions": EXTENSION_INSTALL}
+    if EXTENSION_DIRECTORY:
+        settings["extension_directory"] = EXTENSION_DIRECTORY
+    return settings
+
+
+def extensions_for(file_path: str) -> list[str]:
+    """Return the extensions needed to read `file_path`."""
+    needed = []
+    scheme = urllib.parse.urlparse(file_path).scheme.lower()
+    if scheme in SCHEME_EXTENSIONS:
+        needed.append(SCHEME_EXTENSIONS[scheme])
+    if Path(file_path).suffix.lower() in FILE_EXTENSIONS:
+        needed.append(FILE_EXTENSIONS[Path(file_path).suffix.lower()])
+    return needed
+
+
+def load_extensions(con: duckdb.DuckDBPyConnection, *names: str):
+    """Load extensions into `con`'s database, installing them first if needed and allowed.
+
+    DuckDB keeps extensions loaded per database, so loading one again is a cheap no-op.
+    """
+    for name in names:
+        try:
+            con.execute(f"LOAD {name}")
+            continue
+        except duckdb.Error as e:
+            if not EXTENSION_INSTALL:
+                directory = EXTENSION_DIRECTORY or "the DuckDB extension directory"
+                raise ValueError(f"DuckDB extension {name} is not installed in {directory}") from e
+        with install_lock:
+            if name not in installed:
+                logging.info(f"Installing DuckDB extension {name}")
+                con.execute(f"INSTALL {name}")
+                installed.add(name)
+        con.execute(f"LOAD {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Install QueryBot's DuckDB extensions into a directory")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+    con = duckdb.connect(":memory:", config={"extension_directory": os.path.abspath(args.directory)})
+    for name in ALL_EXTENSIONS:
+        con.execute(f"INSTALL {name}")
+        print(f"Installed {name}")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import duckdb
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from querybot.cache import file_fingerprint
+from querybot.profile import parse_date_sql, quote
+
+
+class Ingestor:
+    """Materialize source files once into Parquet under `directory` and track progress.
+
+    Each source is copied with DuckDB's `COPY ... TO (FORMAT parquet)`. The manifest
+    maps source paths to the fingerprint they were copied at, so a copy is reused
+    until the source changes. `casts` parse text date columns while copying, e.g.
+    `{"order_date": "%d/%m/%Y"}`, so queries read them as dates.
+    """
+
+    def __init__(self, directory: str, pool, describe):
+        self.directory = directory
+        self.pool = pool
+        self.describe = describe
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = {}
+        self.jobs = {}
+        self.tasks = set()
+        try:
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable ingest manifest {self.manifest_path}: {e}")
+
+    def lookup(self, file_path: str, fingerprint: str) -> str | None:
+        """Return the Parquet copy of `file_path` if it is up to date, else None."""
+        entry = self.manifest.get(file_path)
+        if entry and entry["fingerprint"] == fingerprint and os.path.exists(entry["parquet_path"]):
+            return entry["parquet_path"]
+        return None
+
+    def submit(self, file_path: str, casts: dict | None = None) -> dict:
+        """Start materializing `file_path` in the background and return its job status.
+
+        `casts` maps text columns to the date format to parse them with.
+        """
+        casts = casts or {}
+        job = self.jobs.get(file_path)
+        if job and job["status"] in ("queued", "running"):
+            return job
+        job = self.jobs[file_path] = {
+            "file_path": file_path, "status": "queued", "progress": 0.0, "casts": casts
+        }
+
+        async def run():
+            try:
+                await self.pool.run(self.materialize, file_path, job, casts)
+            except Exception as e:
+                job.update(status="error", error=str(e))
+
+        task = asyncio.ensure_future(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    def materialize(
+        self, con: duckdb.DuckDBPyConnection, file_path: str, job: dict, casts: dict | None = None
+    ):
+        casts = casts or {}
+        job.update(status="running", started=time.time())
+        try:
+            fingerprint = file_fingerprint(file_path)
+            parquet_path = self.lookup(file_path, fingerprint) if fingerprint else None
+            if parquet_path and self.manifest[file_path].get("casts", {}) == casts:
+                job.update(status="done", progress=100.0, parquet_path=parquet_path, fresh=True)
+                return
+            _, read_function = self.describe(con, file_path)
+            os.makedirs(self.directory, exist_ok=True)
+            parquet_path = os.path.join(self.directory, hashlib.sha1(file_path.encode()).hexdigest() + ".parquet")
+            tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+
+            # Report DuckDB's progress on the COPY while it runs
+            done = threading.Event()
+
+            def report_progress():
+                while not done.wait(0.5):
+                    progress = con.query_progress()
+                    if progress >= 0:
+                        job["progress"] = round(progress, 1)
+
+            def copy(select: str) -> int:
+                return con.execute(
+                    f"COPY (SELECT {select} FROM {read_function}) "
+                    f"TO '{tmp_path}' (FORMAT parquet, COMPRESSION zstd)"
+                ).fetchone()[0]
+
+            threading.Thread(target=report_progress, daemon=True).start()
+            try:
+                if casts:
+                    replace = ", ".join(
+                        f"{parse_date_sql(quote(name), fmt)} AS {quote(name)}" for name, fmt in casts.items()
+                    )
+                    try:
+                        rows = copy(f"* REPLACE ({replace})")
+                    except duckdb.Error as e:
+                        # A value the upload-time profile did not sample is not a date; keep the text
+                        logging.warning(f"Cannot parse dates in {file_path}, copying them as text: {e}")
+                        casts = {}
+                        job["casts"] = casts
+                if not casts:
+                    rows = copy("*")
+            finally:
+                done.set()
+            os.replace(tmp_path, parquet_path)
+
+            with self.lock:
+                if fingerprint:
+                    self.manifest[file_path] = {
+                        "fingerprint": fingerprint,
+                        "parquet_path": parquet_path,
+                        "casts": casts,
+                    }
+                tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+                with open(tmp_manifest, "w") as f:
+                    json.dump(self.manifest, f)
+                os.replace(tmp_manifest, self.manifest_path)
+            job.update(status="done", progress=100.0, parquet_path=parquet_path, rows=rows, fresh=False)
+        except Exception as e:
+            logging.error(f"Error ingesting {file_path}: {e}")
+            job.update(status="error", error=str(e))
+        finally:
+            job["elapsed"] = round(time.time() - job["started"], 3)
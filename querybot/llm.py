@@ -0,0 +1,115 @@
+from email.utils import parsedate_to_datetime
+import asyncio
+import httpx
+import importlib.util
+import json
+import logging
+import os
+import random
+import time
+
+# Connection pool, retry and per-base-URL concurrency settings for LLM calls
+LLM_TIMEOUT = float(os.getenv("QUERYBOT_LLM_TIMEOUT", 30))
+LLM_MAX_CONNECTIONS = int(os.getenv("QUERYBOT_LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE = int(os.getenv("QUERYBOT_LLM_MAX_KEEPALIVE", 20))
+LLM_CONCURRENCY = int(os.getenv("QUERYBOT_LLM_CONCURRENCY", 16))
+LLM_RETRIES = int(os.getenv("QUERYBOT_LLM_RETRIES", 3))
+LLM_BACKOFF = float(os.getenv("QUERYBOT_LLM_BACKOFF", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("QUERYBOT_LLM_BACKOFF_MAX", 20))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """Return the delay in seconds requested by a Retry-After header, if any."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Application-wide client for OpenAI-compatible chat completion APIs.
+
+    Reuses pooled keep-alive connections (HTTP/2 when the `h2` package is installed),
+    limits concurrent calls per base URL, and retries 429/5xx responses and transport
+    errors with jittered exponential backoff that honors Retry-After.
+    """
+
+    def __init__(
+        self,
+        timeout: float = LLM_TIMEOUT,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_MAX_KEEPALIVE,
+        concurrency: int = LLM_CONCURRENCY,
+        retries: int = LLM_RETRIES,
+    ):
+        self.client = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            timeout=timeout,
+        )
+        self.concurrency = concurrency
+        self.retries = retries
+        self.limiters = {}
+
+    def limiter(self, base_url: str) -> asyncio.Semaphore:
+        if base_url not in self.limiters:
+            self.limiters[base_url] = asyncio.Semaphore(self.concurrency)
+        return self.limiters[base_url]
+
+    async def post(self, base_url: str, headers: dict, payload: dict, stream: bool = False) -> httpx.Response:
+        """POST `payload` to the chat completions endpoint under `base_url`, retrying failures.
+
+        With `stream=True`, the response body is not read; the caller must close the response.
+        """
+        # Check if the base URL already ends with /chat/completions
+        url = base_url if base_url.endswith("/chat/completions") else f"{base_url}/chat/completions"
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                async with self.limiter(base_url):
+                    request = self.client.build_request("POST", url, headers=headers, json=payload)
+                    response = await self.client.send(request, stream=stream)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
+                    return response
+                delay = retry_after(response)
+                await response.aclose()
+                logging.warning(f"LLM call to {url} returned {response.status_code}, retrying")
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning(f"LLM call to {url} failed ({e!r}), retrying")
+            if delay is None:
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF * 2**attempt))
+            await asyncio.sleep(min(delay, LLM_BACKOFF_MAX))
+
+    async def stream(self, base_url: str, headers: dict, payload: dict):
+        """Yield content deltas from a streamed (server-sent events) chat completion."""
+        response = await self.post(base_url, headers, {**payload, "stream": True}, stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
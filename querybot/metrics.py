@@ -0,0 +1,239 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds of latency histogram buckets, in seconds
+LATENCY_BUCKETS = tuple(
+    float(bound)
+    for bound in os.getenv(
+        "QUERYBOT_METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120"
+    ).split(",")
+)
+SIZE_BUCKETS = tuple(10.0**power for power in range(9))
+
+
+class Metric:
+    """A metric in the Prometheus text format, with one value per combination of labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def format_labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{label}="{escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{self.format_labels(key)} {value:g}" for key, value in items]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down. If `function` is given, it is called for the value instead."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            return [f"{self.name} {self.function():g}"]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum of observed values
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            items = [(key, list(counts)) for key, counts in self.values.items()]
+        lines = []
+        for key, counts in items:
+            total = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                total += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = self.format_labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            lines.append(f"{self.name}_sum{self.format_labels(key)} {counts[-1]:g}")
+            lines.append(f"{self.name}_count{self.format_labels(key)} {total}")
+        return lines
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+REQUEST_SECONDS = Histogram(
+    "querybot_request_seconds", "Time to the start of each HTTP response", ("method", "route", "status")
+)
+REQUESTS_IN_FLIGHT = Gauge("querybot_requests_in_flight", "HTTP requests being handled")
+RESPONSE_BYTES = Histogram(
+    "querybot_response_bytes", "Bytes in each HTTP response body", ("route",), buckets=SIZE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "querybot_stage_seconds", "Time spent in each stage of handling a request", ("route", "stage")
+)
+CACHE_LOOKUPS = Counter(
+    "querybot_cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "outcome")
+)
+LLM_TOKENS = Counter(
+    "querybot_llm_tokens_total",
+    "LLM tokens by model and kind, estimated from text length when the API does not report usage",
+    ("model", "kind"),
+)
+LLM_IN_FLIGHT = Gauge("querybot_llm_requests_in_flight", "LLM calls waiting for a response")
+RESULT_ROWS = Histogram(
+    "querybot_result_rows", "Rows in each query result, before paging", buckets=SIZE_BUCKETS
+)
+
+# The timings of the request being handled, set by TimingMiddleware
+current_timings: ContextVar["Timings | None"] = ContextVar("querybot_timings", default=None)
+
+
+class Timings:
+    """Time spent in each stage of one request, reported in its Server-Timing header.
+
+    Stages that run more than once, e.g. for each uploaded file, add up.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self, total: float) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        return ", ".join([*entries, f"total;dur={total * 1000:.1f}"])
+
+
+@contextmanager
+def timed(stage: str):
+    """Record the time the block takes as `stage` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add(stage, time.perf_counter() - start)
+
+
+class TimingMiddleware:
+    """ASGI middleware that records request metrics and adds a Server-Timing header.
+
+    Streaming responses send their header when they start, so it only covers the
+    stages finished by then; /metrics still records every stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = Timings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        status = "500"
+        route = "unmatched"
+        size = 0
+
+        async def send_with_timing(message):
+            nonlocal status, route, size
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                # Label by route template, e.g. /query/{result_id}/page, not by each URL
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                elapsed = time.perf_counter() - start
+                MutableHeaders(scope=message).append("server-timing", timings.header(elapsed))
+                REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            with REQUESTS_IN_FLIGHT.track():
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            RESPONSE_BYTES.observe(size, route=route)
+            for stage, seconds in timings.stages.items():
+                STAGE_SECONDS.observe(seconds, route=route, stage=stage)
+
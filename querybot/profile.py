@@ -0,0 +1,126 @@
+import duckdb
+import os
+
+# Date formats tried on text columns, in order of preference when several parse every value
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%d-%m-%Y",
+    "%m/%d/%Y",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m-%d-%Y",
+    "%d.%m.%Y",
+    "%Y.%m.%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+]
+# Text values checked for a date format, and top values kept per column
+PROFILE_DATE_SAMPLE = int(os.getenv("QUERYBOT_PROFILE_DATE_SAMPLE", 1000))
+PROFILE_TOP_VALUES = 3
+
+TEXT_TYPES = ("VARCHAR",)
+
+
+def quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def profile_dataset(con: duckdb.DuckDBPyConnection, read_function: str) -> dict:
+    """Profile each column with SUMMARIZE: cardinality, null rate, min/max, top values and date format.
+
+    Returns `{"rows", "columns": {name: {"type", "distinct", "null_rate", "min", "max",
+    "top_values", "date_format"}}}`. Top values are only kept for text columns, and date
+    formats are only detected on text columns whose sampled values all parse with one format.
+    """
+    summary = con.execute(f"SUMMARIZE SELECT * FROM {read_function}").fetchall()
+    columns, rows = {}, 0
+    for name, column_type, min_value, max_value, distinct, *_, count, null_percentage in summary:
+        rows = max(rows, count or 0)
+        columns[name] = {
+            "type": column_type,
+            "distinct": distinct,
+            "null_rate": round(float(null_percentage or 0) / 100, 4),
+            "min": min_value,
+            "max": max_value,
+            "top_values": [],
+            "date_format": None,
+        }
+    text_columns = [name for name, column in columns.items() if column["type"] in TEXT_TYPES]
+    if not text_columns:
+        return {"rows": rows, "columns": columns}
+
+    # Top values and date format checks for every text column, in one scan each
+    top_values = con.execute(
+        "SELECT " + ", ".join(f"approx_top_k({quote(name)}, {PROFILE_TOP_VALUES})" for name in text_columns)
+        + f" FROM {read_function}"
+    ).fetchone()
+    for name, values in zip(text_columns, top_values):
+        columns[name]["top_values"] = [value for value in values or [] if value is not None]
+    checks = [f"COUNT({quote(name)})" for name in text_columns]
+    for name in text_columns:
+        checks += [f"COUNT(try_strptime({quote(name)}, '{fmt}'))" for fmt in DATE_FORMATS]
+    counts = con.execute(
+        f"SELECT {', '.join(checks)} FROM (SELECT * FROM {read_function} LIMIT {int(PROFILE_DATE_SAMPLE)})"
+    ).fetchone()
+    values, parsed = counts[: len(text_columns)], counts[len(text_columns):]
+    for i, name in enumerate(text_columns):
+        if not values[i]:
+            continue
+        for j, fmt in enumerate(DATE_FORMATS):
+            if parsed[i * len(DATE_FORMATS) + j] == values[i]:
+                columns[name]["date_format"] = fmt
+                break
+    return {"rows": rows, "columns": columns}
+
+
+def date_type(fmt: str) -> str:
+    """Return the type that values in a date format hold: DATE, or TIMESTAMP if it has a time."""
+    return "TIMESTAMP" if "%H" in fmt else "DATE"
+
+
+def parse_date_sql(column_sql: str, fmt: str, as_type: str | None = None, fallback: bool = False) -> str:
+    """Return SQL that parses a text column in date format `fmt`, as `as_type` or date_type(fmt).
+
+    With `fallback`, values in another of DATE_FORMATS are parsed too, and ones in none are
+    NULL, as the format was only detected on the first values of the column.
+    """
+    if fallback:
+        formats = [fmt] + [other for other in DATE_FORMATS if other != fmt]
+        listed = ", ".join(f"'{other}'" for other in formats)
+        return f"CAST(TRY_STRPTIME({column_sql}, [{listed}]) AS {as_type or date_type(fmt)})"
+    return f"CAST(STRPTIME({column_sql}, '{fmt}') AS {as_type or date_type(fmt)})"
+
+
+def column_note(column: dict, column_type: str | None = None) -> str:
+    """Describe a profiled column in a few words for the LLM prompt.
+
+    `column_type` is the column's type as queried, which differs from the profiled one
+    once dates have been parsed at ingest.
+    """
+    notes = []
+    column_type = column_type or column["type"]
+    if column["date_format"] and column_type in TEXT_TYPES:
+        notes.append(f"text dates, parse with STRPTIME(col, '{column['date_format']}')")
+    if column["distinct"] is not None:
+        notes.append(f"~{column['distinct']:,} distinct")
+    if column["null_rate"]:
+        notes.append(f"{column['null_rate']:.0%} null")
+    if column["top_values"] and column_type in TEXT_TYPES:
+        notes.append("e.g. " + ", ".join(repr(str(value)[:40]) for value in column["top_values"]))
+    elif column["min"] is not None and column["max"] is not None and column_type == column["type"]:
+        notes.append(f"{str(column['min'])[:40]} to {str(column['max'])[:40]}")
+    return "; ".join(notes)
+
+
+def describe_profile(table: str, profile: dict) -> str:
+    """Describe a profiled dataset as a CREATE TABLE statement with a note on each column."""
+    names = list(profile["columns"])
+    lines = []
+    for i, name in enumerate(names):
+        column, note = profile["columns"][name], column_note(profile["columns"][name])
+        separator = "," if i < len(names) - 1 else ""
+        lines.append(f"[{name}] {column['type']}{separator}" + (f" -- {note}" if note else ""))
+    return f"-- {profile['rows']:,} rows\nCREATE TABLE {table} (\n" + "\n".join(lines) + "\n);"
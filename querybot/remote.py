@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import httpx
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from querybot.cache import http_fingerprint
+
+# Disk space for local copies of remote files, and whether /upload prefetches them by default
+REMOTE_CACHE_BYTES = int(os.getenv("QUERYBOT_REMOTE_CACHE_BYTES", 10_000_000_000))
+REMOTE_PREFETCH = os.getenv("QUERYBOT_REMOTE_PREFETCH", "").lower() in ("1", "true", "yes")
+
+
+class RemoteCache:
+    """Local copies of remote (HTTP/HTTPS) files under `directory`, validated by ETag.
+
+    A copy is used while the remote file's fingerprint (see `file_fingerprint`) matches
+    the one it was downloaded with. When copies exceed `max_bytes`, the least recently
+    used ones are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = REMOTE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock = threading.Lock()
+        self.manifest = {}
+        self.jobs = {}
+        self.tasks = set()
+        try:
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable remote cache manifest {self.manifest_path}: {e}")
+
+    def lookup(self, url: str, fingerprint: str) -> str | None:
+        """Return the local copy of `url` if it matches `fingerprint`, else None."""
+        entry = self.manifest.get(url)
+        if not entry or entry["fingerprint"] != fingerprint or not os.path.exists(entry["path"]):
+            return None
+        entry["used"] = time.time()
+        return entry["path"]
+
+    def submit(self, url: str) -> dict:
+        """Start downloading `url` in the background and return its job status."""
+        job = self.jobs.get(url)
+        if job and job["status"] in ("queued", "running"):
+            return job
+        job = self.jobs[url] = {"url": url, "status": "queued", "bytes": 0}
+        task = asyncio.ensure_future(self.fetch(url, job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def fetch(self, url: str, job: dict):
+        job.update(status="running", started=time.time())
+        suffix = Path(urllib.parse.urlparse(url).path).suffix.lower()
+        path = os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + suffix)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Ask for the file as stored, so sizes match the HEAD requests used for validation
+            headers = {"Accept-Encoding": "identity"}
+            async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
+                async with client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    fingerprint = http_fingerprint(response.headers)
+                    if fingerprint is None:
+                        raise ValueError("No ETag or Last-Modified header to validate a local copy with")
+                    total = int(response.headers.get("content-length", 0))
+                    # Don't download, or evict other copies for, a file that can't fit
+                    if total > self.max_bytes:
+                        raise ValueError("File is larger than QUERYBOT_REMOTE_CACHE_BYTES")
+                    with open(tmp_path, "wb") as f:
+                        async for chunk in response.aiter_bytes(1 << 20):
+                            if job["bytes"] + len(chunk) > self.max_bytes:
+                                raise ValueError("File is larger than QUERYBOT_REMOTE_CACHE_BYTES")
+                            # Write in a thread, so large downloads don't block the event loop
+                            await asyncio.to_thread(f.write, chunk)
+                            job["bytes"] += len(chunk)
+                            if total:
+                                job["progress"] = round(100 * job["bytes"] / total, 1)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.manifest[url] = {
+                    "fingerprint": fingerprint,
+                    "path": path,
+                    "size": job["bytes"],
+                    "used": time.time(),
+                }
+                self.evict()
+                self.save()
+            job.update(status="done", progress=100.0, path=path)
+        except Exception as e:
+            logging.error(f"Error prefetching {url}: {e}")
+            job.update(status="error", error=str(e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            job["elapsed"] = round(time.time() - job["started"], 3)
+
+    def evict(self):
+        """Delete the least recently used copies until they fit in `max_bytes`."""
+        size = sum(entry["size"] for entry in self.manifest.values())
+        for url, entry in sorted(self.manifest.items(), key=lambda item: item[1]["used"]):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+            size -= entry["size"]
+            del self.manifest[url]
+
+    def save(self):
+        tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_manifest, self.manifest_path)
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+import duckdb
+import os
+import pandas as pd
+import re
+import threading
+import time
+import uuid
+from querybot.cache import LRUCache
+from querybot.serialize import dumps
+
+# Limits on each page of results returned to the client, and how long idle results are kept
+RESULT_MAX_ROWS = int(os.getenv("QUERYBOT_RESULT_MAX_ROWS", 10000))
+RESULT_MAX_BYTES = int(os.getenv("QUERYBOT_RESULT_MAX_BYTES", 20_000_000))
+RESULT_TTL = float(os.getenv("QUERYBOT_RESULT_TTL", 600))
+
+# Memory for cached result pages; larger results are served from their spilled files
+RESULT_CACHE_BYTES = int(os.getenv("QUERYBOT_RESULT_CACHE_BYTES", 200_000_000))
+RESULT_CACHE_SIZE = int(os.getenv("QUERYBOT_RESULT_CACHE_SIZE", 10000))
+
+# Statements that cannot be wrapped in COPY (...) fail with these before running
+UNSPILLABLE_ERRORS = (duckdb.ParserException, duckdb.BinderException, duckdb.NotImplementedException)
+
+
+class ResultStore:
+    """Query results spilled to Parquet files under `directory` and served page by page.
+
+    A result is identified by its file name, so any process sharing `directory` can
+    serve its pages. Results not read for `ttl` seconds are deleted.
+    """
+
+    def __init__(self, directory: str, ttl: float = RESULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.last_expired = 0.0
+
+    def path(self, result_id: str) -> str:
+        if not result_id.isalnum():
+            raise KeyError(result_id)
+        return os.path.join(self.directory, f"{result_id}.parquet")
+
+    def spill(self, con: duckdb.DuckDBPyConnection, sql: str) -> tuple[str, int]:
+        """Run `sql`, write its result to Parquet and return the result ID and row count."""
+        self.expire()
+        os.makedirs(self.directory, exist_ok=True)
+        result_id = uuid.uuid4().hex
+        path = self.path(result_id)
+        tmp_path = f"{path}.tmp"
+        # A trailing semicolon cannot go inside COPY (...), and a trailing comment would hide the ")"
+        sql = re.sub(r"[\s;]+$", "", sql)
+        try:
+            row_count = con.execute(f"COPY (\n{sql}\n) TO '{tmp_path}' (FORMAT parquet)").fetchone()[0]
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return result_id, row_count
+
+    def page(self, con: duckdb.DuckDBPyConnection, result_id: str, offset: int, limit: int) -> tuple[pd.DataFrame, int]:
+        """Return `limit` rows of a spilled result starting at `offset`, and its total row count."""
+        path = self.path(result_id)
+        if not os.path.exists(path):
+            raise KeyError(result_id)
+        os.utime(path)
+        row_count = con.execute(f"SELECT COUNT(*) FROM read_parquet('{path}')").fetchone()[0]
+        page = con.execute(
+            f"SELECT * FROM read_parquet('{path}') LIMIT {int(limit)} OFFSET {int(offset)}"
+        ).fetchdf()
+        return page, row_count
+
+    def discard(self, result_id: str):
+        try:
+            os.remove(self.path(result_id))
+        except (KeyError, FileNotFoundError):
+            pass
+
+    def expire(self):
+        """Delete results that have not been read for `ttl` seconds."""
+        now = time.time()
+        if now - self.last_expired < min(60, self.ttl):
+            return
+        self.last_expired = now
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < now - self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def fetch_first_rows(con: duckdb.DuckDBPyConnection, sql: str, max_rows: int) -> tuple[pd.DataFrame, bool]:
+    """Execute `sql` and return up to `max_rows` rows, and whether more rows were left."""
+    con.execute(sql)
+    chunks, count = [], 0
+    while count <= max_rows:
+        chunk = con.fetch_df_chunk()
+        if not chunks or len(chunk):
+            chunks.append(chunk)
+        if not len(chunk):
+            break
+        count += len(chunk)
+    result = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    return result.iloc[:max_rows], count > max_rows
+
+
+def fit_page(result: pd.DataFrame, serialize, max_bytes: int = RESULT_MAX_BYTES) -> tuple[object, int]:
+    """Serialize the longest prefix of `result` that fits in `max_bytes`.
+
+    `serialize(df)` returns JSON-compatible content. Returns it and the number of rows used.
+    """
+    rows = len(result)
+    content = serialize(result)
+    size = len(dumps(content))
+    while size > max_bytes and rows > 1:
+        # Shrink in proportion to the overshoot, with a margin for uneven row sizes
+        rows = max(1, min(rows - 1, int(rows * max_bytes / size * 0.9)))
+        content = serialize(result.iloc[:rows])
+        size = len(dumps(content))
+    return content, rows
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside string literals and quoted identifiers, and drop trailing semicolons."""
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql)
+    normalized = "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+    return normalized.strip().rstrip(";").strip()
+
+
+class ResultCache:
+    """Results of earlier queries, keyed by normalized SQL and source file fingerprints.
+
+    First pages are kept in memory up to `max_bytes`. Every entry also points to its
+    spilled Parquet file in `store`, which serves pages after the memory copy is evicted
+    and until the file expires.
+    """
+
+    def __init__(self, store: ResultStore, max_bytes: int = RESULT_CACHE_BYTES, maxsize: int = RESULT_CACHE_SIZE):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.index = LRUCache(maxsize)
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return self.index.get(key) is not None
+
+    def get(self, con: duckdb.DuckDBPyConnection, key: str, max_rows: int) -> tuple | None:
+        """Return the cached first page, row count and result ID for `key`, or None."""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        result_id, row_count = entry
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None:
+                self.memory.move_to_end(key)
+        # Serve from memory if later pages, if any, are still on disk
+        if cached is not None and (row_count <= len(cached[0]) or os.path.exists(self.store.path(result_id))):
+            return cached[0], row_count, result_id
+        try:
+            result, row_count = self.store.page(con, result_id, 0, max_rows)
+        except KeyError:
+            self.index.pop(key)
+            with self.lock:
+                if key in self.memory:
+                    self.memory_bytes -= self.memory.pop(key)[1]
+            return None
+        return result, row_count, result_id
+
+    def set(self, key: str, result: pd.DataFrame, row_count: int, result_id: str):
+        self.index.set(key, (result_id, row_count))
+        size = int(result.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_bytes -= self.memory.pop(key)[1]
+            self.memory[key] = (result, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_bytes:
+                self.memory_bytes -= self.memory.popitem(last=False)[1][1]
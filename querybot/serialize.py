@@ -0,0 +1,100 @@
+from fastapi.responses import JSONResponse
+import datetime
+import json
+import math
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# Custom JSON encoder to handle non-serializable values
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (np.integer, np.floating, np.bool_)):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, pd.Series):
+            return obj.tolist()
+        if isinstance(obj, (pd.Timestamp, pd._libs.tslibs.timestamps.Timestamp)):
+            return obj.isoformat()
+        if isinstance(obj, (datetime.date, datetime.time)):
+            return obj.isoformat()
+        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+            return None
+        return super().default(obj)
+
+
+json_default = CustomJSONEncoder().default
+
+
+def dumps(content) -> bytes:
+    """Serialize to JSON with orjson if it is installed, else with CustomJSONEncoder."""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(
+        content, cls=CustomJSONEncoder, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that serializes with dumps()."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def column_to_list(series: pd.Series) -> list:
+    """Convert a column to a list of JSON-compatible values, one vectorized pass per column.
+
+    NaN, inf, NA and NaT become None; timestamps become ISO 8601 strings.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        utc = series.dt.tz_convert("UTC").dt.tz_localize(None)
+        return [None if value is None else f"{value}+00:00" for value in column_to_list(utc)]
+    if dtype.kind == "M":
+        values = series.to_numpy().astype("datetime64[us]")
+        missing = np.isnat(values)
+        # Match Timestamp.isoformat(): show microseconds only if any value has them
+        has_fraction = (values[~missing].view("int64") % 1_000_000 != 0).any()
+        strings = np.datetime_as_string(values, unit="us" if has_fraction else "s").astype(object)
+        strings[missing] = None
+        return strings.tolist()
+    if dtype.kind == "m":
+        strings = series.astype(str).to_numpy(dtype=object, copy=True)
+        strings[series.isna().to_numpy()] = None
+        return strings.tolist()
+    if dtype.kind == "f" and isinstance(dtype, np.dtype):
+        values = series.to_numpy()
+        result = values.astype(object)
+        result[~np.isfinite(values)] = None
+        return result.tolist()
+    if dtype.kind in "iub" and isinstance(dtype, np.dtype):
+        return series.tolist()
+    # Nullable extension types, strings and nested values
+    values = series.to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+def dataframe_to_columns(result: pd.DataFrame) -> tuple[list, list]:
+    """Return the column names and a JSON-compatible list of values per column."""
+    columns = [str(column) for column in result.columns]
+    return columns, [column_to_list(result.iloc[:, i]) for i in range(len(columns))]
+
+
+def dataframe_to_records(result: pd.DataFrame) -> list[dict]:
+    """Convert a query result to JSON-compatible records."""
+    columns, values = dataframe_to_columns(result)
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def dataframe_to_rows(result: pd.DataFrame) -> dict:
+    """Convert a query result to `{"columns": [...], "data": [[...], ...]}`."""
+    columns, values = dataframe_to_columns(result)
+    return {"columns": columns, "data": [list(row) for row in zip(*values)]}
@@ -0,0 +1,175 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from querybot.cache import LRUCache
+
+# Sessions unused for this long are dropped from the shared catalog
+SHARED_CATALOG_TTL = float(os.getenv("QUERYBOT_SHARED_CATALOG_TTL", 7 * 24 * 3600))
+
+# Write a session's last use at most this often, and prune idle sessions at most this often
+TOUCH_INTERVAL = 60
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    session_id TEXT NOT NULL,
+    dataset_name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    file_path TEXT,
+    fingerprint TEXT,
+    dataset TEXT,
+    PRIMARY KEY (session_id, dataset_name)
+);
+"""
+
+
+class SharedCatalog:
+    """Datasets registered by each session, in a SQLite file that every worker process shares.
+
+    Each session has a version that goes up whenever one of its datasets is stored or
+    removed, and each dataset row records the version that last changed it. Workers
+    check the version on each request and only read the rows changed since they last
+    synced. SQLite's file locks serialize writers across processes, and WAL mode lets
+    readers carry on meanwhile.
+    """
+
+    def __init__(self, path: str, ttl: float = SHARED_CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        self.touched = LRUCache(10000)
+        self.last_pruned = 0.0
+
+    def connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, as SQLite connections cannot be shared by threads."""
+        con = getattr(self.local, "con", None)
+        if con is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = NORMAL")
+            con.executescript(SCHEMA)
+            self.local.con = con
+        return con
+
+    def version(self, session_id: str) -> int:
+        """Return the session's version, 0 if it has no datasets, and note that it was used."""
+        con = self.connect()
+        now = time.time()
+        if self.touched.get(session_id, 0.0) + TOUCH_INTERVAL < now:
+            self.touched.set(session_id, now)
+            con.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+        row = con.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def changes(self, session_id: str, since: int) -> tuple[int, list[dict]]:
+        """Return the session's version and its datasets changed after version `since`.
+
+        Each dataset is `{"dataset_name", "deleted", "file_path", "fingerprint", "dataset"}`.
+        """
+        con = self.connect()
+        con.execute("BEGIN")
+        try:
+            row = con.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            rows = con.execute(
+                "SELECT dataset_name, deleted, file_path, fingerprint, dataset FROM datasets "
+                "WHERE session_id = ? AND version > ? ORDER BY version",
+                (session_id, since),
+            ).fetchall()
+        finally:
+            con.execute("COMMIT")
+        changed = [
+            {
+                "dataset_name": dataset_name,
+                "deleted": bool(deleted),
+                "file_path": file_path,
+                "fingerprint": fingerprint,
+                "dataset": json.loads(dataset) if dataset else None,
+            }
+            for dataset_name, deleted, file_path, fingerprint, dataset in rows
+        ]
+        return (row[0] if row else 0), changed
+
+    def bump(self, con: sqlite3.Connection, session_id: str) -> int:
+        now = time.time()
+        return con.execute(
+            "INSERT INTO sessions (session_id, version, last_used) VALUES (?, 1, ?) "
+            "ON CONFLICT (session_id) DO UPDATE "
+            "SET version = version + 1, last_used = excluded.last_used "
+            "RETURNING version",
+            (session_id, now),
+        ).fetchone()[0]
+
+    def put(
+        self, session_id: str, dataset_name: str, file_path: str, fingerprint: str | None, dataset: dict
+    ) -> int:
+        """Store a session's dataset as JSON and return the session's new version."""
+        con = self.connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.bump(con, session_id)
+            con.execute(
+                "INSERT OR REPLACE INTO datasets "
+                "(session_id, dataset_name, version, deleted, file_path, fingerprint, dataset) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                (session_id, dataset_name, version, file_path, fingerprint, json.dumps(dataset)),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        self.prune()
+        return version
+
+    def remove(self, session_id: str, dataset_name: str) -> int:
+        """Mark a session's dataset as removed, so other workers drop it, and return the new version.
+
+        Datasets that were never stored leave the catalog, and the session's version, unchanged.
+        """
+        con = self.connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            stored = con.execute(
+                "SELECT 1 FROM datasets WHERE session_id = ? AND dataset_name = ? AND NOT deleted",
+                (session_id, dataset_name),
+            ).fetchone()
+            if not stored:
+                row = con.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                con.execute("COMMIT")
+                return row[0] if row else 0
+            version = self.bump(con, session_id)
+            con.execute(
+                "UPDATE datasets SET version = ?, deleted = 1, dataset = NULL "
+                "WHERE session_id = ? AND dataset_name = ?",
+                (version, session_id, dataset_name),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return version
+
+    def prune(self):
+        """Drop sessions unused for `ttl` seconds, at most once per PRUNE_INTERVAL per process."""
+        now = time.time()
+        if self.last_pruned + PRUNE_INTERVAL > now:
+            return
+        self.last_pruned = now
+        con = self.connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            expired = "SELECT session_id FROM sessions WHERE last_used < ?"
+            con.execute(f"DELETE FROM datasets WHERE session_id IN ({expired})", (now - self.ttl,))
+            con.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl,))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
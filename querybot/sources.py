@@ -0,0 +1,262 @@
+import duckdb
+import hashlib
+import os
+import re
+import threading
+import urllib.parse
+from collections import Counter
+from pathlib import Path
+
+# Characters that make a file path a glob pattern
+GLOB_CHARS = re.compile(r"[*?\[]")
+# Functions that read many files of each type as one dataset
+READERS = {
+    ".csv": "read_csv_auto",
+    ".txt": "read_csv_auto",
+    ".parquet": "read_parquet",
+    ".json": "read_json_auto",
+}
+# Hive partition folders, e.g. date=2026-10-01
+PARTITION = re.compile(r"^([^=/]+)=([^/]*)$")
+
+
+def is_local(file_path: str) -> bool:
+    # Treat Windows drive letters (C:\...) as local paths, not URL schemes
+    return len(urllib.parse.urlparse(file_path).scheme) <= 1
+
+
+def is_multi_file(file_path: str) -> bool:
+    """Whether `file_path` is a glob pattern or a local directory, read as one dataset."""
+    if urllib.parse.urlparse(file_path).scheme in ("http", "https"):
+        return False  # DuckDB does not glob HTTP, and "?" starts a query string
+    if is_local(file_path) and os.path.isfile(file_path):
+        return False  # A file whose name has glob characters, e.g. sales[2023].csv
+    if GLOB_CHARS.search(file_path):
+        return True
+    return is_local(file_path) and os.path.isdir(file_path)
+
+
+def source_root(file_path: str) -> str:
+    """Return the directory a glob pattern starts matching in, or the directory itself."""
+    parts = file_path.replace(os.sep, "/").split("/")
+    for i, part in enumerate(parts):
+        if GLOB_CHARS.search(part):
+            return "/".join(parts[:i]) or "/"
+    return file_path.rstrip("/") or "/"
+
+
+def source_name(file_path: str) -> str:
+    """Name a directory or glob source after the folder it reads, e.g. events for events/*/*.parquet."""
+    return Path(source_root(file_path)).name or "dataset"
+
+
+def pattern_regex(pattern: str) -> re.Pattern:
+    """Translate a DuckDB glob into a regex over "/"-separated paths: `**` spans folders, `*` does not."""
+    regex, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex.append("(?:[^/]*/)*")
+            i += 3
+        elif pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1:end].replace("\\", "\\\\")
+            regex.append("[" + ("^" + chars[1:] if chars.startswith("!") else chars) + "]")
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(regex) + r"\Z")
+
+
+def read_function_for(source: str, extension: str, partitioned: bool) -> str:
+    """Return the read function for a glob, or a list of files, as one dataset.
+
+    Files are matched by column name, so ones with extra or reordered columns still line
+    up, and Hive partition folders become columns that queries can filter on.
+    """
+    options = "union_by_name = true" + (", hive_partitioning = true" if partitioned else "")
+    return f"{READERS[extension]}({source}, {options})"
+
+
+def merge_schemas(schema_info: list, added: list) -> list | None:
+    """Add the new columns of `added` to `schema_info`, or return None if a column's type differs."""
+    types = {col[0]: col[1] for col in schema_info}
+    merged = list(schema_info)
+    for col in added:
+        if col[0] not in types:
+            merged.append(col)
+        elif types[col[0]] != col[1]:
+            return None
+    return merged
+
+
+class SourceIndex:
+    """The files of directory and glob sources, listed incrementally, with their schemas.
+
+    Each directory's entries are kept with its mtime, which changes when files are added,
+    removed or renamed in it, so an unchanged directory is not listed again and its files
+    are not stat'ed again. Files are expected not to be rewritten in place, as with
+    partitioned exports. A source's schema is extended by describing only the files
+    added since it was last described, and is described from scratch when files are
+    removed or a column's type changes. Remote globs are left to DuckDB to list.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Directory -> (mtime_ns, subdirectories, {file path: (size, mtime_ns)})
+        self.directories = {}
+        # Source -> {"files", "fingerprint", "extension", "read_function", "described", "schema_info"}
+        self.sources = {}
+
+    def walk(self, directory: str, depth: int | None, files: dict):
+        """Add the files under `directory`, down to `depth` folders below it (None for any depth)."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            self.directories.pop(directory, None)
+            return
+        cached = self.directories.get(directory)
+        if cached is None or cached[0] != mtime:
+            subdirectories, entries = [], {}
+            with os.scandir(directory) as scan:
+                for entry in scan:
+                    # Skip hidden files and writers' markers, e.g. Spark's _SUCCESS and _temporary
+                    if entry.name.startswith((".", "_")):
+                        continue
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        entries[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            cached = self.directories[directory] = (mtime, subdirectories, entries)
+        files.update(cached[2])
+        if depth is None or depth > 0:
+            for subdirectory in cached[1]:
+                self.walk(subdirectory, None if depth is None else depth - 1, files)
+
+    def list(self, file_path: str) -> dict:
+        """Return the data files of a local directory or glob source, `{path: (size, mtime_ns)}`."""
+        root = source_root(file_path)
+        if GLOB_CHARS.search(file_path):
+            pattern = file_path.replace(os.sep, "/")
+            rest = pattern[len(root):].strip("/")
+            depth = None if "**" in rest else rest.count("/")
+        else:
+            pattern, depth = None, None
+        files = {}
+        with self.lock:
+            self.walk(root, depth, files)
+        if pattern:
+            regex = pattern_regex(pattern)
+            files = {path: stat for path, stat in files.items() if regex.match(path.replace(os.sep, "/"))}
+            extensions = {Path(path).suffix.lower() for path in files}
+            if len(extensions) > 1:
+                raise ValueError(f"{file_path} matches files of several types: {', '.join(sorted(extensions))}")
+            extension = next(iter(extensions), None)
+        else:
+            # A directory reads its most common type of data file
+            counts = Counter(Path(path).suffix.lower() for path in files)
+            extension = max((ext for ext in counts if ext in READERS), key=counts.get, default=None)
+            files = {path: stat for path, stat in files.items() if Path(path).suffix.lower() == extension}
+        if extension is not None and extension not in READERS:
+            raise ValueError(f"Unsupported file type for a directory or glob: {extension}")
+
+        with self.lock:
+            state = self.sources.setdefault(file_path, {"files": None, "described": {}})
+            if state["files"] != files:
+                digest = hashlib.sha1()
+                for path in sorted(files):
+                    digest.update(f"{path}\0{files[path][0]}\0{files[path][1]}\n".encode())
+                partitioned = any(
+                    PARTITION.match(part) for path in files for part in self.folders(root, path)
+                )
+                source = pattern or f"{root.rstrip('/')}/**/*{extension}"
+                state.update(
+                    files=files,
+                    fingerprint=f"files:{len(files)}:{digest.hexdigest()}",
+                    extension=extension,
+                    read_function=extension and read_function_for(f"'{source}'", extension, partitioned),
+                )
+        return files
+
+    def folders(self, root: str, path: str) -> list:
+        """Return the folders between `root` and a file in it."""
+        return os.path.relpath(os.path.dirname(path), root).replace(os.sep, "/").split("/")
+
+    def fingerprint(self, file_path: str) -> str | None:
+        """Return a string that changes whenever a file is added to, removed from or renamed in a source."""
+        if not is_local(file_path):
+            return None
+        try:
+            files = self.list(file_path)
+        except (OSError, ValueError):
+            return None
+        return self.sources[file_path]["fingerprint"] if files else None
+
+    def describe(self, con: duckdb.DuckDBPyConnection, file_path: str) -> tuple[list, str]:
+        """Return the DESCRIBE output and read function of a directory or glob source."""
+        if not is_local(file_path):
+            extension = Path(file_path).suffix.lower()
+            if extension not in READERS:
+                raise ValueError(f"Unsupported file type for a glob: {extension or file_path}")
+            read_function = read_function_for(f"'{file_path}'", extension, "=" in file_path)
+            return con.execute(f"DESCRIBE SELECT * FROM {read_function} LIMIT 0").fetchall(), read_function
+
+        files = self.list(file_path)
+        if not files:
+            raise ValueError(f"No data files found in {file_path}")
+        state = self.sources[file_path]
+        read_function, described = state["read_function"], state["described"]
+        added = [path for path, stat in files.items() if described.get(path) != stat]
+        removed = any(path not in files for path in described)
+        if described and not added and not removed:
+            return state["schema_info"], read_function
+
+        schema_info = None
+        if described and not removed:
+            # Only read the new files' schemas, e.g. a new day's partition
+            paths = "[" + ", ".join(f"'{path}'" for path in sorted(added)) + "]"
+            partitioned = "hive_partitioning" in read_function
+            new_files = read_function_for(paths, state["extension"], partitioned)
+            added_info = con.execute(f"DESCRIBE SELECT * FROM {new_files} LIMIT 0").fetchall()
+            schema_info = merge_schemas(state["schema_info"], added_info)
+        if schema_info is None:
+            schema_info = con.execute(f"DESCRIBE SELECT * FROM {read_function} LIMIT 0").fetchall()
+        with self.lock:
+            state.update(described=files, schema_info=schema_info)
+        return schema_info, read_function
+
+    def partitions(self, file_path: str) -> dict:
+        """Return the Hive partition columns of a local source and their values, as last listed."""
+        state = self.sources.get(file_path)
+        if not state or not state["files"]:
+            return {}
+        root, values = source_root(file_path), {}
+        for path in state["files"]:
+            for part in self.folders(root, path):
+                match = PARTITION.match(part)
+                if match:
+                    values.setdefault(match.group(1), set()).add(match.group(2))
+        return {name: sorted(found) for name, found in values.items()}
+
+    def partition_notes(self, file_path: str) -> dict:
+        """Describe each partition column for the LLM prompt, so queries filter on it."""
+        notes = {}
+        for name, values in self.partitions(file_path).items():
+            count = f"{len(values):,} folders" if len(values) > 1 else "1 folder"
+            span = f"{values[0]} to {values[-1]}" if len(values) > 1 else values[0]
+            notes[name] = f"partition column ({count}, {span}): filter on it to read only matching files"
+        return notes
+
+
+# Shared by every workspace, and by file_fingerprint()
+source_index = SourceIndex()
@@ -0,0 +1,109 @@
+from functools import lru_cache
+import re
+
+# Parts of SQL that must not be rewritten: string literals, quoted identifiers and
+# comments. [bracketed] names are matched too, so they can be turned into quoted ones.
+PROTECTED_SQL = re.compile(
+    r"""'(?:[^']|'')*'?|"(?:[^"]|"")*"?|--[^\n]*|/\*.*?(?:\*/|$)|\[[^\[\]'"]+\]""",
+    re.DOTALL,
+)
+
+
+def quote_column_name(column_name: str) -> str:
+    """Quote column names that contain spaces or special characters."""
+    # Skip empty or None column names
+    if not column_name:
+        return column_name
+
+    # Remove any existing quotes first
+    column_name = column_name.strip('"')
+
+    # Only quote if the column name contains spaces or special characters
+    if ' ' in column_name or any(c in column_name for c in '[](){}<>+-*/=!@#$%^&|\\'):
+        return f'"{column_name}"'
+    return column_name
+
+
+def is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+@lru_cache(maxsize=1024)
+def column_trie(column_names: tuple) -> dict:
+    """Build a character trie of column names. The "" key of a node holds the name to write for it."""
+    trie = {}
+    for name in column_names:
+        name = (name or "").strip('"')
+        if not name:
+            continue
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[""] = quote_column_name(name)
+    return trie
+
+
+def trie_lookup(tries: list, name: str) -> str | None:
+    """Return the quoted form of `name` if it is exactly a column name in one of `tries`."""
+    for node in tries:
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            if "" in node:
+                return node[""]
+    return None
+
+
+def quote_code(code: str, tries: list) -> str:
+    """Quote the longest column name found at each word boundary in unprotected SQL."""
+    parts, last, i, n = [], 0, 0, len(code)
+    while i < n:
+        char = code[i]
+        # Column names only start at a word boundary
+        if i and is_word(char) and is_word(code[i - 1]):
+            i += 1
+            continue
+        end, quoted = 0, None
+        for node in tries:
+            j = i
+            while j < n:
+                node = node.get(code[j])
+                if node is None:
+                    break
+                j += 1
+                # ...and end at one
+                if "" in node and j > end and (j == n or not (is_word(code[j]) and is_word(code[j - 1]))):
+                    end, quoted = j, node[""]
+        if quoted is None:
+            i += 1
+            continue
+        parts.append(code[last:i])
+        parts.append(quoted)
+        i = last = end
+    parts.append(code[last:])
+    return "".join(parts)
+
+
+def quote_columns(sql_query: str, tries: list) -> str:
+    """Quote column names that need it in one pass over `sql_query`.
+
+    String literals, comments and quoted identifiers are left alone. `[Column Name]`
+    brackets, as used in the schemas shown to the LLM, become `"Column Name"` quotes.
+    """
+    tries = [trie for trie in tries if trie]
+    if not tries:
+        return sql_query
+    parts, last = [], 0
+    for match in PROTECTED_SQL.finditer(sql_query):
+        parts.append(quote_code(sql_query[last:match.start()], tries))
+        token = match.group()
+        if token.startswith("["):
+            quoted = trie_lookup(tries, token[1:-1])
+            if quoted is not None:
+                token = quoted if quoted.startswith('"') else f'"{quoted}"'
+        parts.append(token)
+        last = match.end()
+    parts.append(quote_code(sql_query[last:], tries))
+    return "".join(parts)
@@ -235,6 +235,13 @@ function renderOutput(data) {
           </div>
         `
       )}
+      ${(data.failed_datasets || []).map(
+        (dataset) => html`
+          <div class="alert alert-danger">
+            Failed to load ${dataset.file_path}: ${dataset.error}
+          </div>
+        `
+      )}
     </div>
   `;
   render(template, output);
@@ -320,15 +327,65 @@ async function executeQuery() {
       requestBody.api_base = customBaseUrl;
     }
 
-    const response = await fetch("/query", {
+    const response = await fetch("/query/stream", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(requestBody),
     });
+    if (!response.ok) {
+      let result;
+      try {
+        result = await response.json();
+      } catch (jsonError) {
+        result = { error: response.statusText };
+      }
+      renderQueryError(result, responseOutput);
+      return;
+    }
+
+    // Render the LLM response and result rows as they stream in
+    let llmResponse = "";
+    let truncated = false;
+    let warnings = [];
+    let columns;
+    let renderPending = false;
+    latestQueryResult = [];
+    const renderResult = () => {
+      renderPending = false;
+      render(queryResultTemplate(query, llmResponse, truncated, warnings), responseOutput);
+    };
+    const scheduleRender = () => {
+      if (!renderPending) {
+        renderPending = true;
+        requestAnimationFrame(renderResult);
+      }
+    };
 
-    let result;
     try {
-      result = await response.json();
+      for await (const event of readNDJSON(response)) {
+        if (event.type === "token") {
+          llmResponse += event.content;
+          scheduleRender();
+        } else if (event.type === "rows") {
+          renderResult();
+          const table = document.getElementById("sqlResultTable");
+          if (!columns) {
+            columns = event.columns;
+            table.innerHTML = generateTable(event.rows, columns);
+          } else {
+            appendTableRows(table, event.rows, columns);
+          }
+          latestQueryResult.push(...event.rows);
+        } else if (event.type === "warning") {
+          warnings = event.warnings;
+          scheduleRender();
+        } else if (event.type === "done") {
+          truncated = event.truncated;
+        } else if (event.type === "error") {
+          renderQueryError(event, responseOutput);
+          return;
+        }
+      }
     } catch (jsonError) {
       const errorTemplate = html`
         <div class="alert alert-danger" role="alert">
@@ -340,112 +397,130 @@ async function executeQuery() {
       render(errorTemplate, responseOutput);
       return;
     }
-    if (!response.ok) {
-      const errorTemplate = html`
-        <div class="alert alert-danger" role="alert">
-          <h5>Error: ${result.error}</h5>
-          ${result.llm_response
-            ? html`
-                <hr />
-                <h6>LLM Response:</h6>
-                <div>${unsafeHTML(marked.parse(result.llm_response))}</div>
-              `
-            : ""}
-        </div>
-      `;
-      render(errorTemplate, responseOutput);
-      return;
-    }
-
-    // Store the latest query result
-    latestQueryResult = result.result;
+    renderResult();
 
     // Save the query to recent queries
-    addRecentQuery(query, result.result);
+    addRecentQuery(query, latestQueryResult);
     renderRecentQueries();
+  } catch (error) {
+    renderError(error.message);
+  }
+}
 
-    const queryOutput = html`
-      <div class="card">
-        <div class="card-header">
-          <h5>Query Result</h5>
-        </div>
-        <div class="card-body">
-          <h6>Response from LLM:</h6>
-          <div>${unsafeHTML(marked.parse(result.llm_response))}</div>
-          <h6>SQL Query Execution Result:</h6>
-          <div
-            id="sqlResultTable"
-            class="table-responsive"
-            style="max-height: 50vh;"
-          ></div>
-          <div class="mt-3">
-            <div class="row align-items-center g-2">
-              <div class="col-2">
-                <button
-                  class="btn btn-primary me-2"
-                  @click=${() => downloadCSV(result.result, "query_result.csv")}
-                >
-                  <i class="bi bi-download"></i> Download CSV
-                </button>
-              </div>
-              <div class="col-8">
-                <input
-                  type="text"
-                  id="chart-input"
-                  class="form-control"
-                  placeholder="Describe what you want to chart"
-                  value="Draw the most appropriate chart to visualize this data"
-                />
-              </div>
-              <div class="col-2">
-                <button
-                  id="chart-button"
-                  class="btn btn-primary"
-                  @click=${() => generateChart()}
-                >
-                  <i class="bi bi-bar-chart-line"></i> Draw Chart
-                </button>
-              </div>
-            </div>
-            <div class="row mt-3">
-              <div class="col-12">
-                <div id="chart-container" class="mt-3" style="display: none;">
-                  <canvas id="chart"></canvas>
-                </div>
-                <div id="chart-code" class="mt-3"></div>
-              </div>
+// Parse a newline-delimited JSON response, yielding each event as it arrives
+async function* readNDJSON(response) {
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    for (const line of lines) if (line.trim()) yield JSON.parse(line);
+  }
+  if (buffer.trim()) yield JSON.parse(buffer);
+}
+
+function renderQueryError(result, responseOutput) {
+  const errorTemplate = html`
+    <div class="alert alert-danger" role="alert">
+      <h5>Error: ${result.error}</h5>
+      ${result.llm_response
+        ? html`
+            <hr />
+            <h6>LLM Response:</h6>
+            <div>${unsafeHTML(marked.parse(result.llm_response))}</div>
+          `
+        : ""}
+    </div>
+  `;
+  render(errorTemplate, responseOutput);
+}
+
+function queryResultTemplate(query, llmResponse, truncated, warnings = []) {
+  return html`
+    <div class="card">
+      <div class="card-header">
+        <h5>Query Result</h5>
+      </div>
+      <div class="card-body">
+        <h6>Response from LLM:</h6>
+        <div>${unsafeHTML(marked.parse(llmResponse))}</div>
+        <h6>SQL Query Execution Result:</h6>
+        ${warnings.map(
+          (warning) => html`<div class="alert alert-warning py-1">${warning}</div>`
+        )}
+        <div
+          id="sqlResultTable"
+          class="table-responsive"
+          style="max-height: 50vh;"
+        ></div>
+        ${truncated
+          ? html`<div class="alert alert-warning py-1 mt-2">
+              Showing the first ${latestQueryResult.length} rows only.
+            </div>`
+          : ""}
+        <div class="mt-3">
+          <div class="row align-items-center g-2">
+            <div class="col-2">
+              <button
+                class="btn btn-primary me-2"
+                @click=${() => downloadCSV(latestQueryResult, "query_result.csv")}
+              >
+                <i class="bi bi-download"></i> Download CSV
+              </button>
             </div>
-          </div>
-          <div class="row mt-2">
-            <div class="col-md-8">
+            <div class="col-8">
               <input
                 type="text"
-                id="additionalPrompt"
+                id="chart-input"
                 class="form-control"
-                placeholder="Optional: Add specific instructions for the explanation..."
+                placeholder="Describe what you want to chart"
+                value="Draw the most appropriate chart to visualize this data"
               />
             </div>
-            <div class="col-md-4">
+            <div class="col-2">
               <button
-                class="btn btn-info"
-                @click=${() => explainResults(result.result, query)}
+                id="chart-button"
+                class="btn btn-primary"
+                @click=${() => generateChart()}
               >
-                <i class="bi bi-lightbulb"></i> Explain Results
+                <i class="bi bi-bar-chart-line"></i> Draw Chart
               </button>
             </div>
           </div>
-          <div id="explanationOutput" class="mt-3"></div>
+          <div class="row mt-3">
+            <div class="col-12">
+              <div id="chart-container" class="mt-3" style="display: none;">
+                <canvas id="chart"></canvas>
+              </div>
+              <div id="chart-code" class="mt-3"></div>
+            </div>
+          </div>
         </div>
+        <div class="row mt-2">
+          <div class="col-md-8">
+            <input
+              type="text"
+              id="additionalPrompt"
+              class="form-control"
+              placeholder="Optional: Add specific instructions for the explanation..."
+            />
+          </div>
+          <div class="col-md-4">
+            <button
+              class="btn btn-info"
+              @click=${() => explainResults(latestQueryResult, query)}
+            >
+              <i class="bi bi-lightbulb"></i> Explain Results
+            </button>
+          </div>
+        </div>
+        <div id="explanationOutput" class="mt-3"></div>
       </div>
-    `;
-
-    render(queryOutput, responseOutput);
-    document.getElementById("sqlResultTable").innerHTML = generateTable(
-      result.result
-    );
-  } catch (error) {
-    renderError(error.message);
-  }
+    </div>
+  `;
 }
 
 // Add new explainResults function
@@ -581,29 +656,40 @@ async function loadFile() {
 }
 
 // Helper function to generate an HTML table from data
-function generateTable(data) {
+function generateTable(data, headers) {
   if (!Array.isArray(data) || !data.length) return "<p>No data available</p>";
 
-  const headers = Object.keys(data[0]);
+  headers = headers || Object.keys(data[0]);
   return `
     <table class="table table-bordered table-striped">
       <thead>
         <tr>${headers.map((header) => `<th>${header}</th>`).join("")}</tr>
       </thead>
       <tbody>
-        ${data
-          .map(
-            (row) =>
-              `<tr>${headers
-                .map((header) => `<td>${row[header] ?? ""}</td>`)
-                .join("")}</tr>`
-          )
-          .join("")}
+        ${tableRows(data, headers)}
       </tbody>
     </table>
   `;
 }
 
+function tableRows(data, headers) {
+  return data
+    .map(
+      (row) =>
+        `<tr>${headers
+          .map((header) => `<td>${row[header] ?? ""}</td>`)
+          .join("")}</tr>`
+    )
+    .join("");
+}
+
+// Append streamed rows to a table created by generateTable
+function appendTableRows(container, data, headers) {
+  const tbody = container.querySelector("tbody");
+  if (tbody) tbody.insertAdjacentHTML("beforeend", tableRows(data, headers));
+  else container.innerHTML = generateTable(data, headers);
+}
+
 // Optimized CSV conversion and download
 function convertToCSV(data) {
   if (!Array.isArray(data) || !data.length) return "";
@@ -633,6 +719,16 @@ function downloadCSV(data, filename = "data.csv") {
   URL.revokeObjectURL(link.href);
 }
 
+function formatBytes(bytes) {
+  const units = ["B", "KB", "MB", "GB", "TB"];
+  let i = 0;
+  while (bytes >= 1024 && i < units.length - 1) {
+    bytes /= 1024;
+    i++;
+  }
+  return `${bytes.toFixed(i ? 1 : 0)} ${units[i]}`;
+}
+
 async function listFiles() {
   const output = DOM.output();
   render(loading, output);
@@ -654,10 +750,16 @@ async function listFiles() {
             ${data.files.map(
               (file) => html`
                 <button
-                  class="list-group-item list-group-item-action"
-                  @click=${() => selectPath(file)}
+                  class="list-group-item list-group-item-action d-flex justify-content-between align-items-center"
+                  @click=${() => selectPath(file.path)}
+                  title=${file.path}
                 >
-                  ${file}
+                  ${file.name}
+                  <span>
+                    <span class="badge bg-secondary">${file.format}</span>
+                    ${file.parquet ? html`<span class="badge bg-success">parquet</span>` : ""}
+                    <small class="text-muted ms-2">${formatBytes(file.size)}</small>
+                  </span>
                 </button>
               `
             )}
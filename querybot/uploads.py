@@ -0,0 +1,384 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Largest file that can be uploaded, and seconds before an unfinished upload is deleted
+UPLOAD_MAX_BYTES = int(os.getenv("QUERYBOT_UPLOAD_MAX_BYTES", 100_000_000_000))
+UPLOAD_TTL = float(os.getenv("QUERYBOT_UPLOAD_TTL", 24 * 3600))
+
+# Bytes of request body gathered before each write to disk
+WRITE_BYTES = 1 << 20
+
+
+class UploadError(Exception):
+    """A failed upload step, with the JSON content and HTTP status to return to the client."""
+
+    def __init__(self, message: str, status_code: int = 400, **content):
+        super().__init__(message)
+        self.content = {"error": message, **content}
+        self.status_code = status_code
+
+
+def safe_filename(filename: str, extensions: set) -> str:
+    """Return the base name of an uploaded file, or raise UploadError if it cannot be stored."""
+    name = Path(str(filename).replace("\\", "/")).name
+    if not name or name.startswith("."):
+        raise UploadError(f"Invalid file name: {filename!r}")
+    if Path(name).suffix.lower() not in extensions:
+        raise UploadError(f"Unsupported file type: {Path(name).suffix or name}")
+    return name
+
+
+class UploadStore:
+    """Files uploaded to the server, streamed to disk under `directory`.
+
+    Each file is stored as `<upload_id>/<filename>`, so files of the same name uploaded
+    by different sessions do not overwrite each other.
+
+    Whole files can be sent in one multipart request (`receive_multipart`). Large ones
+    can be sent as a resumable upload instead: `create` it, then `append` chunks at
+    the offset it has reached, which `status` reports after an interruption. Unfinished
+    uploads live under `.partial/` as `<upload_id>.part`, with the declared name, size
+    and SHA-256 in `<upload_id>.json`, so any worker process can resume them. Their
+    offset is the size of the part file. `.manifest.json` records each stored file's SHA-256
+    by its path relative to `directory`.
+    """
+
+    def __init__(
+        self, directory: str, extensions: set, max_bytes: int = UPLOAD_MAX_BYTES, ttl: float = UPLOAD_TTL
+    ):
+        self.directory = directory
+        self.partial_directory = os.path.join(directory, ".partial")
+        self.manifest_path = os.path.join(directory, ".manifest.json")
+        self.extensions = extensions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # Chunks of one upload are appended one at a time
+        self.upload_locks = {}
+        # Running SHA-256 of uploads whose chunks arrived in order in this process: (offset, hash)
+        self.hashes = {}
+
+    def paths(self, upload_id: str) -> tuple[str, str]:
+        if not upload_id.isalnum():
+            raise UploadError("Unknown upload", status_code=404)
+        base = os.path.join(self.partial_directory, upload_id)
+        return f"{base}.part", f"{base}.json"
+
+    def create(self, filename: str, size: int, sha256: str | None = None, convert: bool = False) -> dict:
+        """Start a resumable upload of `size` bytes and return its status.
+
+        `convert` is kept with the upload for the caller to act on once it is stored.
+        """
+        name = safe_filename(filename, self.extensions)
+        if size < 0 or size > self.max_bytes:
+            raise UploadError(f"File size must be between 0 and {self.max_bytes:,} bytes", status_code=413)
+        self.prune()
+        os.makedirs(self.partial_directory, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self.paths(upload_id)
+        upload = {
+            "upload_id": upload_id,
+            "filename": name,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "convert": convert,
+            "created": time.time(),
+        }
+        open(part_path, "wb").close()
+        with open(meta_path, "w") as f:
+            json.dump(upload, f)
+        self.hashes[upload_id] = (0, hashlib.sha256())
+        return {**upload, "offset": 0}
+
+    def status(self, upload_id: str) -> dict:
+        """Return an unfinished upload with the `offset` to send its next chunk from."""
+        part_path, meta_path = self.paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                upload = json.load(f)
+            return {**upload, "offset": os.path.getsize(part_path)}
+        except (FileNotFoundError, ValueError):
+            raise UploadError("Unknown upload", status_code=404) from None
+
+    async def append(
+        self, upload_id: str, offset: int, chunks: AsyncIterator[bytes], chunk_sha256: str | None = None
+    ) -> dict:
+        """Write a chunk of the request body at `offset` and return the upload's status.
+
+        The chunk is dropped if `chunk_sha256` does not match it, or if `offset` is not
+        where the upload stopped. Once every byte has arrived, the file is checked
+        against the declared SHA-256 and stored, and the status has its `file` entry.
+        """
+        async with self.upload_locks.setdefault(upload_id, asyncio.Lock()):
+            upload = self.status(upload_id)
+            if offset != upload["offset"]:
+                raise UploadError(
+                    f"Upload is at offset {upload['offset']}, not {offset}",
+                    status_code=409,
+                    offset=upload["offset"],
+                )
+            part_path, _ = self.paths(upload_id)
+            chunk_hash = hashlib.sha256()
+            running = self.hashes.get(upload_id)
+            file_hash = running[1].copy() if running and running[0] == offset else None
+
+            def write(f, data: bytes):
+                f.write(data)
+                chunk_hash.update(data)
+                if file_hash:
+                    file_hash.update(data)
+
+            with open(part_path, "r+b") as f:
+                f.seek(offset)
+                try:
+                    async for data in self.buffered(chunks):
+                        if f.tell() + len(data) > upload["size"]:
+                            raise UploadError(f"Chunk goes past the file size of {upload['size']:,} bytes")
+                        # Write and hash in a thread, so large chunks don't block the event loop
+                        await asyncio.to_thread(write, f, data)
+                    if chunk_sha256 and chunk_hash.hexdigest() != chunk_sha256.lower():
+                        raise UploadError("Chunk checksum mismatch, send it again", offset=offset)
+                except BaseException:
+                    # Keep the upload at the last complete chunk, so it can resume from there
+                    f.truncate(offset)
+                    raise
+                end = f.tell()
+            if file_hash:
+                self.hashes[upload_id] = (end, file_hash)
+            upload["offset"] = end
+            if end == upload["size"]:
+                upload["file"] = await asyncio.to_thread(self.finish, upload)
+            return upload
+
+    def finish(self, upload: dict) -> dict:
+        """Verify a complete upload's SHA-256 and move it into place."""
+        upload_id = upload["upload_id"]
+        part_path, meta_path = self.paths(upload_id)
+        running = self.hashes.pop(upload_id, None)
+        self.upload_locks.pop(upload_id, None)
+        if running and running[0] == upload["size"]:
+            sha256 = running[1].hexdigest()
+        else:
+            # Chunks came to other processes, or before a restart: hash the file again
+            sha256 = file_sha256(part_path)
+        if upload["sha256"] and sha256 != upload["sha256"]:
+            self.cancel(upload_id)
+            raise UploadError("File checksum mismatch, the upload was discarded", status_code=422)
+        path = self.store(part_path, upload_id, upload["filename"])
+        os.remove(meta_path)
+        return self.record(path, sha256)
+
+    def store(self, part_path: str, upload_id: str, filename: str) -> str:
+        """Move a received file to `<upload_id>/<filename>` and return its path."""
+        os.makedirs(os.path.join(self.directory, upload_id), exist_ok=True)
+        path = os.path.join(self.directory, upload_id, filename)
+        os.replace(part_path, path)
+        return path
+
+    def cancel(self, upload_id: str):
+        """Delete an unfinished upload."""
+        self.hashes.pop(upload_id, None)
+        self.upload_locks.pop(upload_id, None)
+        for path in self.paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def receive_multipart(self, content_type: str, body: AsyncIterator[bytes]) -> list[dict]:
+        """Store every file in a multipart/form-data request body and return them.
+
+        Files are written to disk as the body arrives, up to WRITE_BYTES at a time.
+        """
+        content_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected a multipart/form-data body")
+        os.makedirs(self.partial_directory, exist_ok=True)
+        parts, current, header = [], {}, {"field": b"", "value": b""}
+
+        def close_part(keep: bool):
+            if current.get("file"):
+                current["file"].close()
+                current["file"] = None
+                if not keep:
+                    os.remove(current["tmp_path"])
+
+        def on_part_begin():
+            current.clear()
+            current.update(headers={}, file=None, size=0)
+
+        def on_header_field(data: bytes, start: int, end: int):
+            header["field"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int):
+            header["value"] += data[start:end]
+
+        def on_header_end():
+            current["headers"][header["field"].lower()] = header["value"]
+            header["field"], header["value"] = b"", b""
+
+        def on_headers_finished():
+            _, disposition = parse_options_header(current["headers"].get(b"content-disposition", b""))
+            filename = disposition.get(b"filename")
+            if filename is None:
+                return  # A plain form field, ignored
+            current["filename"] = safe_filename(filename.decode("utf-8", "replace"), self.extensions)
+            current["upload_id"] = uuid.uuid4().hex
+            current["tmp_path"] = os.path.join(self.partial_directory, current["upload_id"] + ".part")
+            current["file"] = open(current["tmp_path"], "wb")
+            current["hash"] = hashlib.sha256()
+
+        def on_part_data(data: bytes, start: int, end: int):
+            if not current.get("file"):
+                return
+            current["size"] += end - start
+            if current["size"] > self.max_bytes:
+                message = f"{current['filename']} is larger than {self.max_bytes:,} bytes"
+                raise UploadError(message, status_code=413)
+            current["file"].write(data[start:end])
+            current["hash"].update(data[start:end])
+
+        def on_part_end():
+            if current.get("file"):
+                close_part(keep=True)
+                parts.append(dict(current))
+
+        parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": on_part_begin,
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_part_data": on_part_data,
+                "on_part_end": on_part_end,
+            },
+        )
+        try:
+            async for data in self.buffered(body):
+                # The parser's callbacks write and hash the files, so run it in a thread
+                await asyncio.to_thread(parser.write, data)
+            parser.finalize()
+            if not parts:
+                raise UploadError("No files in the request")
+        except BaseException:
+            close_part(keep=False)
+            for part in parts:
+                os.remove(part["tmp_path"])
+            raise
+
+        def store_parts() -> list[dict]:
+            stored = []
+            for part in parts:
+                path = self.store(part["tmp_path"], part["upload_id"], part["filename"])
+                stored.append(self.record(path, part["hash"].hexdigest()))
+            return stored
+
+        return await asyncio.to_thread(store_parts)
+
+    async def buffered(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Join the small pieces the server receives into writes of up to WRITE_BYTES."""
+        buffer = bytearray()
+        async for data in chunks:
+            buffer += data
+            if len(buffer) >= WRITE_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    def record(self, path: str, sha256: str) -> dict:
+        """Save a stored file's SHA-256 in the manifest and return its listing entry."""
+        with self.lock:
+            manifest = self.load()
+            manifest[self.key(path)] = {"sha256": sha256, "uploaded": time.time()}
+            tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_manifest, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_manifest, self.manifest_path)
+        return {**file_entry(path), "sha256": sha256}
+
+    def key(self, path: str) -> str:
+        """Return the manifest key of a stored file: its path under `directory`, with "/"."""
+        return os.path.relpath(path, self.directory).replace(os.sep, "/")
+
+    def load(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable upload manifest {self.manifest_path}: {e}")
+            return {}
+
+    def files(self) -> list[dict]:
+        """Return the stored files with their size, format and SHA-256."""
+        if not os.path.isdir(self.directory):
+            return []
+        manifest = self.load()
+        entries = []
+        # Files are in one folder per upload; ones stored before that are at the top level
+        for entry in self.scan(self.directory):
+            for file in self.scan(entry.path) if entry.is_dir() else [entry]:
+                if file.is_file() and Path(file.name).suffix.lower() in self.extensions:
+                    sha256 = manifest.get(self.key(file.path), {}).get("sha256")
+                    entries.append({**file_entry(file.path), "sha256": sha256})
+        return sorted(entries, key=lambda entry: (entry["name"], -entry["modified"]))
+
+    def scan(self, directory: str) -> list:
+        """Return the entries of `directory`, skipping hidden ones like `.partial/`."""
+        try:
+            with os.scandir(directory) as entries:
+                return [entry for entry in entries if not entry.name.startswith(".")]
+        except OSError:
+            return []
+
+    def prune(self):
+        """Delete unfinished uploads whose part file was not written to for `ttl` seconds."""
+        if not os.path.isdir(self.partial_directory):
+            return
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.partial_directory):
+            if not entry.name.endswith(".part"):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    self.cancel(entry.name.removesuffix(".part"))
+            except FileNotFoundError:
+                pass
+
+
+def file_entry(path: str) -> dict:
+    """Describe a data file for /list-files: name, path, size in bytes and format."""
+    stat = os.stat(path)
+    return {
+        "name": os.path.basename(path),
+        "path": path,
+        "size": stat.st_size,
+        "format": Path(path).suffix.lower().lstrip("."),
+        "modified": stat.st_mtime,
+    }
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(WRITE_BYTES):
+            sha256.update(data)
+    return sha256.hexdigest()
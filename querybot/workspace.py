@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+import duckdb
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from querybot.catalog import CatalogIndex
+from querybot.db import DB_WORKERS, CursorPool
+
+
+def default_memory_limit(workspaces: int) -> str | None:
+    """Split 80% of RAM, as DuckDB's default limit would give one database, across `workspaces`.
+
+    Worker processes (QUERYBOT_WORKERS) share the machine, so each gets its part. Returns
+    None, i.e. DuckDB's default, where the RAM size is not known.
+    """
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+    workers = max(1, int(os.getenv("QUERYBOT_WORKERS", 1)))
+    # Keep enough for small queries; larger work spills to the workspace's temp directory
+    return f"{max(256, int(total * 0.8 / workers / max(1, workspaces)) >> 20)}MB"
+
+
+def default_threads(workspaces: int) -> str:
+    """Split the cores across the workspaces that can run queries at once (up to DB_WORKERS)."""
+    cpus = os.cpu_count() or 1
+    return str(max(1, cpus // max(1, min(workspaces, DB_WORKERS))))
+
+
+# Live workspaces, how long an idle one is kept, and DuckDB limits for each one. Each
+# workspace is a separate DuckDB database with its own memory limit and thread pool;
+# unless set, these are shared out among the open workspaces as they open and close
+WORKSPACE_MAX = int(os.getenv("QUERYBOT_WORKSPACE_MAX", 64))
+WORKSPACE_TTL = float(os.getenv("QUERYBOT_WORKSPACE_TTL", 3600))
+WORKSPACE_MEMORY_LIMIT = os.getenv("QUERYBOT_WORKSPACE_MEMORY_LIMIT")
+WORKSPACE_THREADS = os.getenv("QUERYBOT_WORKSPACE_THREADS")
+WORKSPACE_TEMP_LIMIT = os.getenv("QUERYBOT_WORKSPACE_TEMP_LIMIT")
+
+# Where clients pass their session ID; browsers get the cookie set on their first request
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "querybot_session"
+# Session of API requests that send neither
+ANONYMOUS_SESSION = "anonymous"
+
+# Workspaces used this recently are never evicted, as a request may still be using them
+EVICT_GRACE = 60
+
+
+class SessionMiddleware:
+    """ASGI middleware that sets `request.state.session_id` from the session header or cookie.
+
+    Browsers loading a page without either get a new session ID, returned in a cookie.
+    Other requests without either, e.g. from scripts, share ANONYMOUS_SESSION, so that
+    /upload and then /query work without a header and one-off calls do not each create
+    a workspace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        session_id = (request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE) or "")[:128]
+        if session_id:
+            request.state.session_id = session_id
+            return await self.app(scope, receive, send)
+        if request.method != "GET" or "text/html" not in request.headers.get("accept", ""):
+            request.state.session_id = ANONYMOUS_SESSION
+            return await self.app(scope, receive, send)
+        session_id = request.state.session_id = uuid.uuid4().hex
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("set-cookie", f"{SESSION_COOKIE}={session_id}; Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+class Workspace:
+    """A session's own DuckDB database, registered datasets and catalog.
+
+    DuckDB calls run on the shared `pool` threads, but on cursors of this
+    workspace's connection, so attached databases and settings stay private.
+    """
+
+    def __init__(
+        self, session_id: str, con: duckdb.DuckDBPyConnection, pool: CursorPool, temp_directory: str | None = None
+    ):
+        self.session_id = session_id
+        self.con = con
+        self.pool = pool
+        self.temp_directory = temp_directory
+        self.datasets = {}
+        self.catalog = CatalogIndex()
+        # The shared catalog version of this session that `datasets` includes
+        self.synced_version = 0
+        self.active = 0
+        self.last_used = time.time()
+
+    async def run(self, fn, *args, request=None, timeout=None):
+        """Like CursorPool.run, on this workspace's connection."""
+        self.active += 1
+        try:
+            return await self.pool.run(fn, *args, request=request, con=self.con, timeout=timeout)
+        finally:
+            self.active -= 1
+            self.last_used = time.time()
+
+    async def stream(self, sql: str, request=None, timeout=None):
+        """Like CursorPool.stream, on this workspace's connection."""
+        self.active += 1
+        try:
+            async for chunk in self.pool.stream(sql, request=request, con=self.con, timeout=timeout):
+                yield chunk
+        finally:
+            self.active -= 1
+            self.last_used = time.time()
+
+    def close(self):
+        self.con.close()
+        if self.temp_directory:
+            shutil.rmtree(self.temp_directory, ignore_errors=True)
+
+
+class WorkspaceManager:
+    """Workspaces by session ID, evicting the least recently used idle ones.
+
+    `connect()` returns a new in-memory DuckDB connection with extensions loaded.
+    Each workspace is limited to `memory_limit` and `threads` if given, and spills
+    larger-than-memory work to its own directory under `temp_directory`. Workspaces
+    idle for `ttl` seconds, or beyond `maxsize`, are closed unless they are in use.
+    """
+
+    def __init__(
+        self,
+        connect,
+        pool: CursorPool,
+        maxsize: int = WORKSPACE_MAX,
+        ttl: float = WORKSPACE_TTL,
+        memory_limit: str | None = WORKSPACE_MEMORY_LIMIT,
+        threads: str | None = WORKSPACE_THREADS,
+        temp_directory: str | None = None,
+        temp_limit: str | None = WORKSPACE_TEMP_LIMIT,
+    ):
+        self.connect = connect
+        self.pool = pool
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        self.threads = threads
+        self.temp_directory = temp_directory
+        self.temp_limit = temp_limit
+        self.workspaces = OrderedDict()
+        self.lock = threading.Lock()
+        # Limits last applied to every workspace, when they are shared out
+        self.shares = None
+
+    def get(self, session_id: str) -> Workspace:
+        """Return the workspace for `session_id`, creating it if needed."""
+        with self.lock:
+            workspace = self.workspaces.get(session_id)
+            if workspace is not None:
+                self.workspaces.move_to_end(session_id)
+                workspace.last_used = time.time()
+                return workspace
+        con = self.connect()
+        memory_limit, threads = self.limits(len(self.workspaces) + 1)
+        if memory_limit:
+            con.execute(f"SET memory_limit = '{memory_limit}'")
+        con.execute(f"SET threads = {int(threads)}")
+        temp_directory = None
+        if self.temp_directory:
+            temp_directory = os.path.join(self.temp_directory, hashlib.sha1(session_id.encode()).hexdigest()[:16])
+            con.execute(f"SET temp_directory = '{temp_directory}'")
+        if self.temp_limit:
+            con.execute(f"SET max_temp_directory_size = '{self.temp_limit}'")
+        workspace = Workspace(session_id, con, self.pool, temp_directory)
+        with self.lock:
+            # Another request for the same session may have created it meanwhile
+            if session_id in self.workspaces:
+                con.close()
+                return self.workspaces[session_id]
+            self.workspaces[session_id] = workspace
+        self.evict()
+        self.rebalance()
+        return workspace
+
+    def limits(self, workspaces: int) -> tuple[str | None, str]:
+        """Return the memory limit and threads for each of `workspaces` open workspaces."""
+        return (
+            self.memory_limit or default_memory_limit(workspaces),
+            self.threads or default_threads(workspaces),
+        )
+
+    def rebalance(self):
+        """Share memory and cores out among the open workspaces, unless limits are set."""
+        if self.memory_limit and self.threads:
+            return
+        with self.lock:
+            workspaces = list(self.workspaces.values())
+            shares = self.limits(len(workspaces))
+            if shares == self.shares:
+                return
+            self.shares = shares
+        memory_limit, threads = shares
+        for workspace in workspaces:
+            # On a cursor of its own, as requests may be using the workspace's connection
+            try:
+                cursor = workspace.con.cursor()
+                try:
+                    if memory_limit:
+                        cursor.execute(f"SET memory_limit = '{memory_limit}'")
+                    cursor.execute(f"SET threads = {int(threads)}")
+                finally:
+                    cursor.close()
+            except duckdb.Error as e:
+                logging.warning(f"Cannot resize workspace {workspace.session_id}: {e}")
+
+    def evict(self):
+        """Close idle workspaces past their TTL, then the least recently used beyond `maxsize`."""
+        now = time.time()
+        with self.lock:
+            evicted = []
+            for session_id, workspace in list(self.workspaces.items()):
+                over = len(self.workspaces) > self.maxsize
+                if workspace.active or workspace.last_used + EVICT_GRACE > now:
+                    continue
+                if not (over or workspace.last_used + self.ttl < now):
+                    continue
+                evicted.append(self.workspaces.pop(session_id))
+        for workspace in evicted:
+            logging.info(f"Closing idle workspace {workspace.session_id}")
+            workspace.close()
+
+    def close(self):
+        with self.lock:
+            workspaces, self.workspaces = list(self.workspaces.values()), OrderedDict()
+        for workspace in workspaces:
+            workspace.close()
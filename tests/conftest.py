@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+# Keep the caches, results and catalog the app creates on import out of the user's config directory
+os.environ["XDG_CONFIG_HOME"] = tempfile.mkdtemp(prefix="querybot-tests-")
+
+import httpx
+import pytest
+
+
+class FakeLLM:
+    """Stands in for querybot.llm.LLMClient, answering each prompt with `reply(prompt)`."""
+
+    def __init__(self):
+        self.reply = lambda prompt: "SELECT 1"
+        self.prompts = []
+
+    async def post(self, base_url: str, headers: dict, payload: dict, stream: bool = False) -> httpx.Response:
+        content = self.answer(payload)
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    async def stream(self, base_url: str, headers: dict, payload: dict):
+        yield self.answer(payload)
+
+    def answer(self, payload: dict) -> str:
+        prompt = payload["messages"][-1]["content"]
+        self.prompts.append(prompt)
+        return self.reply(prompt)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch, tmp_path):
+    """Replace the app's LLM client with a FakeLLM and give it an empty LLM cache."""
+    from querybot import app as querybot_app
+    from querybot.cache import DiskCache, LRUCache, TieredCache
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_API_BASE", "http://llm.invalid/v1")
+    llm = FakeLLM()
+    monkeypatch.setattr(querybot_app, "llm", llm)
+    cache = TieredCache(LRUCache(100, ttl=60), DiskCache(str(tmp_path / "llm_cache"), ttl=60, max_bytes=10**6))
+    monkeypatch.setattr(querybot_app, "llm_cache", cache)
+    return llm
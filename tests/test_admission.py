@@ -0,0 +1,43 @@
+import asyncio
+import duckdb
+import pytest
+from querybot.admission import QueryLimiter, QueryRejected, preflight
+from querybot.db import PoolBusy
+
+CROSS_JOIN = "SELECT * FROM range(100000) a, range(100000) b"
+
+
+async def test_limiter_queues_then_rejects():
+    limiter = QueryLimiter(concurrency=1, queue=1)
+    release = asyncio.Event()
+    order = []
+
+    async def query(name: str):
+        async with limiter.slot():
+            order.append(name)
+            await release.wait()
+
+    first = asyncio.ensure_future(query("first"))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(query("second"))
+    await asyncio.sleep(0)
+    assert (limiter.running, limiter.waiting) == (1, 1)
+    with pytest.raises(PoolBusy):
+        async with limiter.slot():
+            pass
+    release.set()
+    await asyncio.gather(first, second)
+    assert order == ["first", "second"]
+    assert (limiter.running, limiter.waiting) == (0, 0)
+
+
+def test_preflight_warns_or_rejects_runaway_plans():
+    con = duckdb.connect()
+    warnings = preflight(con, CROSS_JOIN, mode="warn", max_rows=1e6)
+    assert warnings and "every row with every other row" in warnings[0]
+    with pytest.raises(QueryRejected):
+        preflight(con, CROSS_JOIN, mode="reject", max_rows=1e6)
+    assert preflight(con, "SELECT * FROM range(10)", mode="reject", max_rows=1e6) == []
+    assert preflight(con, CROSS_JOIN, mode="off", max_rows=1e6) == []
+    # Statements that cannot be explained are left for the query to report
+    assert preflight(con, "SELECT * FROM missing_table", mode="reject") == []
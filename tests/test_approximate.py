@@ -0,0 +1,83 @@
+import duckdb
+import pytest
+from querybot.approximate import approximate_sql, error_bound, stacked_aggregates
+
+SOURCE = "range(100000) t(x)"
+SAMPLE = "(SELECT * FROM range(100000) t(x) USING SAMPLE 10% (bernoulli, 42))"
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT SUM(x) / COUNT(*) FROM t", "SELECT (10.0::DOUBLE * SUM(x)) / (10.0::DOUBLE * COUNT(*)) FROM t"),
+        (
+            "SELECT SUM(CASE WHEN y = ')' THEN x END) FROM t -- SUM(x)",
+            "SELECT (10.0::DOUBLE * SUM(CASE WHEN y = ')' THEN x END)) FROM t -- SUM(x)",
+        ),
+        (
+            "SELECT COUNT(*) FILTER (WHERE x > 1), count (x) OVER w FROM t",
+            "SELECT (10.0::DOUBLE * COUNT(*) FILTER (WHERE x > 1)), (10.0::DOUBLE * count (x) OVER w) FROM t",
+        ),
+        # Aggregates nested in a scaled one are not scaled again
+        (
+            "SELECT g, SUM(COUNT(*)) OVER (PARTITION BY g) FROM t GROUP BY g",
+            "SELECT g, (10.0::DOUBLE * SUM(COUNT(*)) OVER (PARTITION BY g)) FROM t GROUP BY g",
+        ),
+        (
+            "SELECT COUNT(DISTINCT x), QUANTILE_CONT(x, 0.5), AVG(x) FROM t",
+            "SELECT approx_count_distinct(x), approx_quantile(x, 0.5), AVG(x) FROM t",
+        ),
+    ],
+)
+def test_approximate_sql(sql, expected):
+    assert approximate_sql(sql, {}, 10.0) == expected
+
+
+def test_ratios_and_averages_are_not_scaled():
+    con = duckdb.connect()
+    sql = f"SELECT COUNT(*), SUM(x), SUM(x) / COUNT(*), AVG(x), SUM(x) / SUM(1) FROM {SOURCE}"
+    exact = con.execute(sql).fetchone()
+    sample_rows = con.execute(f"SELECT COUNT(*) FROM {SAMPLE}").fetchone()[0]
+    estimate = con.execute(approximate_sql(sql, {SOURCE: SAMPLE}, 100000 / sample_rows)).fetchone()
+    bound = 2 * error_bound(sample_rows, 100000)
+    assert estimate[0] == pytest.approx(exact[0], rel=1e-9)
+    for approximate, actual in zip(estimate[1:], exact[1:]):
+        assert approximate == pytest.approx(actual, rel=bound)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"WITH s AS (SELECT x % 10 AS g, SUM(x) AS t FROM {SOURCE} GROUP BY g) SELECT SUM(t) FROM s",
+        f"SELECT COUNT(*) FROM (SELECT x % 10 AS g FROM {SOURCE} GROUP BY g)",
+        f"WITH s AS (SELECT x % 1000 AS g, COUNT(*) AS n FROM {SOURCE} GROUP BY g) SELECT COUNT(*) FROM s",
+        f"SELECT COUNT(*) FROM {SOURCE} WHERE x > (SELECT AVG(x) FROM {SOURCE})",
+    ],
+)
+def test_aggregates_of_aggregates_are_not_scaled(sql):
+    con = duckdb.connect()
+    exact = con.execute(sql).fetchone()[0]
+    # As approximate_query does, only scale when no aggregate reads another's results
+    scale = None if stacked_aggregates(sql) else 10.0
+    estimate = con.execute(approximate_sql(sql, {SOURCE: SAMPLE}, scale)).fetchone()[0]
+    assert scale is None
+    assert estimate <= exact * 1.1
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"WITH s AS (SELECT * FROM {SOURCE} WHERE x > 10) SELECT x % 10 AS g, SUM(x) FROM s GROUP BY g",
+        f"SELECT COUNT(*) FROM {SOURCE} UNION ALL SELECT 1",
+        "SELECT 'SELECT SUM(x) FROM t GROUP BY 1', SUM(x) FROM t",
+    ],
+)
+def test_aggregates_of_sampled_rows_are_scaled(sql):
+    assert not stacked_aggregates(sql)
+
+
+def test_scale_does_not_overflow_decimal_sums():
+    con = duckdb.connect()
+    sql = "SELECT SUM(CAST(x * 1e23 AS DECIMAL(38, 10))) FROM range(100) t(x)"
+    estimate = con.execute(approximate_sql(sql, {}, 10.123457)).fetchone()[0]
+    assert estimate == pytest.approx(10.123457 * 4950 * 1e23)
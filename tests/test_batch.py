@@ -0,0 +1,60 @@
+import re
+import pytest
+from fastapi.testclient import TestClient
+from querybot.app import split_batch_response
+
+QUERIES = {
+    "What is the total amount?": "SELECT SUM(amount) AS answer FROM {source}",
+    "How many regions are there?": "SELECT COUNT(DISTINCT region) AS answer FROM {source}",
+    "What is the largest amount?": "SELECT MAX(amount) AS answer FROM {source}",
+}
+# The LLM leaves this one out of batched answers
+SKIPPED = "What is the largest amount?"
+
+
+def reply(prompt: str) -> str:
+    source = re.search(r"Note: Use (.+) in queries", prompt).group(1)
+    numbered = re.findall(r"^(\d+)\. (.+)$", prompt, re.MULTILINE)
+    if not numbered:
+        question = prompt.rsplit("\n", 1)[-1]
+        return f"```sql\n{QUERIES[question].format(source=source)}\n```"
+    return "\n".join(
+        f"### Question {number}\n```sql\n{QUERIES[question].format(source=source)}\n```"
+        for number, question in numbered
+        if question != SKIPPED
+    )
+
+
+@pytest.mark.parametrize(
+    "llm_response, expected",
+    [
+        ("**Question 2**\nB\n\nQuestion 1: the total\nA", ["A", "B", None]),
+        ("```sql\nSELECT 1\n```\n```sql\nSELECT 2\n```\n```sql\nSELECT 3\n```", ["```sql\nSELECT 1\n```", "```sql\nSELECT 2\n```", "```sql\nSELECT 3\n```"]),
+        ("```sql\nSELECT 1\n```", [None, None, None]),
+    ],
+)
+def test_split_batch_response(llm_response, expected):
+    assert split_batch_response(llm_response, 3) == expected
+
+
+def test_batch_splits_questions_and_asks_skipped_ones_again(fake_llm, tmp_path):
+    from querybot.app import app
+
+    file_path = tmp_path / "sales.csv"
+    file_path.write_text("region,amount\neast,1\nwest,2\neast,7\n")
+    fake_llm.reply = reply
+    questions = list(QUERIES) + ["What is the total amount?"]
+    response = TestClient(app).post(
+        "/query/batch",
+        json={"file_path": str(file_path), "queries": questions, "batch_size": 2},
+        headers={"X-Session-ID": "batch"},
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    # Two prompts of two questions, then the skipped question alone
+    assert body["prompt"]["llm_calls"] == 3
+    assert [prompt.count("\n1. ") for prompt in fake_llm.prompts] == [1, 1, 0]
+    assert fake_llm.prompts[2].endswith(SKIPPED)
+    assert [item["query"] for item in body["results"]] == questions
+    assert [item["result"][0]["answer"] for item in body["results"]] == [10, 2, 7, 10]
+    assert body["materialized"] == ["sales"]
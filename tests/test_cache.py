@@ -0,0 +1,62 @@
+import os
+import time
+from querybot.cache import DiskCache, LRUCache, TieredCache
+
+
+def test_lru_cache_expires_and_evicts(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache = LRUCache(2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # "b" was the least recently used
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    now += 11
+    assert cache.get("a") is None and len(cache) == 1
+
+
+def test_disk_cache_expires_and_evicts(tmp_path, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache = DiskCache(str(tmp_path), ttl=10, max_bytes=10**6)
+    cache.set("a", "x" * 100)
+    assert cache.get("a") == "x" * 100
+    now += 11
+    assert cache.get("a") is None
+
+    cache = DiskCache(str(tmp_path / "small"), ttl=3600, max_bytes=1200)
+    for key in "abc":
+        cache.set(key, key * 300)
+    # "a" was read last and "b" first
+    for key, read in {"a": now - 100, "b": now - 300, "c": now - 200}.items():
+        os.utime(cache.path(key), (read, os.stat(cache.path(key)).st_mtime))
+    cache.set("d", "d" * 300)
+    # The least recently read entry went, and the rest fit in 90% of max_bytes
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a" * 300, "c" * 300, "d" * 300]
+    assert cache.size <= 1200 * 0.9
+
+def test_tiered_cache_falls_back_to_disk(tmp_path):
+    disk = DiskCache(str(tmp_path), ttl=60, max_bytes=10**6)
+    TieredCache(LRUCache(10), disk).set("key", {"sql": "SELECT 1"})
+    # A new process starts with an empty memory cache
+    memory = LRUCache(10)
+    assert TieredCache(memory, disk).get("key") == {"sql": "SELECT 1"}
+    assert memory.get("key") == {"sql": "SELECT 1"}
+
+
+async def test_llm_calls_are_cached(fake_llm):
+    from querybot.app import call_llm_system_prompt, stream_llm_system_prompt
+
+    fake_llm.reply = lambda prompt: f"SELECT '{prompt}'"
+    assert await call_llm_system_prompt("question") == "SELECT 'question'"
+    assert await call_llm_system_prompt("question") == "SELECT 'question'"
+    assert [chunk async for chunk in stream_llm_system_prompt("question")] == ["SELECT 'question'"]
+    assert fake_llm.prompts == ["question"]
+    # Other models, prompts and use_cache=False go to the LLM
+    await call_llm_system_prompt("question", model="gpt-4.1")
+    await call_llm_system_prompt("question", custom_system_prompt="Answer in SQL.")
+    await call_llm_system_prompt("question", use_cache=False)
+    assert len(fake_llm.prompts) == 4
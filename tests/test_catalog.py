@@ -0,0 +1,45 @@
+from querybot.catalog import CatalogIndex, estimate_tokens, tokenize
+
+WIDE = [(f"metric_{i}", "DOUBLE") for i in range(200)] + [("customer_region", "VARCHAR"), ("order_total", "DOUBLE")]
+
+
+def catalog() -> CatalogIndex:
+    index = CatalogIndex()
+    index.add("orders", "orders.csv", "read_csv_auto('orders.csv')", WIDE)
+    index.add("weather", "weather.csv", "read_csv_auto('weather.csv')", [("city", "VARCHAR"), ("rainfall", "DOUBLE")])
+    index.add(
+        "customers",
+        "customers.parquet",
+        "read_parquet('customers.parquet')",
+        [("customer_id", "BIGINT"), ("region", "VARCHAR")],
+        samples={"region": ["Northeast", "Pacific"]},
+    )
+    return index
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("orderTotals customer_regions HTTPCode 2024") == ["order", "total", "customer", "region", "http", "code", "2024"]
+
+
+def test_search_ranks_relevant_datasets():
+    index = catalog()
+    assert [name for name, _ in index.search("total orders by customer region", 5)][:2] == ["orders", "customers"]
+    assert [name for name, _ in index.search("Pacific customers", 5)][0] == "customers"
+    assert index.search("unrelated words", 5) == []
+
+
+def test_prompt_context_prunes_to_the_token_budget():
+    index = catalog()
+    text, stats = index.prompt_context("total by customer region", ["orders"], token_budget=200)
+    assert stats["datasets"][0] == "orders"
+    assert stats["schema_tokens"] == estimate_tokens(text)
+    assert stats["omitted_columns"] > 150
+    # Only the note about omitted columns goes over the budget
+    note = f"\n-- {stats['omitted_columns']} less relevant columns omitted"
+    assert note in text and estimate_tokens(text.replace(note, "")) <= 200
+    # The columns the question is about are kept, in table order
+    assert "[customer_region] VARCHAR,\n[order_total] DOUBLE" in text
+    assert "weather" not in text and stats["omitted_datasets"] >= 1
+
+    text, stats = index.prompt_context("total by customer region", ["orders"], token_budget=100_000)
+    assert stats["omitted_columns"] == 0 and "[metric_199] DOUBLE" in text
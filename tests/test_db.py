@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+from querybot.db import CursorPool, PoolBusy, QueryTimeout
+
+SLOW_SQL = "SELECT COUNT(*) FROM range(100000000000) a WHERE a.range % 7 = 3"
+
+
+async def test_timeout_interrupts_the_query():
+    pool = CursorPool(duckdb.connect(), workers=2, queue=0)
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        await pool.run(lambda cursor: cursor.execute(SLOW_SQL).fetchall(), timeout=0.2)
+    assert time.monotonic() - start < 10
+    # The worker is free again, and the pool still runs queries
+    assert pool.pending == 0
+    assert await pool.run(lambda cursor: cursor.execute("SELECT 42").fetchone()[0]) == 42
+    pool.close()
+
+
+async def test_full_queue_raises_pool_busy():
+    pool = CursorPool(duckdb.connect(), workers=1, queue=1)
+    release = threading.Event()
+    blocked = [asyncio.ensure_future(pool.run(lambda cursor: release.wait(5))) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    with pytest.raises(PoolBusy):
+        await pool.run(lambda cursor: None)
+    release.set()
+    assert await asyncio.gather(*blocked) == [True, True]
+    assert await pool.run(lambda cursor: "free") == "free"
+    pool.close()
+
+
+def test_busy_pool_returns_429(monkeypatch):
+    from querybot import app as querybot_app
+
+    monkeypatch.setattr(querybot_app.pool, "pending", querybot_app.pool.workers + querybot_app.pool.queue)
+    # Without `with`, so the app's shutdown does not close the pool other tests use
+    response = TestClient(querybot_app.app).post("/upload", json={"file_paths": ["missing.csv"]})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
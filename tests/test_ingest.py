@@ -0,0 +1,28 @@
+import asyncio
+import duckdb
+from querybot.app import ingestor
+
+
+async def ingest(file_path: str, casts: dict | None = None) -> dict:
+    job = ingestor.submit(file_path, casts)
+    await asyncio.gather(*ingestor.tasks)
+    return job
+
+
+async def test_reingest_with_other_casts_reads_the_source(tmp_path):
+    file_path = str(tmp_path / "orders.csv")
+    with open(file_path, "w") as f:
+        f.write("id,order_date\n1,Jan 31 2024\n2,Feb 29 2024\n")
+    assert (await ingest(file_path))["status"] == "done"
+
+    casts = {"order_date": "%b %d %Y"}
+    job = await ingest(file_path, casts)
+    assert job["status"] == "done" and job["casts"] == casts
+    assert ingestor.manifest[file_path]["casts"] == casts
+    rows = duckdb.execute(f"SELECT order_date FROM read_parquet('{job['parquet_path']}')").fetchall()
+    assert [str(row[0]) for row in rows] == ["2024-01-31", "2024-02-29"]
+
+    # Back to text: copied from the source, not from the copy with dates parsed
+    job = await ingest(file_path)
+    rows = duckdb.execute(f"SELECT order_date FROM read_parquet('{job['parquet_path']}')").fetchall()
+    assert [row[0] for row in rows] == ["Jan 31 2024", "Feb 29 2024"]
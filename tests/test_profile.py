@@ -0,0 +1,15 @@
+import duckdb
+from querybot.profile import PROFILE_DATE_SAMPLE, parse_date_sql, profile_dataset
+
+
+def test_dates_past_the_profiled_rows_fall_back_to_other_formats():
+    con = duckdb.connect()
+    con.execute(
+        "CREATE TABLE t AS SELECT strftime(DATE '2024-01-01' + INTERVAL (i % 28) DAY, '%d/%m/%Y') AS d "
+        f"FROM range({PROFILE_DATE_SAMPLE}) r(i) UNION ALL SELECT '2024-03-05' UNION ALL SELECT 'soon'"
+    )
+    fmt = profile_dataset(con, "t")["columns"]["d"]["date_format"]
+    assert fmt == "%d/%m/%Y"
+    parsed = con.execute(f"SELECT {parse_date_sql('d', fmt, 'DATE', fallback=True)} AS d FROM t").fetchall()
+    assert str(parsed[-2][0]) == "2024-03-05"
+    assert parsed[-1][0] is None
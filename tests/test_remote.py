@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import http.server
+import os
+import threading
+import pytest
+from querybot.cache import SchemaCache, file_fingerprint
+from querybot.remote import RemoteCache
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def served(tmp_path):
+    """Serve a directory over HTTP, returning (directory, base URL)."""
+    directory = tmp_path / "served"
+    directory.mkdir()
+    handler = functools.partial(QuietHandler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield directory, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def rewrite(path, text: str):
+    """Change a file's contents and move its mtime on, as http.server's Last-Modified has 1s resolution."""
+    stat = os.stat(path)
+    path.write_text(text)
+    os.utime(path, (stat.st_atime + 10, stat.st_mtime + 10))
+
+
+async def download(remote: RemoteCache, url: str) -> dict:
+    job = remote.submit(url)
+    await asyncio.gather(*remote.tasks)
+    return job
+
+
+async def test_changed_remote_file_invalidates_local_copy_and_schema(served, tmp_path):
+    directory, base = served
+    (directory / "sales.csv").write_text("id,val\n1,10\n")
+    url = f"{base}/sales.csv"
+    remote = RemoteCache(str(tmp_path / "remote"))
+    schemas = SchemaCache(str(tmp_path / "schemas.json"), maxsize=10)
+
+    fingerprint = file_fingerprint(url)
+    assert fingerprint is not None
+    job = await download(remote, url)
+    assert job["status"] == "done"
+    path = remote.lookup(url, fingerprint)
+    assert path is not None and open(path).read() == "id,val\n1,10\n"
+    schemas.set(url, fingerprint, {"schema": "CREATE TABLE sales (id BIGINT, val BIGINT);"})
+    assert schemas.get(url, fingerprint) is not None
+
+    rewrite(directory / "sales.csv", "id,val,name\n1,10,a\n")
+    changed = file_fingerprint(url)
+    assert changed is not None and changed != fingerprint
+    assert remote.lookup(url, changed) is None
+    assert schemas.get(url, changed) is None
+
+    await download(remote, url)
+    path = remote.lookup(url, changed)
+    assert path is not None and open(path).read() == "id,val,name\n1,10,a\n"
+
+
+async def test_least_recently_used_copies_are_evicted(served, tmp_path):
+    directory, base = served
+    (directory / "a.csv").write_text("x\n" + "1\n" * 50)
+    (directory / "b.csv").write_text("x\n" + "2\n" * 50)
+    remote = RemoteCache(str(tmp_path / "remote"), max_bytes=150)
+
+    for name in ("a.csv", "b.csv"):
+        assert (await download(remote, f"{base}/{name}"))["status"] == "done"
+    assert f"{base}/a.csv" not in remote.manifest
+    assert remote.lookup(f"{base}/b.csv", file_fingerprint(f"{base}/b.csv")) is not None
+    assert len(os.listdir(tmp_path / "remote")) == 2  # b.csv's copy and the manifest
+
+
+async def test_files_too_large_for_the_cache_do_not_evict_others(served, tmp_path):
+    directory, base = served
+    (directory / "small.csv").write_text("x\n" + "1\n" * 50)
+    (directory / "large.csv").write_text("x\n" + "2\n" * 500)
+    remote = RemoteCache(str(tmp_path / "remote"), max_bytes=150)
+
+    assert (await download(remote, f"{base}/small.csv"))["status"] == "done"
+    job = await download(remote, f"{base}/large.csv")
+    assert job["status"] == "error" and "QUERYBOT_REMOTE_CACHE_BYTES" in job["error"]
+    assert list(remote.manifest) == [f"{base}/small.csv"]
+    assert os.path.exists(remote.manifest[f"{base}/small.csv"]["path"])
+    assert len(os.listdir(tmp_path / "remote")) == 2  # small.csv's copy and the manifest
@@ -0,0 +1,53 @@
+import duckdb
+import pytest
+from querybot.app import execute_paged, extract_sql_query, result_cache_key
+from querybot.results import RESULT_MAX_ROWS, ResultStore
+
+
+def test_extract_sql_query_drops_trailing_semicolons():
+    assert extract_sql_query("```sql\nSELECT * FROM range(30000);\n```") == "SELECT * FROM range(30000)"
+    assert extract_sql_query("```sql\nSELECT 1 ;; \n```") == "SELECT 1"
+
+
+@pytest.mark.parametrize(
+    "sql",
+    ["SELECT * FROM range(30000);", "SELECT * FROM range(30000) -- every row", "SELECT * FROM range(30000);\n"],
+)
+def test_spill_wraps_any_statement_ending(tmp_path, sql):
+    store = ResultStore(str(tmp_path))
+    result_id, row_count = store.spill(duckdb.connect(), sql)
+    assert row_count == 30000
+    page, total = store.page(duckdb.connect(), result_id, 29990, 100)
+    assert total == 30000 and len(page) == 10
+
+
+def test_semicolon_terminated_query_is_paged():
+    result, row_count, result_id, _, _ = execute_paged(
+        duckdb.connect(), "SELECT * FROM range(30000);", {}, use_cache=False
+    )
+    assert result_id is not None
+    assert row_count == 30000
+    assert len(result) == min(RESULT_MAX_ROWS, 30000)
+
+
+def test_result_cache_hits_until_the_file_changes(tmp_path):
+    file_path = tmp_path / "sales.csv"
+    file_path.write_text("region,amount\neast,1\nwest,2\n")
+    sql = f"SELECT SUM(amount) AS total FROM read_csv_auto('{file_path}')"
+    con = duckdb.connect()
+    result, _, _, status, _ = execute_paged(con, sql, {})
+    assert (status, result["total"].tolist()) == ("miss", [3])
+    # Normalized SQL shares the entry
+    result, _, _, status, _ = execute_paged(con, sql.replace(" FROM", "\n  FROM") + ";", {})
+    assert (status, result["total"].tolist()) == ("hit", [3])
+
+    file_path.write_text("region,amount\neast,1\nwest,2\nnorth,40\n")
+    result, _, _, status, _ = execute_paged(con, sql, {})
+    assert (status, result["total"].tolist()) == ("miss", [43])
+    assert execute_paged(con, sql, {})[3] == "hit"
+
+
+def test_volatile_and_unfingerprinted_queries_are_not_cached(tmp_path):
+    con = duckdb.connect()
+    assert execute_paged(con, "SELECT random() AS r", {})[3] is None
+    assert result_cache_key(f"SELECT * FROM read_csv_auto('{tmp_path / 'missing.csv'}')", {}) is None
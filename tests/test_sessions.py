@@ -0,0 +1,104 @@
+import duckdb
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from querybot.shared_catalog import SharedCatalog
+from querybot import workspace
+from querybot.workspace import ANONYMOUS_SESSION, SESSION_COOKIE, SessionMiddleware, WorkspaceManager
+
+app = FastAPI()
+app.add_middleware(SessionMiddleware)
+
+
+@app.get("/")
+@app.post("/query")
+async def session(request: Request):
+    return {"session_id": request.state.session_id}
+
+
+def test_api_requests_without_a_session_share_one():
+    client = TestClient(app)
+    first = client.post("/query").json()["session_id"]
+    second = client.post("/query").json()["session_id"]
+    assert first == second == ANONYMOUS_SESSION
+    assert SESSION_COOKIE not in client.cookies
+
+
+def test_page_loads_get_their_own_session_cookie():
+    client = TestClient(app)
+    response = client.get("/", headers={"Accept": "text/html"})
+    session_id = response.json()["session_id"]
+    assert session_id != ANONYMOUS_SESSION
+    assert client.cookies[SESSION_COOKIE] == session_id
+    assert client.post("/query").json()["session_id"] == session_id
+
+
+def test_header_overrides_cookie():
+    client = TestClient(app)
+    assert client.post("/query", headers={"X-Session-ID": "abc"}).json()["session_id"] == "abc"
+
+
+def test_removing_an_unknown_dataset_stores_nothing(tmp_path):
+    catalog = SharedCatalog(str(tmp_path / "catalog.sqlite"))
+    assert catalog.remove("s1", "missing") == 0
+    assert catalog.connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+    version = catalog.put("s1", "sales", "sales.csv", "stat:1:2", {"read_function": "x"})
+    assert catalog.remove("s1", "missing") == version
+    assert catalog.remove("s1", "sales") == version + 1
+
+
+def test_workspaces_share_memory_and_cores_as_they_open(monkeypatch):
+    monkeypatch.setattr(workspace, "DB_WORKERS", 4)
+    monkeypatch.setattr(workspace.os, "cpu_count", lambda: 8)
+    manager = WorkspaceManager(duckdb.connect, pool=None, memory_limit=None, threads=None)
+
+    def settings(session_id):
+        con = manager.get(session_id).con
+        return con.execute(
+            "SELECT current_setting('memory_limit'), current_setting('threads')"
+        ).fetchone()
+
+    try:
+        alone = settings("a")
+        assert alone[1] == 8
+        settings("b")
+        shared = settings("a")
+        assert shared[1] == 4
+        assert shared[0] != alone[0]
+        fixed = WorkspaceManager(duckdb.connect, pool=None, memory_limit="300MB", threads="3")
+        con = fixed.get("a").con
+        assert con.execute("SELECT current_setting('threads')").fetchone()[0] == 3
+        fixed.close()
+    finally:
+        manager.close()
+
+
+async def test_workers_pick_up_each_others_datasets(tmp_path):
+    from querybot.app import connect_duckdb, pool, register_files, sync_workspace, unshare_dataset
+
+    file_path = tmp_path / "sales.csv"
+    file_path.write_text("region,amount\neast,1\nwest,2\n")
+    # Each worker process has its own workspaces, sharing only the catalog
+    first, second = (WorkspaceManager(connect_duckdb, pool) for _ in range(2))
+    try:
+        mine, theirs = first.get("sync"), second.get("sync")
+        assert await register_files(mine, str(file_path), None) == ["sales"]
+
+        await sync_workspace(theirs, None)
+        assert theirs.synced_version == mine.synced_version
+        assert theirs.catalog.get("sales")["columns"] == mine.catalog.get("sales")["columns"]
+        read_function = theirs.datasets["sales"]["read_function"]
+        assert theirs.con.execute(f"SELECT SUM(amount) FROM {read_function}").fetchone()[0] == 3
+
+        # Datasets whose file changed since are described again when next queried
+        await unshare_dataset(mine, "sales")
+        await sync_workspace(theirs, None)
+        assert "sales" not in theirs.datasets and "sales" not in theirs.catalog
+        file_path.write_text("region,amount\neast,1\nwest,2\nnorth,3\n")
+        assert await register_files(mine, str(file_path), None) == ["sales"]
+        file_path.write_text("region,amount\neast,1\n")
+        await sync_workspace(theirs, None)
+        assert "sales" not in theirs.datasets
+        assert theirs.synced_version == mine.synced_version
+    finally:
+        first.close()
+        second.close()
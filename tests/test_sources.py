@@ -0,0 +1,12 @@
+from querybot.sources import is_multi_file
+
+
+def test_is_multi_file(tmp_path):
+    (tmp_path / "sales[2023].csv").write_text("x\n1\n")
+    (tmp_path / "events").mkdir()
+    assert not is_multi_file(str(tmp_path / "sales[2023].csv"))
+    assert not is_multi_file(str(tmp_path / "sales.csv"))
+    assert is_multi_file(str(tmp_path / "sales[0-9].csv"))
+    assert is_multi_file(str(tmp_path / "events" / "*.parquet"))
+    assert is_multi_file(str(tmp_path / "events"))
+    assert not is_multi_file("https://example.com/data.csv?version=2")
@@ -0,0 +1,41 @@
+import pytest
+from querybot.sql import column_trie, quote_columns
+
+TRIES = [column_trie(("Transaction Type", "Transaction", "Unit Price ($)", "id", "name"))]
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        # Names with spaces or symbols are quoted, others left alone
+        (
+            "SELECT Transaction Type, SUM(Unit Price ($)) FROM t GROUP BY Transaction Type",
+            'SELECT "Transaction Type", SUM("Unit Price ($)") FROM t GROUP BY "Transaction Type"',
+        ),
+        ("SELECT id, name, Transaction FROM t", "SELECT id, name, Transaction FROM t"),
+        # The longest name at a word boundary wins, and names inside other words are not matched
+        ("SELECT Transaction Types FROM t", "SELECT Transaction Types FROM t"),
+        ("SELECT identity FROM t", "SELECT identity FROM t"),
+        # [Bracketed] names from the prompt's schema become quoted identifiers
+        ("SELECT [Transaction Type], [id] FROM t", 'SELECT "Transaction Type", "id" FROM t'),
+        ("SELECT [unknown] FROM t", "SELECT [unknown] FROM t"),
+        # String literals, quoted identifiers and comments are left alone
+        (
+            "SELECT 'Transaction Type' AS \"Transaction Type\" FROM t -- Transaction Type",
+            "SELECT 'Transaction Type' AS \"Transaction Type\" FROM t -- Transaction Type",
+        ),
+        (
+            "SELECT /* Unit Price ($) */ Unit Price ($) FROM t WHERE name = 'it''s Transaction Type'",
+            "SELECT /* Unit Price ($) */ \"Unit Price ($)\" FROM t WHERE name = 'it''s Transaction Type'",
+        ),
+    ],
+)
+def test_quote_columns(sql, expected):
+    assert quote_columns(sql, TRIES) == expected
+
+
+def test_quote_columns_across_datasets():
+    tries = [column_trie(("Order Date",)), column_trie(("Ship Date",)), column_trie(())]
+    sql = "SELECT a.Order Date, b.Ship Date FROM a JOIN b USING (id)"
+    assert quote_columns(sql, tries) == 'SELECT a."Order Date", b."Ship Date" FROM a JOIN b USING (id)'
+    assert quote_columns(sql, [column_trie(())]) == sql
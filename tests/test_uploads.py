@@ -0,0 +1,32 @@
+import hashlib
+from querybot.uploads import UploadStore
+
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def multipart(filename: str, data: bytes) -> tuple[str, bytes]:
+    boundary = "b0undary"
+    content = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: text/csv\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return f"multipart/form-data; boundary={boundary}", content
+
+
+async def test_same_name_uploads_are_kept_apart(tmp_path):
+    store = UploadStore(str(tmp_path), {".csv"})
+    content_type, content = multipart("sales.csv", b"x\n1\n")
+    first = (await store.receive_multipart(content_type, body(content)))[0]
+    upload = store.create("sales.csv", 4, hashlib.sha256(b"x\n2\n").hexdigest())
+    upload = await store.append(upload["upload_id"], 0, body(b"x\n", b"2\n"))
+    second = upload["file"]
+
+    assert first["path"] != second["path"]
+    assert open(first["path"], "rb").read() == b"x\n1\n"
+    assert open(second["path"], "rb").read() == b"x\n2\n"
+    files = store.files()
+    assert [file["name"] for file in files] == ["sales.csv", "sales.csv"]
+    assert {file["sha256"] for file in files} == {first["sha256"], second["sha256"]}